@@ -1,21 +1,370 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, abort, g, Response, stream_with_context, url_for
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SecureCookieSessionInterface
 import json
+import math
 import os
 import random
 import datetime
-from utils.graph import create_planar_graph, is_valid_coloring
-from utils.game_state import GameState
+import threading
+import functools
+import time
+import numpy as np
+from utils.graph import create_planar_graph, is_valid_coloring, find_conflicts
+from utils.codec import unpack_colors
+from utils.game_state import GameState, UNCOLORED, MOVE_STALE, color_palette
+from utils.hints import MOVE, UNDO
+from utils.puzzle import GenerationError, Puzzle, generate_puzzle
+from utils.chromatic import chromatic_number
+from utils.puzzle_pool import PuzzlePool
+from utils.puzzle_cache import create_puzzle_cache, puzzle_key
+from utils.puzzle_bank import create_puzzle_bank
+from utils.store import create_store
+from utils.stats import create_game_stats, LEADERBOARD_SIZE
+from utils.metrics import metrics, create_profiler
+from utils.offload import create_offloader, OffloadError, Overloaded
+from utils.portfolio import create_portfolio
+from utils.broadcast import BroadcastHub, format_event
+from utils.payload import Payload, PayloadCache, ETAG_SUFFIXES
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that reports encoding time as the json_encode phase"""
+    
+    def dumps(self, obj, **kwargs):
+        with metrics.phase('json_encode'):
+            return super().dumps(obj, **kwargs)
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions with decoding and encoding timed as phases"""
+    
+    def open_session(self, app, request):
+        with metrics.phase('session_load'):
+            return super().open_session(app, request)
+    
+    def save_session(self, app, session, response):
+        with metrics.phase('session_save'):
+            return super().save_session(app, session, response)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
+app.json = TimedJSONProvider(app)
+app.session_interface = TimedSessionInterface()
+# For session management; set SECRET_KEY so several workers accept the same cookie
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
+
+# Sampled cProfile profiles of live requests (off unless PROFILE_DIR and PROFILE_SAMPLE_RATE are set)
+request_profiler = create_profiler()
+
+# Server-side game storage; the session cookie only carries the game ID
+game_store = create_store()
+
+# Finished games, buffered and written to SQLite in the background
+game_stats = create_game_stats()
+
+# Shared boards: moves are broadcast to everyone watching a board over
+# Server-Sent Events (/events/<board_id>). A watcher more than
+# SSE_QUEUE_SIZE messages behind is dropped and reconnects for a snapshot
+board_hub = BroadcastHub(max_queue=int(os.environ.get('SSE_QUEUE_SIZE', 256)))
+SSE_KEEPALIVE = float(os.environ.get('SSE_KEEPALIVE', 15))
+# Each stream the Flask route serves holds a server thread for as long as
+# it is open, so only SSE_MAX_STREAMS may be open per process at once and
+# the other threads stay free for moves (asgi.py isn't limited)
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+event_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
 
 # Game difficulty levels
 DIFFICULTY_LEVELS = {
     'easy': {'nodes': 10, 'colors': 4},
     'medium': {'nodes': 15, 'colors': 4},
-    'hard': {'nodes': 20, 'colors': 4}
+    'hard': {'nodes': 20, 'colors': 4},
+    # Large maps are drawn a viewport at a time (see /viewport) and aren't
+    # pooled. They are always Voronoi maps: nearest-neighbor "random" maps
+    # stop being planar, and almost never 4-colorable, at this size
+    'huge': {'nodes': int(os.environ.get('LARGE_MAP_NODES', 20000)), 'colors': 4,
+             'large': True, 'map_type': 'voronoi'}
 }
 
+# Most nodes one /viewport response carries, and nodes per NDJSON line
+VIEWPORT_MAX_NODES = int(os.environ.get('VIEWPORT_MAX_NODES', 5000))
+VIEWPORT_CHUNK = 500
+
+MAP_TYPES = ('random', 'grid', 'voronoi')
+
+# Largest board a seeded request may ask for with "nodes"
+SEEDED_MAX_NODES = int(os.environ.get('SEEDED_MAX_NODES', 1000))
+
+# Most boards one /verify request may check, and conflicting edges listed per board
+VERIFY_MAX_BOARDS = int(os.environ.get('VERIFY_MAX_BOARDS', 256))
+VERIFY_MAX_CONFLICTS = 100
+
+# Latency budget for a single hint, in seconds
+HINT_BUDGET = float(os.environ.get('HINT_BUDGET', 0.05))
+
+# Generation and solving run in a bounded process pool, away from request threads
+offloader = create_offloader()
+
+# Optional solver portfolio (SOLVER_PORTFOLIO_WORKERS). Boards of at least
+# PORTFOLIO_MIN_NODES regions are solved by racing strategies in its own
+# pool; smaller ones solve in milliseconds and stay in the offloader
+solver_portfolio = create_portfolio()
+PORTFOLIO_MIN_NODES = int(os.environ.get('PORTFOLIO_MIN_NODES', 5000))
+
+def offload_puzzle(num_nodes, map_type, num_colors, seed=None, wait=False):
+    """
+    Generate a puzzle in the process pool, or for large random boards with
+    the solver portfolio enabled, build the map in the process pool and
+    race the solvers in the portfolio's. Either way the job holds one of the
+    pool's slots, so its queue limit applies.
+    
+    Args:
+        wait: Wait for a free slot instead of failing with Overloaded
+    """
+    # The portfolio's race depends on timing, so seeded boards, which must
+    # come out the same every time, always use the default solver
+    if solver_portfolio is not None and seed is None and num_nodes >= PORTFOLIO_MIN_NODES:
+        def solve(graph, num_colors, seed):
+            return solver_portfolio.solve(graph, num_colors, map_type, seed=seed).coloring
+        
+        with offloader.reserve(wait=wait) as run, metrics.phase('generate_portfolio'):
+            return generate_puzzle(num_nodes, map_type, num_colors, seed=seed, solve=solve,
+                                   build=functools.partial(run, create_planar_graph))
+    
+    with metrics.phase('generate_offloaded'):
+        return offloader.run(generate_puzzle, num_nodes, map_type, num_colors, seed=seed, wait=wait)
+
+def make_puzzle(difficulty, map_type, wait=True):
+    """
+    Generate a puzzle for a difficulty level and map type, with its
+    /new_game response (standard mode) prebuilt
+    """
+    params = DIFFICULTY_LEVELS[difficulty]
+    puzzle = offload_puzzle(params['nodes'], map_type, params['colors'], wait=wait)
+    key = puzzle_key(map_type, puzzle.graph.num_nodes, puzzle.seed, puzzle.num_colors)
+    puzzle.payload = build_new_game_payload(
+        (key, params.get('large', False), puzzle.num_colors, NEW_GAME_MESSAGE.format(difficulty=difficulty)),
+        puzzle
+    )
+    return puzzle
+
+# Pre-generated puzzles, refilled in the background between the watermarks. The
+# refill thread waits for the process pool; a request that misses doesn't
+puzzle_pool = PuzzlePool(
+    make_puzzle,
+    [(difficulty, map_type) for difficulty, params in DIFFICULTY_LEVELS.items()
+     if not params.get('large') for map_type in MAP_TYPES],
+    low=int(os.environ.get('PUZZLE_POOL_LOW', 2)),
+    high=int(os.environ.get('PUZZLE_POOL_HIGH', 8)),
+    on_miss=functools.partial(make_puzzle, wait=False)
+)
+
+# Encoded and compressed /new_game and /puzzle bodies of boards served
+# more than once (seeded, daily and puzzle bank boards); pool puzzles
+# carry their own, built at generation
+payload_cache = PayloadCache(max_items=int(os.environ.get('PAYLOAD_CACHE_SIZE', 256)))
+
+# Seeded puzzles (shared links, daily puzzles), kept in memory and on disk
+puzzle_cache = create_puzzle_cache(generate=offload_puzzle)
+
+# Optional pre-graded puzzles (PUZZLE_BANK). Where the bank has boards of a
+# difficulty and map type, random games come from it instead of the pool,
+# graded by solver effort rather than by node count
+puzzle_bank = create_puzzle_bank()
+
+def request_seed(data):
+    """
+    The puzzle seed a request asks for: an explicit "seed", today's date
+    for "daily", or None for a random board
+    """
+    if data.get('daily'):
+        return int(datetime.date.today().strftime('%Y%m%d'))
+    seed = data.get('seed')
+    if seed is None or seed == '':
+        return None
+    try:
+        seed = int(seed)
+    except (TypeError, ValueError):
+        abort(400, description='Invalid seed')
+    if not 0 <= seed < 2 ** 63:
+        abort(400, description='Invalid seed')
+    return seed
+
+def request_nodes(data):
+    """
+    The region count a seeded request asks for, or None for the level's
+    default. Boards from the puzzle bank vary in size, so reproducing one
+    takes its node count as well as its seed.
+    """
+    nodes = data.get('nodes')
+    if nodes is None or nodes == '':
+        return None
+    try:
+        nodes = int(nodes)
+    except (TypeError, ValueError):
+        abort(400, description='Invalid node count')
+    if not 1 <= nodes <= SEEDED_MAX_NODES:
+        abort(400, description='Invalid node count')
+    return nodes
+
+def get_puzzle(difficulty, map_type, seed, num_nodes=None):
+    """
+    A seeded puzzle from the cache, or a random one from the puzzle bank or
+    the pool; returns (puzzle, key)
+    """
+    params = DIFFICULTY_LEVELS[difficulty]
+    if seed is not None:
+        return puzzle_cache.get(map_type, num_nodes or params['nodes'], seed, params['colors'])
+    
+    if puzzle_bank is not None and puzzle_bank.has(difficulty, map_type):
+        puzzle = puzzle_bank.sample(difficulty, map_type)
+    else:
+        puzzle = puzzle_pool.get(difficulty, map_type)
+    return puzzle, puzzle_key(map_type, puzzle.graph.num_nodes, puzzle.seed, puzzle.num_colors)
+
+def board_payload(puzzle, key, large=False):
+    """The parts of a puzzle the frontend draws; large maps only send their bounds"""
+    if large:
+        lo, hi = puzzle.positions.min(axis=0).tolist(), puzzle.positions.max(axis=0).tolist()
+        return {
+            'large': True,
+            'num_nodes': puzzle.graph.num_nodes,
+            'min_colors': puzzle.min_colors,
+            'bounds': {'xmin': lo[0], 'ymin': lo[1], 'xmax': hi[0], 'ymax': hi[1]},
+            'seed': puzzle.seed,
+            'puzzle_key': key
+        }
+    
+    # Convert node positions to a format suitable for frontend
+    node_positions = {str(node): {'x': x, 'y': y} for node, (x, y) in enumerate(puzzle.positions.tolist())}
+    
+    # Create a list of edges for the frontend
+    edges = [{'source': str(u), 'target': str(v)} for u, v in puzzle.graph.edges()]
+    
+    return {
+        'nodes': [{'id': str(node)} for node in puzzle.graph.nodes()],
+        'edges': edges,
+        'positions': node_positions,
+        'num_nodes': puzzle.graph.num_nodes,
+        'min_colors': puzzle.min_colors,
+        'seed': puzzle.seed,
+        'puzzle_key': key
+    }
+
+# The usual /new_game message (other modes say more)
+NEW_GAME_MESSAGE = 'New {difficulty} game started. Color the regions!'
+
+def build_new_game_payload(variant, puzzle):
+    """
+    Encode and compress a /new_game response body.
+    
+    Args:
+        variant: (puzzle key, large, number of colors, message), which
+            together fix the body
+        puzzle: The board
+    """
+    key, large, num_colors, message = variant
+    with metrics.phase('payload_build'):
+        return Payload(variant, {
+            **board_payload(puzzle, key, large),
+            'available_colors': color_palette(num_colors),
+            'message': message,
+            'game_complete': False
+        })
+
+def new_game_payload(puzzle, key, large, num_colors, message):
+    """The /new_game body for a board: prebuilt with the puzzle, cached, or built now"""
+    variant = (key, large, num_colors, message)
+    if puzzle.payload is not None and puzzle.payload.key == variant:
+        return puzzle.payload
+    return payload_cache.get(variant, lambda variant: build_new_game_payload(variant, puzzle))
+
+def payload_response(payload):
+    """
+    Serve a payload as is, compressed if the client accepts it. GET
+    requests whose If-None-Match has the representation get a 304.
+    """
+    encoding, body, etag = payload.representation(request.accept_encodings)
+    if request.method == 'GET' and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+metrics.gauge('puzzle_pool_size', 'Ready puzzles per pool', ('difficulty', 'map_type'),
+              lambda: [((pool['difficulty'], pool['map_type']), pool['size'])
+                       for pool in puzzle_pool.stats()['pools']])
+
+def board_locked(view):
+    """
+    Run a view that changes the session's board under that board's lock, so
+    the load, change and save of players sharing it don't interleave
+    """
+    @functools.wraps(view)
+    def locked(*args, **kwargs):
+        with board_hub.lock(session.get('game_id')):
+            return view(*args, **kwargs)
+    return locked
+
+def load_game_state():
+    """Load the current session's game state from the store (or None)"""
+    with metrics.phase('state_load'):
+        return game_store.get(session.get('game_id'))
+
+def save_game_state(game_state):
+    """Save the game state to the store under the session's game ID"""
+    game_id = session.get('game_id')
+    if not game_id:
+        game_id = game_store.new_id()
+        session['game_id'] = game_id
+    with metrics.phase('state_save'):
+        game_store.put(game_id, game_state)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profiler = request_profiler.start()
+
+@app.after_request
+def remember_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_time(exception=None):
+    """Observe the request latency, including the session cookie, once the response is done"""
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    
+    # Use the route pattern, not the raw path, to keep the number of series bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.pop('status', 500 if exception else 200)
+    metrics.requests.observe(seconds, route, request.method, str(status))
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        request_profiler.finish(profiler, route, seconds)
+
+@app.errorhandler(OffloadError)
+def generation_unavailable(error):
+    """Generation is overloaded or too slow; ask the client to retry shortly"""
+    message = 'The server is busy generating maps' if isinstance(error, Overloaded) else 'Map generation timed out'
+    response = jsonify({'error': f'{message}. Please try again.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.errorhandler(GenerationError)
+def generation_failed(error):
+    """
+    No colorable board came out of the seed's attempts. Large random maps
+    are often not 4-colorable, so this is down to the request, not the server
+    """
+    return jsonify({'error': f'{error}. Try another seed, fewer regions or another map type.'}), 400
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -23,127 +372,679 @@ def index():
 
 @app.route('/new_game', methods=['POST'])
 def new_game():
-    difficulty = request.json.get('difficulty', 'medium')
-    map_type = request.json.get('map_type', 'random')
+    data = request.json or {}
+    difficulty = data.get('difficulty', 'medium')
+    map_type = data.get('map_type', 'random')
+    
+    # Fall back to defaults for unknown parameters
+    if difficulty not in DIFFICULTY_LEVELS:
+        difficulty = 'medium'
+    if map_type not in MAP_TYPES:
+        map_type = 'random'
+    map_type = DIFFICULTY_LEVELS[difficulty].get('map_type', map_type)
     
-    # Get parameters based on difficulty
-    params = DIFFICULTY_LEVELS.get(difficulty, DIFFICULTY_LEVELS['medium'])
+    # Seeded boards come from the cache, others from the bank or the pool
+    puzzle, key = get_puzzle(difficulty, map_type, request_seed(data), request_nodes(data))
     
-    # Create a new graph
-    graph, positions = create_planar_graph(params['nodes'], map_type)
+    large = DIFFICULTY_LEVELS[difficulty].get('large', False)
+    num_colors, solution = puzzle.num_colors, puzzle.solution
+    message = NEW_GAME_MESSAGE.format(difficulty=difficulty)
+    
+    # In fewest-colors mode the palette shrinks to the map's chromatic number
+    if data.get('mode') == 'min_colors':
+        if large or puzzle.min_colors is None:
+            message = f'New {difficulty} game started. The fewest colors for this map are unknown, so you have {num_colors}.'
+        elif puzzle.min_colors < num_colors:
+            # The hint solver needs a coloring that fits. Generation keeps one;
+            # bank boards and older cache files only know the number
+            if puzzle.min_coloring is None:
+                with metrics.phase('chromatic_offloaded'):
+                    result = offloader.run(chromatic_number, puzzle.graph)
+                if result.number == puzzle.min_colors:
+                    puzzle.min_coloring = result.coloring
+            if puzzle.min_coloring is not None:
+                num_colors, solution = puzzle.min_colors, puzzle.min_coloring
+            message = f'New {difficulty} game started. Color the regions with {num_colors} colors!'
+        else:
+            message = f'New {difficulty} game started. This map needs all {num_colors} colors!'
     
     # Create game state
-    game_state = GameState(graph, params['colors'])
+    game_state = GameState(puzzle.graph, num_colors, solution=solution,
+                           positions=puzzle.positions, min_colors=puzzle.min_colors)
     
     # Set start time
     game_state.start_time = datetime.datetime.now()
     
-    # Convert node positions to a format suitable for frontend
-    node_positions = {str(node): {'x': pos[0], 'y': pos[1]} for node, pos in positions.items()}
-    
-    # Create a list of edges for the frontend
-    edges = [{'source': str(u), 'target': str(v)} for u, v in graph.edges()]
-    
-    # Save game state in session
-    session['game_state'] = game_state.to_json()
+    # Save game state in the store under a fresh game ID
+    # (a shared board stays for the other players until it expires)
+    old_game_id = session.pop('game_id', None)
+    if old_game_id and not session.pop('shared', False):
+        game_store.delete(old_game_id)
+    save_game_state(game_state)
     session['difficulty'] = difficulty
     session['map_type'] = map_type
     
-    return jsonify({
-        'nodes': [{'id': str(node)} for node in graph.nodes()],
-        'edges': edges,
-        'positions': node_positions,
-        'available_colors': game_state.available_colors,
-        'message': f'New {difficulty} game started. Color the regions!',
-        'game_complete': False
-    })
+    # Sent as encoded (and compressed) once for this board and message
+    return payload_response(new_game_payload(puzzle, key, large, num_colors, message))
+
+@app.route('/puzzle', methods=['GET'])
+def puzzle():
+    """
+    The board for a seed, without starting a game (for shared links and
+    previews). The puzzle key is the ETag, so repeat requests get a 304
+    without the puzzle being looked up; the body is encoded once per process.
+    """
+    difficulty = request.args.get('difficulty', 'medium')
+    map_type = request.args.get('map_type', 'random')
+    if difficulty not in DIFFICULTY_LEVELS or map_type not in MAP_TYPES:
+        return jsonify({'error': 'Unknown difficulty or map type'}), 400
+    
+    seed = request_seed(request.args)
+    if seed is None:
+        return jsonify({'error': 'A seed is required'}), 400
+    
+    params = DIFFICULTY_LEVELS[difficulty]
+    map_type = params.get('map_type', map_type)
+    num_nodes = request_nodes(request.args)
+    key = puzzle_key(map_type, num_nodes or params['nodes'], seed, params['colors'])
+    for etag in (key + suffix for suffix in ETAG_SUFFIXES.values()):
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            return response
+    
+    large = params.get('large', False)
+    
+    def build(variant):
+        board, key = get_puzzle(difficulty, map_type, seed, num_nodes)
+        with metrics.phase('payload_build'):
+            return Payload(variant, board_payload(board, key, large), etag=key)
+    
+    return payload_response(payload_cache.get(('puzzle', key, large), build))
+
+@app.route('/viewport', methods=['GET'])
+def viewport():
+    """
+    Stream the nodes and edges inside a bounding box as NDJSON.
+    
+    Query parameters xmin, ymin, xmax, ymax give the box in map coordinates.
+    The first line is a header; then come lines of up to VIEWPORT_CHUNK
+    nodes ([id, x, y, color], color null if uncolored) and the edges
+    touching them ([source, target, target x, target y]). Past
+    VIEWPORT_MAX_NODES nodes the box is thinned evenly, edges are left out
+    and the header says so.
+    """
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    if game_state.positions is None:
+        return jsonify({'error': 'This game has no node positions'}), 400
+    
+    try:
+        box = [float(request.args[name]) for name in ('xmin', 'ymin', 'xmax', 'ymax')]
+    except (KeyError, ValueError):
+        return jsonify({'error': 'xmin, ymin, xmax and ymax are required'}), 400
+    if not all(math.isfinite(bound) for bound in box):
+        return jsonify({'error': 'xmin, ymin, xmax and ymax must be finite numbers'}), 400
+    
+    nodes = game_state.spatial_index().query(*box)
+    total = len(nodes)
+    thinned = total > VIEWPORT_MAX_NODES
+    if thinned:
+        nodes = nodes[::-(-total // VIEWPORT_MAX_NODES)]
+    
+    def generate():
+        yield json.dumps({
+            'type': 'header',
+            'version': game_state.version,
+            'nodes': len(nodes),
+            'total': total,
+            'thinned': thinned
+        }) + '\n'
+        
+        graph = game_state.graph
+        # Stored states keep float32 positions; rounding keeps the JSON short
+        positions = np.asarray(game_state.positions, dtype=np.float64)
+        colors = game_state.node_colors
+        inside = np.zeros(graph.num_nodes, dtype=bool)
+        inside[nodes] = True
+        
+        for start in range(0, len(nodes), VIEWPORT_CHUNK):
+            chunk = nodes[start:start + VIEWPORT_CHUNK]
+            xs, ys = positions[chunk].round(6).T.tolist()
+            chunk_colors = colors[chunk].tolist()
+            yield json.dumps({'type': 'nodes', 'data': [
+                [node, x, y, color if color >= 0 else None]
+                for node, x, y, color in zip(chunk.tolist(), xs, ys, chunk_colors)
+            ]}) + '\n'
+            if thinned:
+                continue
+            
+            # Gather the chunk's CSR neighbor slices in one go
+            starts = graph.indptr[chunk]
+            degrees = graph.indptr[chunk + 1] - starts
+            offsets = np.arange(degrees.sum()) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+            sources = np.repeat(chunk, degrees)
+            targets = graph.indices[np.repeat(starts, degrees) + offsets]
+            
+            # Each edge once: from its smaller end if both ends are inside.
+            # The target's position comes along, since it may be off screen
+            keep = ~inside[targets] | (sources < targets)
+            sources, targets = sources[keep], targets[keep]
+            target_xs, target_ys = positions[targets].round(6).T.tolist()
+            yield json.dumps({'type': 'edges', 'data': [
+                [u, v, x, y] for u, v, x, y in zip(sources.tolist(), targets.tolist(),
+                                                    target_xs, target_ys)
+            ]}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/state', methods=['GET'])
+def state():
+    """
+    The game state in the binary format of GameState.to_bytes(), for
+    clients that keep their own copy of the board. The solution and the
+    completion stay on the server.
+    """
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    
+    return Response(game_state.to_bytes(include_solution=False), mimetype='application/octet-stream')
+
+def submitted_boards(num_nodes, num_colors):
+    """
+    The colorings a /verify request submits.
+    
+    The body is either JSON, {"colors": [...]} for one board or
+    {"boards": [[...], ...]} for several, with a color index or null per
+    node, or raw bytes: boards in the packed format of /state (two nodes
+    per byte), back to back.
+    
+    Returns:
+        tuple: (int8 array of shape (boards, num_nodes) with -1 for
+        uncolored nodes, True if a single board was sent as "colors")
+    
+    Raises:
+        ValueError: If the body is empty, a board doesn't have num_nodes
+            entries, or an entry isn't a color index below num_colors or null
+    """
+    range_error = f"Colors must be integers from 0 to {num_colors - 1}, or null or -1 for uncolored"
+    
+    if request.mimetype == 'application/octet-stream':
+        data = np.frombuffer(request.get_data(), dtype=np.uint8)
+        board_size = (num_nodes + 1) // 2
+        if not len(data):
+            raise ValueError(f"Empty body; expected {board_size} bytes per board")
+        if len(data) % board_size:
+            raise ValueError(f"Body is {len(data)} bytes; expected a multiple of {board_size}")
+        boards = np.stack([unpack_colors(board, num_nodes) for board in data.reshape(-1, board_size)])
+        if np.any(boards >= num_colors):
+            raise ValueError(range_error)
+        return boards, False
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or ('colors' in data) == ('boards' in data):
+        raise ValueError('Send a JSON object with either "colors" or "boards"')
+    single = 'colors' in data
+    boards = [data['colors']] if single else data['boards']
+    if not isinstance(boards, list) or not boards:
+        raise ValueError('"boards" must be a non-empty list of boards')
+    for board in boards:
+        if not isinstance(board, list):
+            raise ValueError("Each board must be a list of colors")
+        if len(board) != num_nodes:
+            raise ValueError(f"Each board needs {num_nodes} colors, got {len(board)}")
+        # Exact types: bools are ints to Python, and floats like 1.0 aren't indices
+        if not {type(color) for color in board} <= {int, type(None)}:
+            raise ValueError(range_error)
+    
+    # Through float so nulls become NaN, then back to -1
+    values = np.array(boards, dtype=np.float64)
+    values[np.isnan(values)] = UNCOLORED
+    if np.any(values < UNCOLORED) or np.any(values >= num_colors):
+        raise ValueError(range_error)
+    return values.astype(np.int8), single
+
+@app.route('/verify', methods=['POST'])
+def verify():
+    """
+    Check submitted colorings of the current board: every edge at once
+    (see utils.graph.find_conflicts), for one board or a batch
+    """
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    
+    num_nodes = game_state.graph.num_nodes
+    try:
+        boards, single = submitted_boards(num_nodes, len(game_state.available_colors))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    if len(boards) > VERIFY_MAX_BOARDS:
+        return jsonify({'error': f'At most {VERIFY_MAX_BOARDS} boards per request'}), 400
+    
+    with metrics.phase('verify'):
+        conflicts = find_conflicts(game_state.graph, boards)
+        counts = np.bincount(conflicts[:, 0], minlength=len(boards))
+        starts = np.searchsorted(conflicts[:, 0], np.arange(len(boards)))
+        complete = np.all(boards >= 0, axis=1)
+    
+    results = [{
+        'valid': bool(counts[i] == 0),
+        'complete': bool(complete[i]),
+        'num_conflicts': int(counts[i]),
+        'conflicts': conflicts[starts[i]:starts[i] + min(counts[i], VERIFY_MAX_CONFLICTS), 1:].tolist()
+    } for i in range(len(boards))]
+    
+    return jsonify(results[0] if single else {'results': results})
+
+def finish_if_complete(game_state):
+    """
+    Record the end time and game statistics once the board is complete.
+    
+    Callers refuse moves on a finished game, so each game is recorded once.
+    """
+    if not game_state.is_complete():
+        return False
+    
+    game_state.end_time = datetime.datetime.now()
+    
+    # Only games whose move log replays to the finished board are recorded
+    if not game_state.verify_history():
+        app.logger.warning("Move log doesn't replay to the finished board; stats not recorded")
+        return True
+    
+    # Calculate time safely - ensure both start_time and end_time exist
+    time_seconds = 0
+    if game_state.start_time is not None and game_state.end_time is not None:
+        time_seconds = int((game_state.end_time - game_state.start_time).total_seconds())
+    
+    # Record game statistics
+    record_game_stats(
+        difficulty=session.get('difficulty', 'medium'),
+        moves=game_state.moves,
+        hints=game_state.hints_used,
+        time_seconds=time_seconds,
+        score=game_state.calculate_score()
+    )
+    return True
+
+def color_delta(game_state, nodes):
+    """Current colors of the given nodes, keyed by node ID string (None = uncolored)"""
+    return {str(node): int(game_state.node_colors[node]) if game_state.node_colors[node] >= 0 else None
+            for node in nodes}
+
+def broadcast_changes(game_state, nodes, game_complete):
+    """Send changed colors to everyone watching the session's board, if anyone is"""
+    game_id = session.get('game_id')
+    if board_hub.has_subscribers(game_id):
+        board_hub.publish(game_id, format_event('delta', {
+            'changed': color_delta(game_state, nodes),
+            'version': game_state.version,
+            'game_complete': game_complete
+        }, event_id=game_state.version))
+
+def move_response(game_state, changed, game_complete):
+    """JSON body for applied moves: only the changed nodes and the new version"""
+    message = "Valid move!"
+    if game_complete:
+        message = f"Congratulations! You've completed the map coloring in {game_state.moves} moves!"
+    
+    return {
+        'valid': True,
+        'changed': color_delta(game_state, changed),
+        'version': game_state.version,
+        'message': message,
+        'game_complete': game_complete,
+        'moves': game_state.moves,
+        'score': game_state.calculate_score() if game_complete else None,
+        'can_undo': game_state.history.can_undo,
+        'can_redo': game_state.history.can_redo
+    }
+
+def parse_move(game_state, node_id, color_index):
+    """
+    Check the types of a move from a request.
+    
+    Args:
+        node_id: Node ID, an int or its string form
+        color_index: An int in the game's palette, or UNCOLORED to clear the node
+        
+    Returns:
+        tuple: (node, color), or None if either is malformed. Whether the
+        node exists and the move is legal is left to GameState.make_move()
+    """
+    if isinstance(color_index, bool) or not isinstance(color_index, int):
+        return None
+    if not UNCOLORED <= color_index < len(game_state.available_colors):
+        return None
+    if isinstance(node_id, bool) or not isinstance(node_id, (int, str)):
+        return None
+    try:
+        return int(node_id), color_index
+    except ValueError:
+        return None
 
 @app.route('/color_node', methods=['POST'])
+@board_locked
 def color_node():
-    node_id = request.json.get('node_id')
-    color_index = request.json.get('color_index')
+    data = request.json or {}
     
-    # Load game state from session
-    game_state = GameState.from_json(session.get('game_state', '{}'))
+    # Load game state from the store
+    game_state = load_game_state()
     
-    if not game_state.graph:
+    if game_state is None or not game_state.graph:
         return jsonify({'error': 'No active game'}), 400
+    if game_state.end_time is not None:
+        return jsonify({'valid': False, 'version': game_state.version,
+                        'message': 'The game is already complete.'})
     
-    # Convert node_id to integer (it's sent as string from frontend)
-    node_id = int(node_id)
+    # The node ID is sent as a string from the frontend
+    move = parse_move(game_state, data.get('node_id'), data.get('color_index'))
+    if move is None:
+        return jsonify({'error': 'Invalid move'}), 400
+    node_id, color_index = move
+    if not 0 <= node_id < game_state.graph.num_nodes:
+        return jsonify({'error': 'No such node'}), 400
     
     # Check if the coloring is valid and make the move
     if game_state.make_move(node_id, color_index):
-        # Check if the game is complete
-        game_complete = game_state.is_complete()
-        
-        # Record end time if game is complete
-        if game_complete:
-            game_state.end_time = datetime.datetime.now()
-            
-            # Calculate time safely - ensure both start_time and end_time exist
-            time_seconds = 0
-            if game_state.start_time is not None and game_state.end_time is not None:
-                time_seconds = int((game_state.end_time - game_state.start_time).total_seconds())
-            
-            # Record game statistics
-            record_game_stats(
-                difficulty=session.get('difficulty', 'medium'),
-                moves=game_state.moves,
-                hints=game_state.hints_used,
-                time_seconds=time_seconds,
-                score=game_state.calculate_score()
-            )
+        game_complete = finish_if_complete(game_state)
         
         # Save updated game state
-        session['game_state'] = game_state.to_json()
+        save_game_state(game_state)
+        broadcast_changes(game_state, [node_id], game_complete)
         
-        message = "Valid move!"
-        if game_complete:
-            message = f"Congratulations! You've completed the map coloring in {game_state.moves} moves!"
-        
-        return jsonify({
-            'valid': True,
-            'node_colors': {str(k): v for k, v in game_state.node_colors.items()},
-            'message': message,
-            'game_complete': game_complete,
-            'moves': game_state.moves,
-            'score': game_state.calculate_score() if game_complete else None
-        })
+        return jsonify(move_response(game_state, [node_id], game_complete))
     else:
         return jsonify({
             'valid': False,
+            'version': game_state.version,
             'message': "Invalid move! Adjacent regions can't have the same color."
         })
 
+@app.route('/moves', methods=['POST'])
+@board_locked
+def moves():
+    """
+    Apply a batch of moves with a single load and save of the game state.
+    
+    The body is {"moves": [{"node_id", "color_index"}, ...], "version": n};
+    a color_index of -1 clears the node. The batch is applied all or nothing. If the client's version is behind
+    the server's, the full coloring is sent along so it can catch up.
+    
+    On a shared board each move may also carry "seen_color", the color the
+    player saw on the node (null for uncolored). The batch is then rejected
+    if another player changed one of its nodes first.
+    """
+    data = request.json or {}
+    
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    
+    try:
+        entries = data.get('moves', [])
+        batch = [parse_move(game_state, move['node_id'], move['color_index']) for move in entries]
+        seen = None
+        if any('seen_color' in move for move in entries):
+            seen = [UNCOLORED if move.get('seen_color') is None else int(move['seen_color'])
+                    for move in entries]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid moves'}), 400
+    if None in batch:
+        return jsonify({'error': 'Invalid moves'}), 400
+    if not all(0 <= node < game_state.graph.num_nodes for node, _ in batch):
+        return jsonify({'error': 'No such node'}), 400
+    
+    # Nodes the client may have colored ahead of the response, to revert on rejection
+    batch_nodes = [node for node, _ in batch]
+    if game_state.end_time is not None:
+        return jsonify({'valid': False, 'changed': color_delta(game_state, batch_nodes),
+                        'version': game_state.version, 'message': 'The game is already complete.'})
+    
+    stale = data.get('version') is not None and data.get('version') != game_state.version
+    changed, rejected, reason = game_state.apply_moves(batch, seen)
+    
+    if rejected is None:
+        game_complete = finish_if_complete(game_state) if changed else False
+        if changed:
+            save_game_state(game_state)
+            broadcast_changes(game_state, changed, game_complete)
+        response = move_response(game_state, changed, game_complete)
+    else:
+        # Nothing was applied
+        response = {
+            'valid': False,
+            'rejected': rejected,
+            'changed': color_delta(game_state, batch_nodes),
+            'version': game_state.version,
+            'message': ("Another player colored that region first." if reason == MOVE_STALE
+                        else "Invalid move! Adjacent regions can't have the same color.")
+        }
+    
+    if stale:
+        response['node_colors'] = color_delta(game_state, game_state.graph.nodes())
+    return jsonify(response)
+
+def step_history(step, nothing_message):
+    """Shared body of /undo and /redo; step is GameState.undo or GameState.redo"""
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    if game_state.end_time is not None:
+        return jsonify({'valid': False, 'version': game_state.version,
+                        'message': 'The game is already complete.'})
+    
+    node = step(game_state)
+    if node is None:
+        return jsonify({'valid': False, 'version': game_state.version, 'message': nothing_message,
+                        'can_undo': game_state.history.can_undo,
+                        'can_redo': game_state.history.can_redo})
+    
+    game_complete = finish_if_complete(game_state)
+    save_game_state(game_state)
+    broadcast_changes(game_state, [node], game_complete)
+    return jsonify(move_response(game_state, [node], game_complete))
+
+@app.route('/undo', methods=['POST'])
+@board_locked
+def undo():
+    """Take back the latest move; responds like /moves"""
+    return step_history(GameState.undo, 'Nothing to undo.')
+
+@app.route('/redo', methods=['POST'])
+@board_locked
+def redo():
+    """Re-apply the latest undone move; responds like /moves"""
+    return step_history(GameState.redo, 'Nothing to redo.')
+
 @app.route('/hint', methods=['POST'])
+@board_locked
 def hint():
-    # Load game state from session
-    game_state = GameState.from_json(session.get('game_state', '{}'))
+    # Load game state from the store
+    game_state = load_game_state()
     
-    if not game_state.graph:
+    if game_state is None or not game_state.graph:
         return jsonify({'error': 'No active game'}), 400
     
     # Get a hint from the game state
-    hint_data = game_state.get_hint()
+    hint_data = game_state.get_hint(time_budget=HINT_BUDGET)
     
-    if hint_data:
-        hint_node, hint_color = hint_data
-        hint_message = f"Try coloring node {hint_node} with {game_state.available_colors[hint_color]}."
+    if hint_data and hint_data.kind == MOVE:
+        hint_message = f"Try coloring node {hint_data.node} with {game_state.available_colors[hint_data.color]}."
         
-        # Save the updated hint count
-        session['game_state'] = game_state.to_json()
+        # Save the updated hint count (and the hint engine's cached solution)
+        save_game_state(game_state)
         
         return jsonify({
-            'hint_node': str(hint_node),
-            'hint_color': hint_color,
+            'hint_node': str(hint_data.node),
+            'hint_color': hint_data.color,
             'message': hint_message
         })
+    elif hint_data and hint_data.kind == UNDO:
+        save_game_state(game_state)
+        
+        # The hint engine prefers recent moves, often the very last one
+        history = game_state.history
+        if history.can_undo and history.nodes[history.cursor - 1] == hint_data.node:
+            message = "This map can't be finished as colored. Try undoing your last move."
+        else:
+            message = f"This map can't be finished as colored. Try clearing node {hint_data.node}."
+        
+        return jsonify({
+            'undo_node': str(hint_data.node),
+            'message': message
+        })
     else:
         return jsonify({
             'message': 'No hint available at this time.'
         })
 
+@app.route('/share', methods=['POST'])
+def share():
+    """
+    Open the current game to other players. Anyone with the link joins the
+    same board (see /join) and sees everyone's moves as they happen.
+    
+    Shared boards live in this process's game store and broadcast hub, so
+    with several workers, players need the shared SQLite store and a
+    sticky route to one worker to see each other's moves live.
+    """
+    game_state = load_game_state()
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'No active game'}), 400
+    
+    board_id = session['game_id']
+    session['shared'] = True
+    return jsonify({
+        'board_id': board_id,
+        'share_url': url_for('index', board=board_id, _external=True),
+        'message': 'Board shared. Send the link to other players!'
+    })
+
+@app.route('/join', methods=['POST'])
+def join():
+    """
+    Play on a shared board: {"board_id": ...}. Responds like /new_game, with
+    the board's current colors and version added.
+    """
+    board_id = (request.json or {}).get('board_id')
+    game_state = game_store.get(board_id) if isinstance(board_id, str) else None
+    
+    if game_state is None or not game_state.graph:
+        return jsonify({'error': 'That board no longer exists'}), 404
+    if game_state.positions is None:
+        return jsonify({'error': 'This board has no node positions'}), 400
+    
+    # Leave (and clean up) a game of one's own first
+    old_game_id = session.get('game_id')
+    if old_game_id and old_game_id != board_id and not session.get('shared'):
+        game_store.delete(old_game_id)
+    session['game_id'] = board_id
+    session['shared'] = True
+    
+    graph = game_state.graph
+    puzzle = Puzzle(graph, np.asarray(game_state.positions, dtype=np.float64), game_state.solution,
+                    len(game_state.available_colors), None, min_colors=game_state.min_colors)
+    return jsonify({
+        **board_payload(puzzle, board_id, large=graph.num_nodes > VIEWPORT_MAX_NODES),
+        'available_colors': game_state.available_colors,
+        'node_colors': color_delta(game_state, np.flatnonzero(game_state.node_colors >= 0).tolist()),
+        'version': game_state.version,
+        'message': 'Joined a shared board. Color it together!',
+        'game_complete': game_state.end_time is not None
+    })
+
+def board_snapshot(game_state):
+    """The first event of a board's stream: every node's color and the version"""
+    colors = game_state.node_colors.tolist()
+    return format_event('snapshot', {
+        'colors': [color if color >= 0 else None for color in colors],
+        'version': game_state.version,
+        'game_complete': game_state.end_time is not None
+    }, event_id=game_state.version)
+
+@app.route('/events/<board_id>', methods=['GET'])
+def events(board_id):
+    """
+    Server-Sent Events stream of a board's moves.
+    
+    A snapshot event comes first, then one delta event (the changed
+    nodes' colors, the version and whether the game is complete) per
+    move by any player, and a comment every SSE_KEEPALIVE seconds so
+    proxies keep the connection open. A watcher that falls too far behind
+    gets a resync event and the stream ends; the browser reconnects and
+    starts over from a fresh snapshot.
+    
+    Each open stream holds a worker thread here; asgi.py serves this route
+    on its event loop instead. A server that runs one request at a time
+    per process (gunicorn's sync worker) would be blocked by the first
+    watcher, so there the stream is refused with 501, and beyond
+    SSE_MAX_STREAMS open streams with 503.
+    """
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({'error': 'Live board updates need a threaded server '
+                                 '(see gunicorn.conf.py) or asgi.py'}), 501
+    if not event_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many boards are being watched. Please try again.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    # Subscribe before reading the board, so no move falls between the two
+    subscriber = board_hub.subscribe(board_id)
+    game_state = game_store.get(board_id)
+    if game_state is None or not game_state.graph:
+        board_hub.unsubscribe(subscriber)
+        event_streams.release()
+        return jsonify({'error': 'That board no longer exists'}), 404
+    
+    snapshot = board_snapshot(game_state)
+    
+    def generate():
+        try:
+            yield b'retry: 1000\n' + snapshot
+            while True:
+                messages = subscriber.get(SSE_KEEPALIVE)
+                if messages:
+                    yield b''.join(messages)
+                elif subscriber.closed:
+                    yield format_event('resync', {})
+                    return
+                else:
+                    yield b': keepalive\n\n'
+        finally:
+            board_hub.unsubscribe(subscriber)
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even if the stream is closed before its first chunk
+    response.call_on_close(event_streams.release)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Request and phase timings in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    """Return puzzle pool sizes and hit/miss counters, the process pool load, the puzzle bank, solver portfolio wins, shared board watchers and cached payloads"""
+    return jsonify({**puzzle_pool.stats(), 'offload': offloader.stats(),
+                    'bank': puzzle_bank.stats() if puzzle_bank is not None else None,
+                    'boards': board_hub.stats(),
+                    'payloads': payload_cache.stats(),
+                    'portfolio': solver_portfolio.stats() if solver_portfolio is not None else None})
+
 @app.route('/save_settings', methods=['POST'])
 def save_settings():
     # Get settings from request
@@ -171,29 +1072,38 @@ def get_settings():
 
 def record_game_stats(difficulty, moves, hints, time_seconds, score):
     """
-    Record game statistics in a cookie for the client to store
+    Record a finished game for the leaderboards
     
-    This is just a helper function to format the data - the actual
-    storage will happen in the client-side JavaScript using localStorage
+    The result is buffered in memory and written to the stats database in
+    the background, so finishing a game doesn't wait on a write.
+    
+    Returns:
+        dict: The recorded result
     """
-    game_data = {
-        'difficulty': difficulty,
-        'moves': moves,
-        'hints': hints,
-        'time': time_seconds,
-        'score': score,
-        'date': datetime.datetime.now().isoformat()
-    }
+    return game_stats.record(difficulty, moves, hints, time_seconds, score,
+                             datetime.datetime.now().isoformat())
+
+@app.route('/leaderboard', methods=['GET'])
+def leaderboard():
+    """Best results for a difficulty, served from memory, and per-difficulty totals"""
+    difficulty = request.args.get('difficulty', 'medium')
+    if difficulty not in DIFFICULTY_LEVELS:
+        return jsonify({'error': 'Unknown difficulty'}), 400
     
-    return jsonify(game_data)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), LEADERBOARD_SIZE)
+    return jsonify({
+        'difficulty': difficulty,
+        'entries': game_stats.leaderboard(difficulty, limit),
+        'summary': game_stats.summary()
+    })
 
 @app.route('/get_game_stats', methods=['GET'])
 def get_game_stats():
     """Return the stats of the current game for saving to localStorage"""
-    # Load game state from session
-    game_state = GameState.from_json(session.get('game_state', '{}'))
+    # Load game state from the store
+    game_state = load_game_state()
     
-    if not game_state.graph:
+    if game_state is None or not game_state.graph:
         return jsonify({'error': 'No active game'}), 400
     
     # Calculate time safely
@@ -223,5 +1133,31 @@ def get_game_stats():
     
     return jsonify(stats)
 
+def warm_up():
+    """
+    Pay the first-call costs of the game paths once, before serving.
+    
+    Compiles the page template and runs a small game through generation,
+    its /new_game payload, a move, a hint and a state round trip, without
+    touching the store, the stats, the puzzle pool or the process pool.
+    Under gunicorn with preload_app this runs in the master (see
+    gunicorn.conf.py), so every worker, including recycled ones, is
+    forked already warm.
+    """
+    with app.test_request_context('/'):
+        render_template('index.html')
+        puzzle = generate_puzzle(DIFFICULTY_LEVELS['easy']['nodes'], 'random',
+                                 DIFFICULTY_LEVELS['easy']['colors'], seed=0)
+        key = puzzle_key('random', puzzle.graph.num_nodes, 0, puzzle.num_colors)
+        build_new_game_payload((key, False, puzzle.num_colors, NEW_GAME_MESSAGE.format(difficulty='easy')), puzzle)
+        game_state = GameState(puzzle.graph, puzzle.num_colors, solution=puzzle.solution,
+                               positions=puzzle.positions, min_colors=puzzle.min_colors)
+        game_state.make_move(0, int(puzzle.solution[0]))
+        game_state.get_hint(time_budget=HINT_BUDGET)
+        GameState.from_bytes(game_state.to_bytes())
+    
+    # Warm-up timings aren't traffic
+    metrics.reset()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
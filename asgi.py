@@ -0,0 +1,89 @@
+"""
+ASGI entry point.
+
+    GAME_STORE=sqlite:///games.db uvicorn asgi:application --workers 4
+    GAME_STORE=sqlite:///games.db gunicorn asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+Several workers share games only through the SQLite store (see
+gunicorn.conf.py).
+
+An event loop accepts connections and hands each request to a thread pool
+of ASGI_THREADS threads that runs the Flask routes. Puzzle generation and
+solving go to the bounded process pool in utils/offload.py. A burst of
+slow /new_game requests therefore only occupies threads waiting on that
+pool, and moves and hints keep being served. When the pool is full,
+/new_game answers 503 with Retry-After instead of queueing without bound.
+
+Shared board streams (/events/<board_id>) are served on the event loop
+itself rather than by the Flask route: each watcher is a coroutine waiting
+on its broadcast queue, so hundreds of them don't tie up the thread pool.
+"""
+import asyncio
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app, board_hub, board_snapshot, game_store, SSE_KEEPALIVE
+from utils.broadcast import format_event
+
+EVENTS_PREFIX = '/events/'
+
+wsgi_application = WSGIMiddleware(app, workers=int(os.environ.get('ASGI_THREADS', 32)))
+
+
+async def application(scope, receive, send):
+    if (scope['type'] == 'http' and scope['method'] == 'GET'
+            and scope['path'].startswith(EVENTS_PREFIX)):
+        await board_events(scope['path'][len(EVENTS_PREFIX):], receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
+
+
+async def board_events(board_id, receive, send):
+    """The /events/<board_id> stream (see app.events) as a coroutine"""
+    loop = asyncio.get_running_loop()
+    subscriber = board_hub.subscribe(board_id, loop=loop)
+    try:
+        game_state = await loop.run_in_executor(None, game_store.get, board_id)
+        if game_state is None or not game_state.graph:
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': b'{"error":"That board no longer exists"}'})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 1000\n' + board_snapshot(game_state),
+                    'more_body': True})
+
+        disconnected = asyncio.ensure_future(_disconnect(receive))
+        try:
+            while not disconnected.done():
+                messages = asyncio.ensure_future(subscriber.get(SSE_KEEPALIVE))
+                await asyncio.wait((messages, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    messages.cancel()
+                    break
+                messages = messages.result()
+                if messages:
+                    body = b''.join(messages)
+                elif subscriber.closed:
+                    await send({'type': 'http.response.body', 'body': format_event('resync', {})})
+                    return
+                else:
+                    body = b': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+    finally:
+        board_hub.unsubscribe(subscriber)
+
+
+async def _disconnect(receive):
+    """Finish when the client goes away"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
@@ -0,0 +1,385 @@
+"""
+Load test: simulated players against a running server.
+
+Usage:
+    python -m benchmarks.load_test [--players 1000] [--concurrency 100]
+                                   [--workers 4] [--worker-class gthread --threads 8]
+                                   [--app asgi:application --worker-class uvicorn.workers.UvicornWorker]
+                                   [--url http://host:port] [--output results.json]
+
+Unless --url names a server that is already running, gunicorn is started
+on a free local port with the given worker settings (and the repo's
+gunicorn.conf.py), and stopped at the end. Several workers only share
+games through a common store, so the started server gets a temporary
+SQLite game store and a fixed SECRET_KEY unless --env overrides them.
+
+Each player plays one game on its own keep-alive connection with its own
+cookie jar. It starts a game, reads the board from /state and solves it
+locally (the server doesn't hand out solutions), colors the nodes in
+random order with /color_node, asks for a hint before a move now and
+then, and stops when the game is complete. --concurrency players run
+at once until --players games have been played.
+
+The JSON report has throughput, error rate and p50/p95/p99 latency per
+route, along with the run's settings, so runs at different worker counts
+or configurations can be compared side by side.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.game_state import GameState
+from utils.solver import COLORABLE, solve_coloring
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds to wait for a started server to accept connections
+STARTUP_TIMEOUT = 60
+
+
+class HTTPError(Exception):
+    """A request got no response: the connection broke or timed out"""
+
+
+class Client:
+    """
+    Minimal HTTP/1.1 client for one simulated player: a single keep-alive
+    connection (reopened if the server closes it) and a cookie jar.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = SimpleCookie()
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, body=None):
+        """
+        Send a request and read the whole response.
+
+        Returns:
+            tuple: (status, body bytes)
+
+        Raises:
+            HTTPError: If the connection breaks or times out
+        """
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                   f'Content-Length: {len(payload)}']
+        if body is not None:
+            headers.append('Content-Type: application/json')
+        if self.cookies:
+            headers.append('Cookie: ' + '; '.join(f'{key}={morsel.value}'
+                                                  for key, morsel in self.cookies.items()))
+        message = ('\r\n'.join(headers) + '\r\n\r\n').encode() + payload
+
+        try:
+            return await asyncio.wait_for(self._exchange(message), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as error:
+            await self.close()
+            raise HTTPError(f'{method} {path}: {error!r}') from error
+
+    async def _exchange(self, message):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._writer.write(message)
+        await self._writer.drain()
+
+        status_line = await self._reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                self.cookies.load(value)
+            headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await self._reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await self._reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self._reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, data
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+class Recorder:
+    """Latencies and errors per route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client, route, method, body=None):
+        """
+        Make a request and record it under route.
+
+        Returns:
+            tuple: (status, body bytes), status None if the request failed
+        """
+        start = time.perf_counter()
+        try:
+            status, data = await client.request(method, route, body)
+        except HTTPError:
+            self.errors[route] += 1
+            self.statuses[route]['failed'] += 1
+            return None, b''
+        self.latencies[route].append(time.perf_counter() - start)
+        self.statuses[route][str(status)] += 1
+        if not 200 <= status < 300:
+            self.errors[route] += 1
+        return status, data
+
+    def report(self, elapsed):
+        """Throughput, error rate and latency percentiles (ms) per route"""
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            times = sorted(self.latencies[route])
+            count = sum(self.statuses[route].values())
+            routes[route] = {
+                'requests': count,
+                'throughput_rps': count / elapsed,
+                'error_rate': self.errors[route] / count,
+                'statuses': dict(self.statuses[route]),
+                **latency_percentiles(times)
+            }
+        return routes
+
+
+def latency_percentiles(times):
+    """p50/p95/p99/max of sorted durations in seconds, as milliseconds"""
+    if not times:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+
+    def pick(q):
+        return times[min(len(times) - 1, int(q * len(times)))] * 1000
+
+    return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': times[-1] * 1000}
+
+
+async def play(client, recorder, rng, args):
+    """
+    One player's game: new game, board from /state solved locally, moves
+    (with the odd hint) until the game is complete.
+
+    Returns:
+        bool: True if the game was completed
+    """
+    body = {'difficulty': args.difficulty, 'map_type': args.map_type}
+    if args.puzzle_seeds:
+        body['seed'] = rng.randrange(args.puzzle_seeds)
+    status, _ = await recorder.call(client, '/new_game', 'POST', body)
+    if status != 200:
+        return False
+
+    status, data = await recorder.call(client, '/state', 'GET')
+    if status != 200:
+        return False
+    # /state leaves the solution out, so the player finds its own
+    game_state = GameState.from_bytes(data)
+    result = await asyncio.to_thread(solve_coloring, game_state.graph, len(game_state.available_colors),
+                                     fixed=game_state.node_colors)
+    if result.status != COLORABLE:
+        return False
+    solution = result.coloring
+
+    order = list(range(len(solution)))
+    rng.shuffle(order)
+    for node in order:
+        if rng.random() < args.hint_rate:
+            await recorder.call(client, '/hint', 'POST', {})
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+        status, data = await recorder.call(client, '/color_node', 'POST',
+                                           {'node_id': str(node), 'color_index': int(solution[node])})
+        if status != 200:
+            return False
+        if json.loads(data).get('game_complete'):
+            return True
+    return False
+
+
+async def run_players(host, port, args):
+    """Play args.players games, args.concurrency at a time"""
+    recorder = Recorder()
+    queue = asyncio.Queue()
+    for player in range(args.players):
+        queue.put_nowait(player)
+    completed = 0
+
+    async def worker():
+        nonlocal completed
+        while True:
+            try:
+                player = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            client = Client(host, port, args.timeout)
+            try:
+                won = await play(client, recorder, random.Random(args.seed * 1000003 + player), args)
+                completed += won
+            finally:
+                await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.players))))
+    elapsed = time.perf_counter() - start
+
+    routes = recorder.report(elapsed)
+    requests = sum(route['requests'] for route in routes.values())
+    errors = sum(recorder.errors.values())
+    return {
+        'elapsed_s': elapsed,
+        'games': args.players,
+        'games_completed': completed,
+        'requests': requests,
+        'throughput_rps': requests / elapsed,
+        'error_rate': errors / requests if requests else 0.0,
+        'routes': routes
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port, scratch):
+    """
+    Start gunicorn with the run's settings and wait until it accepts
+    connections.
+
+    Returns:
+        tuple: (process, environment overrides it was started with)
+    """
+    env = {
+        'SECRET_KEY': 'load-test',
+        'GAME_STORE': f"sqlite:///{os.path.join(scratch, 'games.db')}",
+        'STATS_DB': os.path.join(scratch, 'stats.db')
+    }
+    for setting in args.env:
+        key, _, value = setting.partition('=')
+        env[key] = value
+
+    command = [sys.executable, '-m', 'gunicorn', args.app, '--bind', f'127.0.0.1:{port}',
+               '--workers', str(args.workers), '--worker-class', args.worker_class,
+               '--threads', str(args.threads), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env})
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, env
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'The server did not start within {STARTUP_TIMEOUT} s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=1000, help='Games to play in total')
+    parser.add_argument('--concurrency', type=int, default=100, help='Players at once')
+    parser.add_argument('--difficulty', default='medium')
+    parser.add_argument('--map-type', default='random')
+    parser.add_argument('--hint-rate', type=float, default=0.1,
+                        help='Chance of asking for a hint before each move')
+    parser.add_argument('--think-ms', type=float, default=0,
+                        help='Mean pause before each move (0 = none)')
+    parser.add_argument('--puzzle-seeds', type=int, default=0,
+                        help='Play seeded boards drawn from this many seeds (0 = random boards)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the players\' choices')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request fails')
+    parser.add_argument('--url', help='Test this running server instead of starting one')
+    parser.add_argument('--app', default='app:app')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='Environment settings for the started server')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    settings = {name: value for name, value in vars(args).items() if name != 'output'}
+    process = None
+    with tempfile.TemporaryDirectory() as scratch:
+        try:
+            if args.url:
+                url = urlsplit(args.url)
+                host, port = url.hostname, url.port or 80
+            else:
+                host, port = '127.0.0.1', free_port()
+                process, env = start_server(args, port, scratch)
+                settings['server_env'] = env
+            results = asyncio.run(run_players(host, port, args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': settings,
+        **results
+    }
+    for route, stats in report['routes'].items():
+        p50 = f"{stats['p50_ms']:8.2f}" if stats['p50_ms'] is not None else '       -'
+        p99 = f"{stats['p99_ms']:8.2f}" if stats['p99_ms'] is not None else '       -'
+        print(f"{route:15s} {stats['requests']:8d} req {stats['throughput_rps']:9.1f} req/s "
+              f"p50 {p50} ms  p99 {p99} ms  errors {stats['error_rate']:.1%}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0 if report['error_rate'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
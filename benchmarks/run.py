@@ -0,0 +1,305 @@
+"""
+Benchmarks for the graph generators, the solver, game state serialization,
+the Flask endpoints and app startup.
+
+Usage:
+    python -m benchmarks.run [--sizes 10 100 1000 10000] [--repeat 3]
+                             [--output results.json] [--baseline old.json]
+                             [--threshold 1.25] [--large]
+
+Every case records wall time (median and min over the repeats) and peak
+memory (tracemalloc, from a separate warm-up run); solver cases also
+record the success rate, and endpoint cases the number of non-2xx
+responses (which aren't timed). With --baseline, cases whose median time
+grew by more than the threshold ratio are reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.graph import (create_random_planar_graph, create_grid_graph, create_voronoi_graph,
+                         create_planar_graph, generate_solvable_coloring)
+from utils.game_state import GameState
+
+GENERATORS = {
+    'random': create_random_planar_graph,
+    'grid': create_grid_graph,
+    'voronoi': create_voronoi_graph
+}
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+def measure(func, repeat):
+    """
+    Run func once under tracemalloc for peak memory (which also warms up
+    caches), then repeat more times untraced for wall time.
+
+    Returns:
+        tuple: (stats dict, list of return values)
+    """
+    tracemalloc.start()
+    results = [func()]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results.append(func())
+        times.append(time.perf_counter() - start)
+
+    stats = {
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'peak_bytes': peak
+    }
+    return stats, results
+
+
+def timed_requests(request, repeat):
+    """
+    Latency of repeat test client requests. Only 2xx responses are timed;
+    the rest (a 503 from backpressure, say) are counted as failures, so an
+    endpoint that fails fast can't look fast.
+
+    Raises:
+        RuntimeError: If every request failed
+    """
+    times, statuses = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status = request().status_code
+        elapsed = time.perf_counter() - start
+        if 200 <= status < 300:
+            times.append(elapsed)
+        else:
+            statuses.append(status)
+    if not times:
+        raise RuntimeError(f'Every request failed (statuses {sorted(set(statuses))})')
+    return {**percentiles(times), 'failures': len(statuses)}
+
+
+def percentiles(times):
+    """Latency summary of a list of durations, in seconds"""
+    ordered = sorted(times)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        'median_s': statistics.median(ordered),
+        'min_s': ordered[0],
+        'p90_s': pick(0.9),
+        'p99_s': pick(0.99),
+        'max_s': ordered[-1]
+    }
+
+
+def bench_generators(sizes, repeat):
+    results = {}
+    for map_type, generator in GENERATORS.items():
+        for size in sizes:
+            stats, _ = measure(lambda: generator(size), repeat)
+            results[f'generate/{map_type}/{size}'] = stats
+    return results
+
+
+def bench_solver(sizes, repeat):
+    results = {}
+    for map_type in GENERATORS:
+        for size in sizes:
+            graphs = [create_planar_graph(size, map_type)[0] for _ in range(repeat + 1)]
+            graphs_left = iter(graphs)
+            stats, solutions = measure(lambda: generate_solvable_coloring(next(graphs_left)), repeat)
+            stats['success_rate'] = sum(s is not None for s in solutions) / len(solutions)
+            results[f'solve/{map_type}/{size}'] = stats
+    return results
+
+
+def bench_serialization(sizes, repeat):
+    results = {}
+    for size in sizes:
+        graph, _ = create_voronoi_graph(size)
+        game_state = GameState(graph)
+        data = game_state.to_json()
+
+        stats, _ = measure(game_state.to_json, repeat)
+        stats['size_bytes'] = len(data)
+        results[f'state/to_json/{size}'] = stats
+
+        stats, _ = measure(lambda: GameState.from_json(data), repeat)
+        results[f'state/from_json/{size}'] = stats
+
+        data = game_state.to_bytes()
+        stats, _ = measure(game_state.to_bytes, repeat)
+        stats['size_bytes'] = len(data)
+        results[f'state/to_bytes/{size}'] = stats
+
+        stats, _ = measure(lambda: GameState.from_bytes(data), repeat)
+        results[f'state/from_bytes/{size}'] = stats
+    return results
+
+
+def bench_endpoints(repeat, large=False):
+    """
+    Per-endpoint latency through the Flask test client. Large boards (the
+    20,000-node "huge" difficulty) take seconds each and only run with
+    large=True
+    """
+    from app import app, DIFFICULTY_LEVELS, MAP_TYPES
+
+    client = app.test_client()
+    results = {}
+
+    for difficulty, params in DIFFICULTY_LEVELS.items():
+        if params.get('large') and not large:
+            continue
+        for map_type in MAP_TYPES:
+            body = {'difficulty': difficulty, 'map_type': map_type}
+            results[f'endpoint/new_game/{difficulty}/{map_type}'] = timed_requests(
+                lambda: client.post('/new_game', json=body), repeat)
+
+    body = {'difficulty': 'hard', 'map_type': 'voronoi', 'seed': 1}
+    results['endpoint/new_game/seeded'] = timed_requests(
+        lambda: client.post('/new_game', json=body), repeat)
+
+    results['endpoint/puzzle'] = timed_requests(
+        lambda: client.get('/puzzle?difficulty=hard&map_type=voronoi&seed=1'), repeat)
+
+    results['endpoint/hint'] = timed_requests(lambda: client.post('/hint', json={}), repeat)
+
+    # Recoloring node 0 with each color in turn, so every move is a real update
+    moves = iter(range(10 ** 9))
+    results['endpoint/color_node'] = timed_requests(lambda: client.post('/color_node', json={
+        'node_id': '0', 'color_index': next(moves) % 4}), repeat)
+
+    results['endpoint/moves'] = timed_requests(lambda: client.post('/moves', json={'moves': [
+        {'node_id': '0', 'color_index': next(moves) % 4}]}), repeat)
+
+    return results
+
+
+# Run in a fresh interpreter per repeat: import the app, optionally warm it
+# up, then time the first requests a new worker would serve
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import app
+timings = {'import': time.perf_counter() - start}
+if sys.argv[1] == 'warm':
+    start = time.perf_counter()
+    app.warm_up()
+    timings['warm_up'] = time.perf_counter() - start
+client = app.app.test_client()
+for name, request in (('first_index', lambda: client.get('/')),
+                      ('first_new_game', lambda: client.post('/new_game', json={'difficulty': 'easy'}))):
+    start = time.perf_counter()
+    request()
+    timings[name] = time.perf_counter() - start
+print(json.dumps(timings), flush=True)
+# Skip interpreter teardown while the pool's refill thread is mid-generation
+os._exit(0)
+"""
+
+
+def bench_startup(repeat):
+    """
+    Cold start: importing the app and the first requests of a fresh
+    process, without and with warm_up() (what a gunicorn worker forked from
+    a preloaded master gets)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # Keep the runs off disk and out of the process pool, so only startup is timed
+    env = {**os.environ, 'STATS_DB': '', 'PUZZLE_CACHE_DIR': '', 'OFFLOAD_WORKERS': '0'}
+    samples = {}
+    for mode in ('cold', 'warm'):
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, mode], cwd=root, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            for name, seconds in json.loads(output).items():
+                samples.setdefault(f'startup/{mode}/{name}', []).append(seconds)
+    return {case: percentiles(times) for case, times in samples.items()}
+
+
+def compare(results, baseline, threshold):
+    """
+    Cases whose median time grew by more than threshold times the baseline.
+
+    Returns:
+        list: (case, baseline median, new median) tuples
+    """
+    regressions = []
+    for case, stats in results.items():
+        old = baseline.get(case)
+        if old is None or not old.get('median_s'):
+            continue
+        if stats['median_s'] > old['median_s'] * threshold:
+            regressions.append((case, old['median_s'], stats['median_s']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip', nargs='*', default=[],
+                        choices=['generators', 'solver', 'serialization', 'endpoints', 'startup'])
+    parser.add_argument('--large', action='store_true',
+                        help='Also time /new_game for the large-map difficulties')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = {}
+    if 'generators' not in args.skip:
+        results.update(bench_generators(args.sizes, args.repeat))
+    if 'solver' not in args.skip:
+        results.update(bench_solver(args.sizes, args.repeat))
+    if 'serialization' not in args.skip:
+        results.update(bench_serialization(args.sizes, args.repeat))
+    if 'endpoints' not in args.skip:
+        results.update(bench_endpoints(max(args.repeat, 20), args.large))
+    if 'startup' not in args.skip:
+        results.update(bench_startup(max(args.repeat, 5)))
+
+    for case, stats in results.items():
+        extra = f"  success {stats['success_rate']:.0%}" if 'success_rate' in stats else ''
+        peak = f"  peak {stats['peak_bytes'] / 1e6:8.2f} MB" if 'peak_bytes' in stats else ''
+        failed = f"  failed {stats['failures']}" if stats.get('failures') else ''
+        print(f"{case:45s} {stats['median_s'] * 1000:10.2f} ms{peak}{extra}{failed}")
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for case, old, new in regressions:
+            print(f"REGRESSION {case}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Gunicorn settings (picked up automatically from the working directory).
+
+    gunicorn app:app
+
+The app is imported once in the master (preload_app) and warmed up there
+before any worker is forked, so workers share the loaded modules and the
+compiled template instead of each importing Flask and numpy and paying
+first-call costs on its first requests. Each worker starts filling its
+puzzle pool as soon as it is forked, rather than on its first /new_game.
+
+Games live in the default memory store of the worker that created them,
+so it only works with a single worker that is never restarted. With a
+shared store (GAME_STORE=sqlite:///path) workers are recycled after
+MAX_REQUESTS requests (with jitter, so they don't all restart at once); a
+replacement is forked from the same warm master. Starting several
+workers, or recycling them, on the memory store is refused.
+
+Each worker runs THREADS request threads (the gthread worker) rather
+than gunicorn's default single-threaded sync worker: a shared board's
+/events stream holds its thread while it is open, and on a sync worker
+the first watcher would block every other request to that worker. The
+app refuses /events on a sync worker, and keeps a share of the threads
+free (SSE_MAX_STREAMS). With many watchers, serve asgi.py instead, which
+streams on its event loop.
+
+Everything that runs threads or holds connections (the puzzle pool, the
+process pool, the stats writer, SQLite connections) starts per process,
+after the fork.
+"""
+import os
+
+# Games outlive a worker only in a store that all workers share
+SHARED_STORE = os.environ.get('GAME_STORE', 'memory').startswith('sqlite:///')
+
+# Bind address and worker count keep gunicorn's defaults (PORT, WEB_CONCURRENCY)
+preload_app = True
+max_requests = int(os.environ.get('MAX_REQUESTS', 2000 if SHARED_STORE else 0))
+max_requests_jitter = max_requests // 10
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 16))
+
+
+def on_starting(server):
+    """Runs in the master before any worker is started"""
+    if not SHARED_STORE and (server.cfg.workers > 1 or server.cfg.max_requests):
+        raise RuntimeError('Several workers, or recycling them, need a shared game store: '
+                           'set GAME_STORE=sqlite:///path/to/games.db')
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before workers are forked"""
+    from app import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    """Runs in each new worker"""
+    from app import puzzle_pool
+    puzzle_pool.start()
@@ -0,0 +1,70 @@
+"""
+Generate a bank of graded puzzles for the web app.
+
+Usage:
+    python -m scripts.build_puzzle_bank --count 3000 --output puzzles.bank
+                                        [--nodes 10 30] [--map-types random voronoi]
+                                        [--colors 4] [--workers 8] [--seed 1]
+
+Puzzles are generated and graded across all cores (see
+utils.puzzle_bank.grade_puzzle), then written to a memory-mappable bank
+file. Point the app at it with PUZZLE_BANK=puzzles.bank. The same --seed
+always produces the same bank.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.puzzle_bank import MAP_TYPES, GRADES, PuzzleBank, generate_graded_puzzle, write_bank
+
+
+def plan_jobs(count, min_nodes, max_nodes, map_types, num_colors, seed):
+    """The (num_nodes, map_type, num_colors, seed) of every puzzle to generate"""
+    rng = random.Random(seed)
+    return [(rng.randint(min_nodes, max_nodes), map_types[i % len(map_types)], num_colors,
+             rng.getrandbits(48))
+            for i in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, required=True, help='Number of puzzles')
+    parser.add_argument('--output', required=True, help='Bank file to write')
+    parser.add_argument('--nodes', type=int, nargs=2, default=(10, 30), metavar=('MIN', 'MAX'),
+                        help='Range of region counts')
+    parser.add_argument('--map-types', nargs='+', choices=MAP_TYPES, default=list(MAP_TYPES))
+    parser.add_argument('--colors', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    jobs = plan_jobs(args.count, args.nodes[0], args.nodes[1], args.map_types, args.colors, args.seed)
+    start = time.perf_counter()
+
+    # Small puzzles take milliseconds, so hand them out in chunks
+    chunksize = max(1, len(jobs) // (4 * max(args.workers, 1)))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        graded = list(executor.map(generate_graded_puzzle, *zip(*jobs), chunksize=chunksize))
+
+    write_bank(args.output, graded)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {len(graded)} puzzles to {args.output} in {elapsed:.1f}s")
+
+    bank = PuzzleBank(args.output)
+    failed = bank.verify()
+    if failed:
+        print(f"{len(failed)} puzzles have invalid solutions: {failed[:10]}", file=sys.stderr)
+        return 1
+    for entry in sorted(bank.stats(), key=lambda s: (s['map_type'], GRADES.index(s['grade']))):
+        print(f"  {entry['map_type']:<8} {entry['grade']:<7} {entry['puzzles']:>6} puzzles, "
+              f"{entry['min_nodes']}-{entry['max_nodes']} nodes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,13 +4,38 @@ document.addEventListener('DOMContentLoaded', function () {
     let selectedColor = null;
     let gameData = null;
 
+    // Moves are queued and sent to /moves in batches; the server answers
+    // with the changed nodes and a version number
+    let pendingMoves = [];
+    let flushTimer = null;
+    let requestInFlight = false;
+    let version = 0;
+    const BATCH_DELAY_MS = 100;
+
+    // Large maps are drawn a viewport at a time, streamed from /viewport
+    // whenever panning or zooming stops
+    let viewportTimer = null;
+    let viewportRequest = null;
+    const VIEWPORT_DELAY_MS = 150;
+
+    // Shared boards: everyone's moves arrive over /events/<board_id>, and
+    // each move carries the color this client last saw on the node so the
+    // server can turn away moves made against an outdated board
+    let boardEvents = null;
+    let boardColors = null;
+    let gameOver = false;
+
     // DOM elements
     const mapContainer = document.getElementById('map-container');
     const colorPalette = document.getElementById('color-palette');
     const messageElement = document.getElementById('message');
     const newGameBtn = document.getElementById('new-game-btn');
     const hintBtn = document.getElementById('hint-btn');
+    const undoBtn = document.getElementById('undo-btn');
+    const redoBtn = document.getElementById('redo-btn');
+    const shareBtn = document.getElementById('share-btn');
     const difficultySelect = document.getElementById('difficulty');
+    const fewestColorsBox = document.getElementById('fewest-colors');
 
     // D3 SVG setup
     const svg = d3.select('#map-container')
@@ -27,20 +52,51 @@ document.addEventListener('DOMContentLoaded', function () {
         // Set up event listeners
         newGameBtn.addEventListener('click', startNewGame);
         hintBtn.addEventListener('click', getHint);
+        undoBtn.addEventListener('click', () => stepHistory('undo'));
+        redoBtn.addEventListener('click', () => stepHistory('redo'));
+        shareBtn.addEventListener('click', shareBoard);
 
-        // Initially disable the hint button until a game starts
+        // Initially disable the hint and share buttons until a game starts
         hintBtn.disabled = true;
+        shareBtn.disabled = true;
+        updateHistoryButtons({ can_undo: false, can_redo: false });
+
+        // A shared link opens the board it points to
+        const boardId = new URLSearchParams(window.location.search).get('board');
+        if (boardId) {
+            joinBoard(boardId);
+        }
+    }
+
+    function resetMoveState() {
+        selectedNode = null;
+        selectedColor = null;
+        pendingMoves = [];
+        clearTimeout(flushTimer);
+        flushTimer = null;
+        version = 0;
+        if (boardEvents) {
+            boardEvents.close();
+            boardEvents = null;
+        }
+        boardColors = null;
+        gameOver = false;
     }
 
     function startNewGame() {
         const difficulty = difficultySelect.value;
+        const mode = fewestColorsBox.checked ? 'min_colors' : 'standard';
 
-        // Reset selection state
-        selectedNode = null;
-        selectedColor = null;
+        // Reset selection, move queue and shared board state
+        resetMoveState();
+        if (window.location.search) {
+            history.replaceState(null, '', window.location.pathname);
+        }
 
-        // Enable hint button
+        // Enable hint and share buttons
         hintBtn.disabled = false;
+        shareBtn.disabled = false;
+        updateHistoryButtons({ can_undo: false, can_redo: false });
 
         // Send request to create new game
         fetch('/new_game', {
@@ -48,12 +104,12 @@ document.addEventListener('DOMContentLoaded', function () {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ difficulty }),
+            body: JSON.stringify({ difficulty, mode }),
         })
             .then(response => response.json())
             .then(data => {
                 gameData = data;
-                renderGame(data);
+                drawBoard(data);
                 updateMessage(data.message);
             })
             .catch(error => {
@@ -62,10 +118,108 @@ document.addEventListener('DOMContentLoaded', function () {
             });
     }
 
+    function joinBoard(boardId) {
+        resetMoveState();
+
+        fetch('/join', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ board_id: boardId }),
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    updateMessage(data.error + ' Start a new game!');
+                    return;
+                }
+
+                gameData = data;
+                drawBoard(data);
+                updateNodeColors(data.node_colors);
+                version = data.version;
+                hintBtn.disabled = data.game_complete;
+                gameOver = data.game_complete;
+                shareBtn.disabled = false;
+                updateMessage(data.message);
+                watchBoard(boardId);
+            })
+            .catch(error => {
+                console.error('Error joining board:', error);
+                updateMessage('Error joining the shared board. Please try again.');
+            });
+    }
+
+    function shareBoard() {
+        fetch('/share', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    updateMessage(data.error);
+                    return;
+                }
+
+                history.replaceState(null, '', data.share_url);
+                if (navigator.clipboard) {
+                    navigator.clipboard.writeText(data.share_url).catch(() => {});
+                }
+                updateMessage(data.message + ' ' + data.share_url);
+                if (!boardEvents) {
+                    watchBoard(data.board_id);
+                }
+            })
+            .catch(error => {
+                console.error('Error sharing board:', error);
+                updateMessage('Error sharing the board. Please try again.');
+            });
+    }
+
+    function watchBoard(boardId) {
+        // EventSource reconnects by itself (after a resync too), and every
+        // connection starts with a snapshot of the whole board
+        boardEvents = new EventSource('/events/' + encodeURIComponent(boardId));
+
+        boardEvents.addEventListener('snapshot', event => {
+            const data = JSON.parse(event.data);
+            boardColors = data.colors;
+            version = data.version;
+            d3.selectAll('.region').attr('fill', d => colorOf(boardColors[Number(d.id)]));
+        });
+
+        boardEvents.addEventListener('delta', event => {
+            const data = JSON.parse(event.data);
+            if (data.version <= version) return;
+            updateNodeColors(data.changed);
+            version = data.version;
+            if (data.game_complete && !gameOver) {
+                updateMessage('The map is complete!');
+                celebrateVictory();
+            }
+        });
+
+        // A refused stream (the server can't hold it open) isn't retried
+        const stream = boardEvents;
+        stream.addEventListener('error', () => {
+            if (stream.readyState === EventSource.CLOSED && boardEvents === stream) {
+                boardEvents = null;
+                updateMessage('Live updates from other players are unavailable right now.');
+            }
+        });
+    }
+
+    function drawBoard(data) {
+        if (data.large) {
+            renderLargeGame(data);
+        } else {
+            renderGame(data);
+        }
+    }
+
     function renderGame(data) {
         // Clear previous content
+        clearTimeout(viewportTimer);
         graphGroup.selectAll('*').remove();
-        colorPalette.innerHTML = '';
 
         // Set up zoom and pan behavior
         const zoom = d3.zoom()
@@ -147,7 +301,132 @@ document.addEventListener('DOMContentLoaded', function () {
             .attr('font-weight', 'bold')
             .text(d => d.id);
 
-        // Create color palette
+        renderPalette(data);
+    }
+
+    function renderLargeGame(data) {
+        graphGroup.selectAll('*').remove();
+
+        // Map coordinates are scaled uniformly so the whole map fits the
+        // container at zoom level 1
+        const bounds = data.bounds;
+        const width = mapContainer.clientWidth;
+        const height = mapContainer.clientHeight;
+        const scale = Math.min(width / (bounds.xmax - bounds.xmin || 1),
+                               height / (bounds.ymax - bounds.ymin || 1));
+        const toScreenX = x => (x - bounds.xmin) * scale;
+        const toScreenY = y => (y - bounds.ymin) * scale;
+
+        // Node size follows the average spacing between nodes
+        const spacing = scale * Math.sqrt((bounds.xmax - bounds.xmin) * (bounds.ymax - bounds.ymin) / data.num_nodes);
+        const nodeRadius = Math.max(spacing * 0.3, 0.5);
+
+        const zoom = d3.zoom()
+            .scaleExtent([0.5, 200])
+            .on('zoom', (event) => {
+                graphGroup.attr('transform', event.transform);
+            })
+            .on('end', (event) => {
+                clearTimeout(viewportTimer);
+                viewportTimer = setTimeout(() => loadViewport(event.transform), VIEWPORT_DELAY_MS);
+            });
+
+        svg.call(zoom);
+        svg.call(zoom.transform, d3.zoomIdentity);
+
+        function loadViewport(transform) {
+            // Screen corners back to map coordinates
+            const [x0, y0] = transform.invert([0, 0]);
+            const [x1, y1] = transform.invert([width, height]);
+            const box = {
+                xmin: x0 / scale + bounds.xmin,
+                ymin: y0 / scale + bounds.ymin,
+                xmax: x1 / scale + bounds.xmin,
+                ymax: y1 / scale + bounds.ymin
+            };
+
+            if (viewportRequest) {
+                viewportRequest.abort();
+            }
+            const request = viewportRequest = new AbortController();
+
+            // Earlier viewports stay up until the new one starts arriving
+            const stale = graphGroup.selectAll(':scope > g');
+
+            // Edges arrive right after the chunk of nodes they start from
+            const drawn = new Map();
+            const edgeLayer = graphGroup.append('g');
+            const nodeLayer = graphGroup.append('g');
+
+            streamViewport(box, request.signal, record => {
+                if (record.type === 'header') {
+                    stale.remove();
+                } else if (record.type === 'nodes') {
+                    const nodes = record.data.map(([id, x, y, color]) => ({ id: String(id), x, y, color }));
+                    nodes.forEach(d => drawn.set(d.id, d));
+                    nodeLayer.selectAll(null)
+                        .data(nodes)
+                        .enter()
+                        .append('circle')
+                        .attr('class', 'region')
+                        .attr('r', nodeRadius)
+                        .attr('cx', d => toScreenX(d.x))
+                        .attr('cy', d => toScreenY(d.y))
+                        .attr('fill', d => d.color !== null ? gameData.available_colors[d.color] : '#E8E8E8')
+                        .on('click', function (event, d) {
+                            selectNode(d.id, this);
+                        });
+                } else if (record.type === 'edges') {
+                    edgeLayer.selectAll(null)
+                        .data(record.data)
+                        .enter()
+                        .append('line')
+                        .attr('class', 'region-border')
+                        .attr('x1', ([u]) => toScreenX(drawn.get(String(u)).x))
+                        .attr('y1', ([u]) => toScreenY(drawn.get(String(u)).y))
+                        .attr('x2', ([u, v, tx]) => toScreenX(tx))
+                        .attr('y2', ([u, v, tx, ty]) => toScreenY(ty));
+                }
+            })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        console.error('Error loading viewport:', error);
+                        updateMessage('Error loading the map. Try moving it again.');
+                    }
+                });
+        }
+
+        loadViewport(d3.zoomIdentity);
+        renderPalette(data);
+    }
+
+    function streamViewport(box, signal, onRecord) {
+        // Read the NDJSON response line by line as it arrives
+        return fetch('/viewport?' + new URLSearchParams(box), { signal })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Viewport request failed: ' + response.status);
+                }
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+
+                function pump() {
+                    return reader.read().then(({ done, value }) => {
+                        buffer += done ? decoder.decode() : decoder.decode(value, { stream: true });
+                        const lines = buffer.split('\n');
+                        buffer = done ? '' : lines.pop();
+                        lines.filter(line => line.trim()).forEach(line => onRecord(JSON.parse(line)));
+                        return done ? undefined : pump();
+                    });
+                }
+
+                return pump();
+            });
+    }
+
+    function renderPalette(data) {
+        colorPalette.innerHTML = '';
         data.available_colors.forEach((color, index) => {
             const colorSwatch = document.createElement('div');
             colorSwatch.className = 'color-swatch';
@@ -199,30 +478,68 @@ document.addEventListener('DOMContentLoaded', function () {
     function applyColorToNode() {
         if (selectedNode === null || selectedColor === null) return;
 
-        fetch('/color_node', {
+        // Show the color right away; the server confirms or reverts it
+        const move = { node_id: selectedNode, color_index: selectedColor };
+        if (boardColors) {
+            move.seen_color = boardColors[Number(selectedNode)];
+        }
+        pendingMoves.push(move);
+        updateNodeColors({ [selectedNode]: selectedColor });
+
+        // Deselect the node after application
+        d3.selectAll('.region').classed('selected', false);
+        selectedNode = null;
+
+        scheduleFlush();
+    }
+
+    function scheduleFlush() {
+        if (flushTimer === null) {
+            flushTimer = setTimeout(flushMoves, BATCH_DELAY_MS);
+        }
+    }
+
+    function flushMoves() {
+        flushTimer = null;
+        if (requestInFlight || pendingMoves.length === 0) return;
+
+        const batch = pendingMoves;
+        pendingMoves = [];
+        requestInFlight = true;
+
+        fetch('/moves', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                node_id: selectedNode,
-                color_index: selectedColor
-            }),
+            body: JSON.stringify({ moves: batch, version }),
         })
             .then(response => response.json())
             .then(data => {
-                if (data.valid) {
+                if (data.error) {
+                    updateMessage(data.error);
+                    return;
+                }
+
+                // A full coloring is only sent when this client fell behind
+                if (data.node_colors) {
                     updateNodeColors(data.node_colors);
-                    updateMessage(data.message);
+                }
+                updateNodeColors(data.changed);
+                version = data.version;
+                updateMessage(data.message);
+                updateHistoryButtons(data);
 
+                if (data.valid) {
                     // Check if game is complete
                     if (data.game_complete) {
                         celebrateVictory();
                     }
                 } else {
-                    updateMessage(data.message);
-                    // Shake effect for invalid move
-                    d3.select('.selected')
+                    // Shake effect for the invalid move
+                    const rejected = batch[data.rejected];
+                    d3.selectAll('.region')
+                        .filter((d) => rejected && d.id === rejected.node_id)
                         .transition()
                         .duration(50)
                         .attr('transform', 'translate(3, 0)')
@@ -236,26 +553,86 @@ document.addEventListener('DOMContentLoaded', function () {
                         .duration(50)
                         .attr('transform', 'translate(0, 0)');
                 }
-
-                // Deselect the node after application (success or failure)
-                d3.selectAll('.region').classed('selected', false);
-                selectedNode = null;
             })
             .catch(error => {
-                console.error('Error applying color:', error);
+                console.error('Error applying moves:', error);
                 updateMessage('Error applying color. Please try again.');
+            })
+            .finally(() => {
+                requestInFlight = false;
+                if (pendingMoves.length > 0) {
+                    scheduleFlush();
+                }
             });
     }
 
+    function stepHistory(action) {
+        // Queued moves go first, so undo always sees the latest board
+        if (requestInFlight || pendingMoves.length > 0) {
+            clearTimeout(flushTimer);
+            flushMoves();
+            setTimeout(() => stepHistory(action), BATCH_DELAY_MS);
+            return;
+        }
+
+        requestInFlight = true;
+        fetch('/' + action, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({}),
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    updateMessage(data.error);
+                    return;
+                }
+
+                if (data.changed) {
+                    updateNodeColors(data.changed);
+                }
+                version = data.version;
+                updateMessage(data.message);
+                updateHistoryButtons(data);
+
+                if (data.game_complete) {
+                    celebrateVictory();
+                }
+            })
+            .catch(error => {
+                console.error('Error during ' + action + ':', error);
+                updateMessage('Error during ' + action + '. Please try again.');
+            })
+            .finally(() => {
+                requestInFlight = false;
+                if (pendingMoves.length > 0) {
+                    scheduleFlush();
+                }
+            });
+    }
+
+    function updateHistoryButtons(data) {
+        if (data.can_undo !== undefined) {
+            undoBtn.disabled = !data.can_undo;
+            redoBtn.disabled = !data.can_redo;
+        }
+    }
+
+    function colorOf(colorIndex) {
+        return colorIndex !== null && colorIndex !== undefined ? gameData.available_colors[colorIndex] : '#E8E8E8';
+    }
+
     function updateNodeColors(nodeColors) {
         for (const nodeId in nodeColors) {
             const colorIndex = nodeColors[nodeId];
-            if (colorIndex !== null) {
-                const color = gameData.available_colors[colorIndex];
-                d3.selectAll('.region')
-                    .filter((d) => d.id === nodeId)
-                    .attr('fill', color);
+            if (boardColors) {
+                boardColors[Number(nodeId)] = colorIndex;
             }
+            d3.selectAll('.region')
+                .filter((d) => d.id === nodeId)
+                .attr('fill', colorOf(colorIndex));
         }
     }
 
@@ -303,6 +680,10 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     function celebrateVictory() {
+        // On a shared board the finishing move's own event may get here first
+        if (gameOver) return;
+        gameOver = true;
+
         // Visual celebration for completing the game
         svg.append('g')
             .attr('class', 'confetti')
@@ -323,14 +704,15 @@ document.addEventListener('DOMContentLoaded', function () {
             .attr('cy', mapContainer.clientHeight + 10)
             .remove();
 
-        // Disable hint button after victory
+        // Disable hint and history buttons after victory
         hintBtn.disabled = true;
+        updateHistoryButtons({ can_undo: false, can_redo: false });
     }
 
     // Handle window resize
     window.addEventListener('resize', function () {
         if (gameData) {
-            renderGame(gameData);
+            drawBoard(gameData);
         }
     });
 });
\ No newline at end of file
@@ -0,0 +1,222 @@
+import json
+import threading
+from collections import deque
+
+# Messages a subscriber may fall behind by before it is dropped
+DEFAULT_QUEUE_SIZE = 256
+
+# Locks shared out among boards by hash
+LOCK_STRIPES = 64
+
+
+def format_event(event, data, event_id=None):
+    """
+    Encode one Server-Sent Events message.
+
+    Args:
+        event: Event name
+        data: JSON-serializable payload
+        event_id: Optional id (the client sends the last one back on reconnect)
+
+    Returns:
+        bytes: The message, ready to write to every subscriber
+    """
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class Subscriber:
+    """
+    One client's queue of messages on a channel.
+
+    The queue is bounded: a subscriber that falls max_queue messages behind
+    is closed (overflowed) instead of holding the publisher up or growing
+    without limit. It gets what was queued, then should resynchronize, e.g.
+    by reconnecting for a fresh snapshot.
+    """
+
+    def __init__(self, channel, max_queue=DEFAULT_QUEUE_SIZE):
+        self.channel = channel
+        self.max_queue = max_queue
+        self.closed = False
+        self.overflowed = False
+        self._queue = deque()
+
+    def drain(self):
+        """Take every queued message (never blocks)"""
+        messages = []
+        while self._queue:
+            messages.append(self._queue.popleft())
+        return messages
+
+    def _push(self, message):
+        """Queue a message; returns False if the subscriber is (now) closed"""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            self.overflowed = True
+            self.closed = True
+        else:
+            self._queue.append(message)
+        self._wake()
+        return not self.closed
+
+    def _close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        raise NotImplementedError
+
+
+class ThreadSubscriber(Subscriber):
+    """Subscriber read by a thread (a streamed WSGI response)"""
+
+    def __init__(self, channel, max_queue=DEFAULT_QUEUE_SIZE):
+        super().__init__(channel, max_queue)
+        self._event = threading.Event()
+
+    def get(self, timeout=None):
+        """
+        Wait until there are messages or the subscriber is closed.
+
+        Returns:
+            list: The queued messages (empty after a timeout or once closed)
+        """
+        self._event.clear()
+        if not self._queue and not self.closed:
+            self._event.wait(timeout)
+        return self.drain()
+
+    def _wake(self):
+        self._event.set()
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber read by a coroutine on an event loop (the ASGI stream)"""
+
+    def __init__(self, channel, loop, max_queue=DEFAULT_QUEUE_SIZE):
+        # asyncio is only loaded by the ASGI server, not by every app import
+        import asyncio
+
+        super().__init__(channel, max_queue)
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._scheduled = False
+
+    async def get(self, timeout=None):
+        """Like ThreadSubscriber.get(), without blocking the loop"""
+        import asyncio
+
+        self._event.clear()
+        if not self._queue and not self.closed:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.drain()
+
+    def _wake(self):
+        # Publishers run in other threads; one wakeup per loop turn is enough
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        self._scheduled = False
+        self._event.set()
+
+
+class BroadcastHub:
+    """
+    In-process publish/subscribe by channel (a shared board's game ID).
+
+    A message is encoded once by the publisher and the same bytes are
+    queued for every subscriber, so fanning out to hundreds of watchers
+    costs one deque append each. Subscribers that fall behind are dropped
+    (see Subscriber).
+
+    The hub also hands out the locks that serialize changes to a board,
+    so moves from several players are applied one at a time.
+    """
+
+    def __init__(self, max_queue=DEFAULT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._board_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._published = 0
+        self._dropped = 0
+
+    def lock(self, channel):
+        """The lock for changes to a channel's board (striped, so it is shared with a few others)"""
+        return self._board_locks[hash(channel) % LOCK_STRIPES]
+
+    def subscribe(self, channel, loop=None):
+        """
+        Start receiving a channel's messages.
+
+        Args:
+            loop: The event loop of an async reader (default: a thread reads)
+
+        Returns:
+            Subscriber: Unsubscribe it when the client goes away
+        """
+        if loop is None:
+            subscriber = ThreadSubscriber(channel, self.max_queue)
+        else:
+            subscriber = AsyncSubscriber(channel, loop, self.max_queue)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._remove(subscriber)
+        subscriber._close()
+
+    def has_subscribers(self, channel):
+        """True if anyone is listening (publishers can skip encoding otherwise)"""
+        return bool(self._channels.get(channel))
+
+    def publish(self, channel, message):
+        """
+        Queue an encoded message for every subscriber of a channel.
+
+        Returns:
+            int: Subscribers that got it
+        """
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if not subscribers:
+                return 0
+            self._published += 1
+            delivered = 0
+            for subscriber in list(subscribers):
+                if subscriber._push(message):
+                    delivered += 1
+                else:
+                    self._dropped += subscriber.overflowed
+                    self._remove(subscriber)
+            return delivered
+
+    def stats(self):
+        """Channels, subscribers, messages published and subscribers dropped for falling behind"""
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscribers': sum(len(subscribers) for subscribers in self._channels.values()),
+                'published': self._published,
+                'dropped': self._dropped
+            }
+
+    def _remove(self, subscriber):
+        """Take a subscriber off its channel (lock held)"""
+        subscribers = self._channels.get(subscriber.channel)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._channels[subscriber.channel]
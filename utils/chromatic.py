@@ -0,0 +1,255 @@
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.solver import solve_coloring, COLORABLE, UNCOLORABLE
+
+# Results kept per graph (keyed by the graph's contents)
+CACHE_SIZE = 1024
+
+
+class ChromaticResult:
+    """Chromatic number of a graph, or the bounds found within the time limit"""
+
+    __slots__ = ('number', 'lower', 'upper', 'coloring', 'elapsed')
+
+    def __init__(self, lower, upper, coloring, elapsed=0.0):
+        self.lower = lower          # Proven: no coloring with fewer colors exists
+        self.upper = upper          # Colors used by coloring
+        self.number = lower if lower == upper else None  # None when not settled
+        self.coloring = coloring    # int8 array using upper colors
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"ChromaticResult(number={self.number}, lower={self.lower}, upper={self.upper})"
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def chromatic_number(graph, time_limit=1.0, max_nodes=None):
+    """
+    Exact chromatic number of a graph, with a coloring that achieves it.
+
+    Works on bitsets of nodes (Python ints). The graph is split into
+    connected components, and within each one nodes with fewer neighbors
+    than the component's lower bound are set aside: they never decide the
+    answer and are colored last. What remains is bounded from below by the
+    largest clique found greedily, an odd cycle (3) or a node whose
+    neighbors contain one (4), and from above by a DSATUR coloring. If the
+    bounds differ, each number of colors in between is decided with the
+    exact search in utils.solver, smallest first. Whole results are
+    cached per graph.
+
+    Args:
+        graph: CompactGraph
+        time_limit: Seconds to spend at most; when they run out the result
+            has bounds but no number
+        max_nodes: Assignments each exact search may try. With no time
+            limit, the result then doesn't depend on how fast the machine is
+
+    Returns:
+        ChromaticResult: The chromatic number (or bounds) and a coloring
+    """
+    # A number settled within a time limit might not be within a node budget
+    key = (hashlib.blake2b(graph.indptr.tobytes() + graph.indices.tobytes(), digest_size=16).digest(),
+           max_nodes)
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            return result
+
+    start = time.perf_counter()
+    deadline = start + time_limit if time_limit is not None else None
+    n = graph.num_nodes
+    adj = [0] * n
+    for v in range(n):
+        for u in graph.neighbors(v).tolist():
+            adj[v] |= 1 << u
+
+    coloring = np.zeros(n, dtype=np.int8)
+    lower = 1 if n else 0
+    upper = lower
+    for component in _components((1 << n) - 1, adj):
+        component_lower, component_upper = _color_component(graph, adj, component, coloring,
+                                                            deadline, max_nodes)
+        lower = max(lower, component_lower)
+        upper = max(upper, component_upper)
+
+    result = ChromaticResult(lower, upper, coloring, time.perf_counter() - start)
+    # Only settled answers are worth keeping; a later call may have more time
+    if result.number is not None:
+        with _cache_lock:
+            _cache[key] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def _color_component(graph, adj, mask, coloring, deadline, max_nodes):
+    """
+    Color one connected component in place.
+
+    Returns:
+        tuple: (lower bound, colors used)
+    """
+    lower = _lower_bound(mask, adj)
+
+    # Nodes with fewer neighbors than the lower bound can't raise it
+    peeled = []
+    core = mask
+    changed = True
+    while changed:
+        changed = False
+        for v in _bits(core):
+            if (adj[v] & core).bit_count() < lower:
+                core &= ~(1 << v)
+                peeled.append(v)
+                changed = True
+
+    core_lower, core_colors = _color_core(graph, adj, core, lower, deadline, max_nodes)
+    lower = max(lower, core_lower)
+    for v, color in core_colors.items():
+        coloring[v] = color
+
+    # Put the peeled nodes back in reverse; each has a free color below lower
+    colored = core
+    used = max(core_colors.values(), default=-1) + 1
+    for v in reversed(peeled):
+        taken = {int(coloring[u]) for u in _bits(adj[v] & colored)}
+        coloring[v] = next(c for c in range(lower) if c not in taken)
+        colored |= 1 << v
+        used = max(used, int(coloring[v]) + 1)
+
+    return lower, used
+
+
+def _color_core(graph, adj, core, lower, deadline, max_nodes):
+    """
+    Find the chromatic number of a core by deciding each count between the
+    bounds.
+
+    Returns:
+        tuple: (lower bound, {node: color}) with the best coloring found
+    """
+    if not core:
+        return lower, {}
+
+    best = _dsatur(core, adj)
+    upper = max(best.values()) + 1
+    lower = max(lower, _lower_bound(core, adj))
+    if lower >= upper:
+        return upper, best
+
+    mask = np.zeros(graph.num_nodes, dtype=bool)
+    mask[list(_bits(core))] = True
+    subgraph, nodes = graph.subgraph(mask)
+    nodes = nodes.tolist()
+
+    for k in range(lower, upper):
+        remaining = None if deadline is None else deadline - time.perf_counter()
+        if remaining is not None and remaining <= 0:
+            break
+        # A fixed seed keeps the search, and so what fits in max_nodes, the same
+        result = solve_coloring(subgraph, k, max_nodes=max_nodes, time_limit=remaining,
+                                rng=random.Random(k))
+        if result.status == COLORABLE:
+            return k, dict(zip(nodes, result.coloring.tolist()))
+        if result.status != UNCOLORABLE:
+            break
+        lower = k + 1
+
+    return lower, best
+
+
+def _lower_bound(mask, adj):
+    """Chromatic number lower bound: greedy cliques, odd cycles and odd wheels"""
+    if not mask:
+        return 0
+    if not any(adj[v] & mask for v in _bits(mask)):
+        return 1
+
+    bound = 2
+    for v in _bits(mask):
+        # Greedy clique through v: keep adding the candidate with the most
+        # neighbors among the remaining candidates
+        candidates = adj[v] & mask
+        size = 1
+        while candidates:
+            u = max(_bits(candidates), key=lambda w: (adj[w] & candidates).bit_count())
+            candidates &= adj[u]
+            size += 1
+        bound = max(bound, size)
+
+    if bound < 3 and not _is_bipartite(mask, adj):
+        bound = 3
+    if bound < 4 and any(not _is_bipartite(adj[v] & mask, adj) for v in _bits(mask)):
+        bound = 4
+    return bound
+
+
+def _dsatur(mask, adj):
+    """Greedy DSATUR coloring of the nodes in mask; returns {node: color}"""
+    colors = {}
+    neighbor_colors = {v: set() for v in _bits(mask)}
+    degree = {v: (adj[v] & mask).bit_count() for v in neighbor_colors}
+
+    while neighbor_colors:
+        v = max(neighbor_colors, key=lambda w: (len(neighbor_colors[w]), degree[w]))
+        taken = neighbor_colors.pop(v)
+        color = next(c for c in range(len(taken) + 1) if c not in taken)
+        colors[v] = color
+        for u in _bits(adj[v] & mask):
+            if u in neighbor_colors:
+                neighbor_colors[u].add(color)
+    return colors
+
+
+def _components(mask, adj):
+    """Connected components of the nodes in mask, as bitsets"""
+    while mask:
+        component = frontier = mask & -mask
+        while frontier:
+            v = frontier.bit_length() - 1
+            frontier &= ~(1 << v)
+            new = adj[v] & mask & ~component
+            component |= new
+            frontier |= new
+        yield component
+        mask &= ~component
+
+
+def _is_bipartite(mask, adj):
+    """True if the nodes in mask induce a bipartite graph"""
+    for component in _components(mask, adj):
+        sides = [component & -component, 0]
+        frontier, side = sides[0], 0
+        seen = frontier
+        while frontier:
+            reached = 0
+            for v in _bits(frontier):
+                if adj[v] & sides[side]:
+                    return False
+                reached |= adj[v] & component
+            frontier = reached & ~seen
+            side = 1 - side
+            sides[side] |= frontier
+            seen |= frontier
+        for v in _bits(sides[1]):
+            if adj[v] & sides[1]:
+                return False
+    return True
+
+
+def _bits(mask):
+    """The node IDs in a bitset, in increasing order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
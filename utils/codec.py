@@ -0,0 +1,147 @@
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+
+# Varints carry 7 bits per byte; node IDs and counts fit in 5 bytes
+_VARINT_SHIFTS = (7, 14, 21, 28)
+
+
+def encode_varints(values):
+    """
+    LEB128-encode non-negative integers below 2**35.
+
+    Args:
+        values: 1-D integer array
+
+    Returns:
+        numpy.ndarray: uint8 array, 7 bits per byte, high bit set on every
+        byte but the last of each value
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in _VARINT_SHIFTS:
+        lengths += values >= (1 << shift)
+
+    ends = np.cumsum(lengths)
+    position = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - lengths, lengths)
+    out = (np.repeat(values, lengths) >> (7 * position).astype(np.uint64)).astype(np.uint8) & 0x7F
+    out[position < np.repeat(lengths, lengths) - 1] |= 0x80
+    return out
+
+
+def decode_varints(data, count):
+    """
+    Decode exactly count varints that fill data.
+
+    Args:
+        data: uint8 array (a view into the encoded buffer)
+        count: Number of values
+
+    Returns:
+        numpy.ndarray: int64 values
+
+    Raises:
+        ValueError: If data doesn't hold exactly count varints
+    """
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) != count or (count and ends[-1] != len(data) - 1):
+        raise ValueError(f"Expected {count} varints in {len(data)} bytes")
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+
+    starts = np.empty(count, dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    position = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(parts, starts)
+
+
+def encode_graph(graph):
+    """
+    Encode a graph as varints, each edge once.
+
+    Every node's count of higher-numbered neighbors comes first, then those
+    neighbor lists as gaps: the first neighbor relative to the node, the
+    rest relative to the previous neighbor (all gaps are positive).
+
+    Returns:
+        numpy.ndarray: uint8 array
+    """
+    num_nodes = graph.num_nodes
+    sources = np.repeat(np.arange(num_nodes), graph.degrees())
+    upper = graph.indices > sources
+    sources, targets = sources[upper], graph.indices[upper].astype(np.int64)
+    upper_degrees = np.bincount(sources, minlength=num_nodes)
+
+    # Neighbor lists are sorted, so the higher neighbors of each node are a
+    # contiguous increasing run
+    gaps = np.empty_like(targets)
+    gaps[1:] = targets[1:] - targets[:-1]
+    row_starts = np.cumsum(upper_degrees)[upper_degrees > 0] - upper_degrees[upper_degrees > 0]
+    gaps[row_starts] = targets[row_starts] - sources[row_starts]
+
+    return encode_varints(np.concatenate([upper_degrees, gaps]))
+
+
+def decode_graph(data, num_nodes, num_edges):
+    """
+    Rebuild a CompactGraph from encode_graph() output.
+
+    Args:
+        data: uint8 array holding exactly the encoded graph
+        num_nodes: Number of nodes
+        num_edges: Number of undirected edges
+    """
+    values = decode_varints(data, num_nodes + num_edges)
+    upper_degrees, gaps = values[:num_nodes], values[num_nodes:]
+    sources = np.repeat(np.arange(num_nodes), upper_degrees)
+
+    # A running sum of the gaps, restarted at each node, gives the targets
+    upper_ptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(upper_degrees, out=upper_ptr[1:])
+    row_starts = upper_ptr[:-1][upper_degrees > 0]
+    gaps[row_starts] += np.flatnonzero(upper_degrees > 0)
+    totals = np.cumsum(gaps)
+    row_base = np.zeros(num_nodes, dtype=np.int64)
+    row_base[upper_degrees > 0] = totals[row_starts] - gaps[row_starts]
+    targets = totals - np.repeat(row_base, upper_degrees)
+
+    # Each CSR row is its lower neighbors followed by its higher ones, both
+    # already in order once the reversed edges are grouped by target
+    lower_degrees = np.bincount(targets, minlength=num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(lower_degrees + upper_degrees, out=indptr[1:])
+    indices = np.empty(2 * num_edges, dtype=np.int32)
+
+    rank = np.arange(num_edges)
+    indices[np.repeat(indptr[:-1] + lower_degrees, upper_degrees) + rank
+            - np.repeat(upper_ptr[:-1], upper_degrees)] = targets
+
+    order = np.argsort(targets, kind='stable')
+    lower_ptr = np.cumsum(lower_degrees) - lower_degrees
+    indices[np.repeat(indptr[:-1], lower_degrees) + rank
+            - np.repeat(lower_ptr, lower_degrees)] = sources[order]
+
+    return CompactGraph(indptr, indices)
+
+
+def pack_colors(colors):
+    """
+    Pack a color array (-1 = uncolored, at most 15 colors) two nodes per
+    byte, low nibble first; each nibble holds color + 1
+    """
+    nibbles = np.asarray(colors, dtype=np.int16) + 1
+    if len(nibbles) % 2:
+        nibbles = np.append(nibbles, 0)
+    return (nibbles[0::2] | nibbles[1::2] << 4).astype(np.uint8)
+
+
+def unpack_colors(data, num_nodes):
+    """Inverse of pack_colors(); returns a new writable int8 array"""
+    colors = np.empty(2 * len(data), dtype=np.int8)
+    colors[0::2] = data & 0x0F
+    colors[1::2] = data >> 4
+    colors = colors[:num_nodes]
+    colors -= 1
+    return colors
@@ -0,0 +1,189 @@
+import numpy as np
+
+
+class CompactGraph:
+    """
+    Immutable undirected graph stored as CSR (compressed sparse row) arrays.
+
+    Nodes are the integers 0..num_nodes-1. The neighbors of node i are
+    indices[indptr[i]:indptr[i + 1]], sorted ascending. Every edge is stored
+    in both directions.
+    """
+
+    __slots__ = ('indptr', 'indices', '_edges')
+
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.indptr.flags.writeable = False
+        self.indices.flags.writeable = False
+        self._edges = None
+
+    def __reduce__(self):
+        # Rebuild through __init__ so the arrays come back read-only
+        return (CompactGraph, (self.indptr, self.indices))
+
+    @classmethod
+    def from_edges(cls, num_nodes, edges):
+        """
+        Build a graph from an edge list.
+
+        Args:
+            num_nodes: Number of nodes
+            edges: Iterable of (u, v) pairs or an (m, 2) array. Duplicates and
+                self-loops are dropped.
+
+        Returns:
+            CompactGraph: The graph
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+
+        # Symmetrize, then drop duplicate directed edges
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+        keys = np.unique(src * num_nodes + dst)
+        src, dst = keys // num_nodes, keys % num_nodes
+
+        # Keys are sorted by (src, dst), so dst is already in CSR order
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+
+        return cls(indptr, dst)
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Build a graph from a NetworkX graph with nodes 0..n-1"""
+        return cls.from_edges(graph.number_of_nodes(), list(graph.edges()))
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    def __len__(self):
+        return self.num_nodes
+
+    def nodes(self):
+        """Return the node IDs"""
+        return range(self.num_nodes)
+
+    def neighbors(self, node):
+        """Return the neighbors of a node as a read-only array view"""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def degrees(self):
+        """Return the degree of every node as an array"""
+        return np.diff(self.indptr)
+
+    def has_edge(self, u, v):
+        neighbors = self.neighbors(u)
+        i = np.searchsorted(neighbors, v)
+        return bool(i < len(neighbors) and neighbors[i] == v)
+
+    def edge_arrays(self):
+        """
+        Return each undirected edge once as two arrays (u, v) with u < v.
+
+        The arrays are computed on first use and cached.
+        """
+        if self._edges is None:
+            src = np.repeat(np.arange(self.num_nodes, dtype=np.int32), self.degrees())
+            mask = src < self.indices
+            u, v = src[mask], self.indices[mask]
+            u.flags.writeable = False
+            v.flags.writeable = False
+            self._edges = (u, v)
+        return self._edges
+
+    def edges(self):
+        """Return the edge list as (u, v) tuples of Python ints"""
+        u, v = self.edge_arrays()
+        return list(zip(u.tolist(), v.tolist()))
+
+    def connected_components(self):
+        """
+        Label the connected components with a vectorized union-find pass.
+
+        Each round hooks the larger root of every cross edge under the smaller
+        one, then compresses paths by pointer jumping until every node points
+        straight at its root.
+
+        Returns:
+            numpy.ndarray: Component label for every node (labels are 0..c-1)
+        """
+        parent = np.arange(self.num_nodes)
+        u, v = self.edge_arrays()
+
+        while True:
+            pu, pv = parent[u], parent[v]
+            cross = pu != pv
+            if not cross.any():
+                break
+            pu, pv = pu[cross], pv[cross]
+            np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+
+        return np.unique(parent, return_inverse=True)[1]
+
+    def expand(self, mask, hops=1):
+        """
+        Grow a node set by its neighbors.
+
+        Args:
+            mask: Boolean array selecting the starting nodes
+            hops: How many times to add all neighbors
+
+        Returns:
+            numpy.ndarray: Boolean array of the grown set
+        """
+        mask = np.array(mask, dtype=bool)
+        degrees = self.degrees()
+        for _ in range(hops):
+            mask[self.indices[np.repeat(mask, degrees)]] = True
+        return mask
+
+    def subgraph(self, mask):
+        """
+        Induced subgraph on the selected nodes.
+
+        Args:
+            mask: Boolean array selecting the nodes to keep
+
+        Returns:
+            tuple: (CompactGraph, array of original node IDs in new order)
+        """
+        mask = np.asarray(mask, dtype=bool)
+        nodes = np.flatnonzero(mask)
+        new_ids = np.full(self.num_nodes, -1, dtype=np.int64)
+        new_ids[nodes] = np.arange(len(nodes))
+
+        # Renumbering keeps the node order, so the kept neighbors of each
+        # kept node are still sorted and the CSR arrays can be sliced as is
+        targets = new_ids[self.indices]
+        keep = np.repeat(mask, self.degrees()) & (targets >= 0)
+        kept = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept[1:])
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(kept[self.indptr[nodes + 1]] - kept[self.indptr[nodes]], out=indptr[1:])
+        return CompactGraph(indptr, targets[keep]), nodes
+
+    def to_networkx(self):
+        """Export to a NetworkX graph (requires networkx)"""
+        import networkx as nx
+
+        graph = nx.Graph()
+        graph.add_nodes_from(range(self.num_nodes))
+        graph.add_edges_from(self.edges())
+        return graph
@@ -1,108 +1,318 @@
 import json
-import networkx as nx
-import random
-from utils.graph import generate_solvable_coloring
+import datetime
+import heapq
+import struct
+import numpy as np
+from utils.codec import encode_graph, decode_graph, pack_colors, unpack_colors
+from utils.compact_graph import CompactGraph
+from utils.graph import generate_solvable_coloring, find_conflicts
+from utils.hints import find_hint, TIMEOUT, DEFAULT_HINT_BUDGET
+from utils.move_log import MoveLog
+from utils.spatial import GridIndex
+
+# Color value of an uncolored node
+UNCOLORED = -1
+
+# Why GameState.apply_moves() rejected a move
+MOVE_INVALID = 'invalid'    # No such node or color, or a neighbor has the color
+MOVE_STALE = 'stale'        # Someone else changed the node since the player saw it
+
+# Points lost per color used beyond the board's chromatic number
+EXTRA_COLOR_PENALTY = 50
+
+# Binary state format (see GameState.to_bytes). The header is padded to 8
+# bytes so the positions that follow it can be read in place
+STATE_MAGIC = b'GCS1'
+STATE_HEADER = struct.Struct('<4sBBBxIIIIIqqI')
+HISTORY_HEADER = struct.Struct('<II')
+HAS_SOLUTION, HAS_COMPLETION, HAS_POSITIONS, HAS_START, HAS_END = (1 << i for i in range(5))
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Predefined colors that work well together and are colorblind-friendly
+COLOR_OPTIONS = [
+    "#4285F4",  # Blue
+    "#EA4335",  # Red
+    "#FBBC05",  # Yellow
+    "#34A853",  # Green
+    "#8E44AD",  # Purple
+    "#F39C12",  # Orange
+    "#1ABC9C",  # Turquoise
+    "#E74C3C",  # Crimson
+    "#3498DB",  # Light Blue
+    "#2ECC71"   # Light Green
+]
+
+def color_palette(num_colors):
+    """The colors a game with num_colors colors offers the player"""
+    return COLOR_OPTIONS[:min(num_colors, len(COLOR_OPTIONS))]
 
 class GameState:
     """Class to manage the game state"""
     
-    def __init__(self, graph=None, num_colors=4):
+    def __init__(self, graph=None, num_colors=4, solution=None, positions=None, min_colors=None):
         self.graph = graph
+        self.positions = positions
+        self.min_colors = min_colors  # Chromatic number of the board, if known
+        self._spatial_index = None
         self.available_colors = self._generate_colors(num_colors)
         
-        # Initialize all nodes with no color (None)
-        self.node_colors = {node: None for node in graph.nodes()} if graph else {}
+        # Initialize all nodes with no color (-1)
+        num_nodes = graph.num_nodes if graph else 0
+        self.node_colors = np.full(num_nodes, UNCOLORED, dtype=np.int8)
+        self._init_constraints()
         
         # Game statistics
         self.moves = 0
         self.hints_used = 0
+        self.version = 0  # Bumped on every change to node_colors
+        self.history = MoveLog()
         self.start_time = None
         self.end_time = None
         
-        # Generate a solution (for validation and hints)
-        self.solution = generate_solvable_coloring(graph, num_colors) if graph else None
+        # Use the given solution or solve the board (for validation and hints)
+        if solution is None and graph:
+            solution = generate_solvable_coloring(graph, num_colors)
+            if solution is None:
+                raise ValueError(f"Graph can't be colored with {num_colors} colors")
+        self.solution = solution
+        
+        # Full coloring consistent with the player's moves, kept by the hint engine
+        self.completion = solution
     
     def _generate_colors(self, num_colors):
         """Generate a list of colors"""
-        # Predefined colors that work well together and are colorblind-friendly
-        color_options = [
-            "#4285F4",  # Blue
-            "#EA4335",  # Red
-            "#FBBC05",  # Yellow
-            "#34A853",  # Green
-            "#8E44AD",  # Purple
-            "#F39C12",  # Orange
-            "#1ABC9C",  # Turquoise
-            "#E74C3C",  # Crimson
-            "#3498DB",  # Light Blue
-            "#2ECC71"   # Light Green
-        ]
-        
-        # Return a subset of colors based on num_colors
-        return color_options[:min(num_colors, len(color_options))]
+        return color_palette(num_colors)
     
-    def is_complete(self):
-        """Check if the game is complete"""
-        return all(color is not None for color in self.node_colors.values())
-    
-    def get_hint(self):
+    def _init_constraints(self):
         """
-        Generate a hint for the player.
+        Build the incremental constraint state from node_colors.
         
-        Returns:
-            tuple: (node_id, color_index) or None if no hint available
+        - uncolored_count: number of uncolored nodes
+        - neighbor_color_counts[v, c]: neighbors of v colored c
+        - neighbor_masks[v]: bitmask of colors used by v's neighbors
+        - _saturation_heap: lazy max-heap of uncolored nodes keyed by
+          (number of distinct neighbor colors, degree)
         """
-        # Find uncolored nodes
-        uncolored_nodes = [node for node, color in self.node_colors.items() if color is None]
+        num_nodes = len(self.node_colors)
+        num_colors = len(self.available_colors)
+        self.uncolored_count = int(np.count_nonzero(self.node_colors == UNCOLORED))
+        self.neighbor_color_counts = np.zeros((num_nodes, num_colors), dtype=np.int32)
+        self.neighbor_masks = np.zeros(num_nodes, dtype=np.int32)
+        self._saturation_heap = []
+        if not num_nodes:
+            return
         
-        if not uncolored_nodes:
-            return None
+        # Count every colored endpoint of every edge, in both directions
+        degrees = self.graph.degrees()
+        sources = np.repeat(np.arange(num_nodes), degrees)
+        target_colors = self.node_colors[self.graph.indices].astype(np.int64)
+        colored = target_colors != UNCOLORED
+        np.add.at(self.neighbor_color_counts, (sources[colored], target_colors[colored]), 1)
         
-        # Choose a random uncolored node
-        hint_node = random.choice(uncolored_nodes)
+        bits = (self.neighbor_color_counts > 0) << np.arange(num_colors)
+        self.neighbor_masks = bits.sum(axis=1).astype(np.int32)
         
-        # Get neighboring colors
-        neighbor_colors = {self.node_colors[n] for n in self.graph.neighbors(hint_node) 
-                          if self.node_colors[n] is not None}
+        self._degrees = degrees
         
-        # Find available colors
-        available_colors = [i for i in range(len(self.available_colors)) 
-                           if i not in neighbor_colors]
+        # Same entries as _heap_entry(), built for all uncolored nodes at once
+        uncolored = np.flatnonzero(self.node_colors == UNCOLORED)
+        masks = self.neighbor_masks[uncolored]
+        saturation = sum((masks >> color) & 1 for color in range(num_colors))
+        self._saturation_heap = list(zip((-saturation).tolist(), (-degrees[uncolored]).tolist(),
+                                         uncolored.tolist()))
+        heapq.heapify(self._saturation_heap)
+    
+    def _heap_entry(self, node):
+        return (-int(self.neighbor_masks[node]).bit_count(), -int(self._degrees[node]), node)
+    
+    def _set_color(self, node, color):
+        """
+        Set (or clear, with color -1) a node's color and update the
+        constraint state in O(degree)
+        """
+        old = int(self.node_colors[node])
+        if old == color:
+            return
         
-        if available_colors:
-            # Use the solution if available, otherwise pick a random valid color
-            if self.solution and hint_node in self.solution:
-                hint_color = self.solution[hint_node]
-            else:
-                hint_color = random.choice(available_colors)
-                
-            self.hints_used += 1
-            return (hint_node, hint_color)
+        neighbors = self.graph.neighbors(node)
+        counts = self.neighbor_color_counts
+        if old != UNCOLORED:
+            counts[neighbors, old] -= 1
+            cleared = neighbors[counts[neighbors, old] == 0]
+            self.neighbor_masks[cleared] &= ~(1 << old)
+        if color != UNCOLORED:
+            counts[neighbors, color] += 1
+            self.neighbor_masks[neighbors] |= 1 << color
         
+        self.node_colors[node] = color
+        self.uncolored_count += (old != UNCOLORED) - (color != UNCOLORED)
+        
+        # Re-key affected uncolored nodes; outdated heap entries are skipped later
+        for neighbor in neighbors[self.node_colors[neighbors] == UNCOLORED].tolist():
+            heapq.heappush(self._saturation_heap, self._heap_entry(neighbor))
+        if color == UNCOLORED:
+            heapq.heappush(self._saturation_heap, self._heap_entry(node))
+    
+    def most_constrained_node(self):
+        """
+        Return the uncolored node with the most distinct neighbor colors
+        (ties go to the higher degree), or None if every node is colored
+        """
+        heap = self._saturation_heap
+        while heap:
+            node = heap[0][2]
+            if self.node_colors[node] == UNCOLORED and heap[0] == self._heap_entry(node):
+                return node
+            heapq.heappop(heap)
         return None
     
+    def spatial_index(self):
+        """Grid index over the node positions, built on first use"""
+        if self._spatial_index is None and self.positions is not None:
+            self._spatial_index = GridIndex(self.positions)
+        return self._spatial_index
+    
+    def is_complete(self):
+        """Check if the game is complete"""
+        return self.uncolored_count == 0
+    
+    def get_hint(self, time_budget=DEFAULT_HINT_BUDGET):
+        """
+        Generate a hint for the player.
+        
+        Args:
+            time_budget: Seconds the hint engine may spend
+        
+        Returns:
+            Hint: A move that keeps the board solvable, a node to undo, or a
+            timeout; None if the board is already complete
+        """
+        hint = find_hint(self, time_budget)
+        if hint is not None and hint.kind != TIMEOUT:
+            self.hints_used += 1
+        return hint
+    
     def make_move(self, node, color):
         """
         Make a move in the game
         
         Args:
             node: Node to color
-            color: Color index
+            color: Color index, or UNCOLORED to clear the node
             
         Returns:
             bool: True if the move is valid, False otherwise
         """
+        # Reject nodes and colors that don't exist
+        if not (0 <= node < self.graph.num_nodes and UNCOLORED <= color < len(self.available_colors)):
+            return False
+        
         # Check all neighbors for the same color
-        for neighbor in self.graph.neighbors(node):
-            if self.node_colors.get(neighbor) == color:
-                return False
+        if color != UNCOLORED and self.neighbor_masks[node] >> color & 1:
+            return False
         
         # Update the node color
-        self.node_colors[node] = color
+        self.history.append(node, self.node_colors[node], color)
+        self._set_color(node, color)
         self.moves += 1
+        self.version += 1
         
         return True
     
+    def apply_moves(self, moves, seen=None):
+        """
+        Apply a batch of moves, all or nothing.
+        
+        On a shared board, moves from several players arrive in whatever
+        order the server takes them. Passing the color each player saw on
+        the node makes the first move on a node win: a later move made
+        against the old color is rejected as stale instead of silently
+        overwriting the other player's.
+        
+        Args:
+            moves: List of (node, color_index) pairs, applied in order
+            seen: Optional list with the color the player saw on each move's
+                node (UNCOLORED for none); a move applies only if the node
+                still has it
+            
+        Returns:
+            tuple: (changed, rejected, reason) where changed maps each changed
+            node to its new color, rejected is the index of the first move
+            that couldn't be applied (None if all moves were applied) and
+            reason is MOVE_INVALID or MOVE_STALE (None if applied). Nothing
+            is applied when a move is rejected.
+        """
+        applied = []
+        log_size = len(self.history)
+        for index, (node, color) in enumerate(moves):
+            old = int(self.node_colors[node]) if 0 <= node < len(self.node_colors) else None
+            if seen is not None and old is not None and old != seen[index]:
+                reason = MOVE_STALE
+            elif not self.make_move(node, color):
+                reason = MOVE_INVALID
+            else:
+                applied.append((node, old))
+                continue
+            # Roll back in reverse so every node gets its original color
+            for node, old in reversed(applied):
+                self._set_color(node, old)
+            self.moves -= len(applied)
+            self.version -= len(applied)
+            self.history.truncate(log_size)
+            return {}, index, reason
+        
+        changed = {node: int(self.node_colors[node]) for node, _ in applied}
+        return changed, None, None
+    
+    def undo(self):
+        """
+        Take back the latest move still in effect.
+        
+        Moves are undone in reverse order, so the board is always one the
+        player had before, and no neighbor check is needed.
+        
+        Returns:
+            int: The node that changed, or None if there is nothing to undo
+        """
+        entry = self.history.undo()
+        if entry is None:
+            return None
+        node, color = entry
+        self._set_color(node, color)
+        self.version += 1
+        return node
+    
+    def redo(self):
+        """
+        Re-apply the latest undone move.
+        
+        Returns:
+            int: The node that changed, or None if there is nothing to redo
+        """
+        entry = self.history.redo()
+        if entry is None:
+            return None
+        node, color = entry
+        self._set_color(node, color)
+        self.version += 1
+        return node
+    
+    def verify_history(self):
+        """
+        Replay the move log from an empty board and check that it leads to
+        the current board, and that no two neighbors share a color
+        
+        Returns:
+            bool: True if the game checks out
+        """
+        if not self.history.is_consistent():
+            return False
+        replayed = self.history.colors_at(self.history.cursor, len(self.node_colors))
+        if not np.array_equal(replayed, self.node_colors):
+            return False
+        
+        return len(find_conflicts(self.graph, self.node_colors)) == 0
+    
     def calculate_score(self, max_score=1000):
         """
         Calculate the player's score based on moves, hints, and time
@@ -120,13 +330,18 @@ class GameState:
         score = max_score
         
         # Deduct points for each move beyond the optimal
-        optimal_moves = len(self.graph.nodes())
+        optimal_moves = self.graph.num_nodes
         if self.moves > optimal_moves:
             score -= (self.moves - optimal_moves) * 5
         
         # Deduct points for hints
         score -= self.hints_used * 50
         
+        # Deduct points for colors beyond the fewest the map needs
+        if self.min_colors:
+            colors_used = len(np.unique(self.node_colors))
+            score -= max(0, colors_used - self.min_colors) * EXTRA_COLOR_PENALTY
+        
         # Deduct points for time (1 point per second after first minute)
         time_taken = (self.end_time - self.start_time).total_seconds()
         if time_taken > 60:
@@ -137,24 +352,140 @@ class GameState:
     
     def to_json(self):
         """Convert game state to JSON for session storage"""
-        # We need to convert the NetworkX graph to a serializable format
-        edges = list(self.graph.edges()) if self.graph else []
-        nodes = list(self.graph.nodes()) if self.graph else []
-        
+        # The CSR arrays are stored as flat lists; colors use -1 for uncolored
         state = {
             'graph': {
-                'nodes': nodes,
-                'edges': edges
+                'num_nodes': self.graph.num_nodes if self.graph else 0,
+                'edges': self.graph.edges() if self.graph else []
             },
             'available_colors': self.available_colors,
-            'node_colors': self.node_colors,
+            'node_colors': self.node_colors.tolist(),
             'moves': self.moves,
             'hints_used': self.hints_used,
-            'solution': self.solution
+            'version': self.version,
+            'min_colors': self.min_colors,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'solution': self.solution.tolist() if self.solution is not None else None,
+            'completion': self.completion.tolist() if self.completion is not None else None,
+            'positions': self.positions.tolist() if self.positions is not None else None,
+            'history': {
+                'nodes': self.history.arrays()[0].tolist(),
+                'before': self.history.arrays()[1].tolist(),
+                'after': self.history.arrays()[2].tolist(),
+                'cursor': self.history.cursor
+            }
         }
         
         return json.dumps(state)
     
+    def to_bytes(self, include_solution=True):
+        """
+        Encode the game state in the compact binary format used for storage.
+        
+        Layout: a fixed header (magic, flags, counts, times in microseconds),
+        then node positions as raw float32 (plenty for drawing), the graph
+        as varint-coded neighbor gaps (see utils.codec), and the player's
+        colors, the solution and the completion packed two nodes per byte.
+        The completion is left out while it is the solution. The move log
+        comes last: its size and cursor, the nodes as raw int32, and each
+        entry's before and after colors packed into one byte.
+        
+        Args:
+            include_solution: False for the copy sent to the player, which
+                leaves out the solution and the completion
+        """
+        num_nodes = self.graph.num_nodes if self.graph else 0
+        flags = 0
+        sections = []
+        
+        if self.positions is not None:
+            flags |= HAS_POSITIONS
+            sections.append(np.ascontiguousarray(self.positions, dtype='<f4').tobytes())
+        graph_bytes = encode_graph(self.graph).tobytes() if self.graph else b''
+        sections.append(graph_bytes)
+        sections.append(pack_colors(self.node_colors).tobytes())
+        if include_solution and self.solution is not None:
+            flags |= HAS_SOLUTION
+            sections.append(pack_colors(self.solution).tobytes())
+        if include_solution and self.completion is not None and self.completion is not self.solution:
+            flags |= HAS_COMPLETION
+            sections.append(pack_colors(self.completion).tobytes())
+        
+        flags |= (HAS_START if self.start_time else 0) | (HAS_END if self.end_time else 0)
+        header = STATE_HEADER.pack(
+            STATE_MAGIC, flags, len(self.available_colors), self.min_colors or 0, num_nodes,
+            self.graph.num_edges if self.graph else 0,
+            self.moves, self.hints_used, self.version,
+            _to_micros(self.start_time), _to_micros(self.end_time), len(graph_bytes)
+        )
+        nodes, before, after = self.history.arrays()
+        sections.append(HISTORY_HEADER.pack(len(nodes), self.history.cursor))
+        sections.append(nodes.astype('<i4').tobytes())
+        sections.append(pack_colors(np.column_stack([before, after]).ravel()).tobytes())
+        
+        return header + b''.join(sections)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Create a game state from to_bytes() output.
+        
+        Positions are a read-only view into data; nothing else is copied
+        more than once.
+        
+        Raises:
+            ValueError: If data isn't a valid encoded state
+        """
+        buffer = memoryview(data)
+        if len(buffer) < STATE_HEADER.size:
+            raise ValueError("Encoded game state is truncated")
+        (magic, flags, num_colors, min_colors, num_nodes, num_edges, moves, hints_used, version,
+         start, end, graph_size) = STATE_HEADER.unpack_from(buffer)
+        if magic != STATE_MAGIC:
+            raise ValueError("Not an encoded game state")
+        
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        offset = STATE_HEADER.size
+        
+        def take(size):
+            nonlocal offset
+            if offset + size > len(raw):
+                raise ValueError("Encoded game state is truncated")
+            offset += size
+            return raw[offset - size:offset]
+        
+        game_state = cls()
+        game_state.available_colors = game_state._generate_colors(num_colors)
+        if flags & HAS_POSITIONS:
+            game_state.positions = take(8 * num_nodes).view('<f4').reshape(num_nodes, 2)
+        if num_nodes:
+            game_state.graph = decode_graph(take(graph_size), num_nodes, num_edges)
+        
+        packed_size = (num_nodes + 1) // 2
+        game_state.node_colors = unpack_colors(take(packed_size), num_nodes)
+        if flags & HAS_SOLUTION:
+            game_state.solution = unpack_colors(take(packed_size), num_nodes)
+        game_state.completion = (unpack_colors(take(packed_size), num_nodes)
+                                 if flags & HAS_COMPLETION else game_state.solution)
+        
+        # States written before the move log was added end here
+        if offset < len(raw):
+            size, cursor = HISTORY_HEADER.unpack_from(take(HISTORY_HEADER.size))
+            nodes = take(4 * size).view('<i4')
+            entries = unpack_colors(take(size), 2 * size)
+            game_state.history = MoveLog.from_arrays(nodes, entries[0::2], entries[1::2], cursor)
+        
+        game_state._init_constraints()
+        game_state.moves = moves
+        game_state.hints_used = hints_used
+        game_state.version = version
+        game_state.min_colors = min_colors or None
+        game_state.start_time = _from_micros(start) if flags & HAS_START else None
+        game_state.end_time = _from_micros(end) if flags & HAS_END else None
+        
+        return game_state
+    
     @classmethod
     def from_json(cls, json_data):
         """Create a game state from JSON data"""
@@ -164,23 +495,42 @@ class GameState:
         data = json.loads(json_data)
         
         # Recreate graph from serialized data
-        graph = nx.Graph()
-        graph.add_nodes_from(data['graph']['nodes'])
-        graph.add_edges_from(data['graph']['edges'])
+        graph = CompactGraph.from_edges(data['graph']['num_nodes'], data['graph']['edges'])
         
         # Create game state
         game_state = cls()
         game_state.graph = graph
         game_state.available_colors = data['available_colors']
-        
-        # Convert node_colors keys back to integers
-        game_state.node_colors = {int(k) if k.isdigit() else k: v for k, v in data['node_colors'].items()}
+        game_state.node_colors = np.array(data['node_colors'], dtype=np.int8)
+        game_state._init_constraints()
         game_state.moves = data.get('moves', 0)
         game_state.hints_used = data.get('hints_used', 0)
-        game_state.solution = data.get('solution')
-        
-        # Convert solution keys to integers if they exist
-        if game_state.solution:
-            game_state.solution = {int(k) if k.isdigit() else k: v for k, v in game_state.solution.items()}
+        game_state.version = data.get('version', 0)
+        game_state.min_colors = data.get('min_colors')
+        if data.get('start_time'):
+            game_state.start_time = datetime.datetime.fromisoformat(data['start_time'])
+        if data.get('end_time'):
+            game_state.end_time = datetime.datetime.fromisoformat(data['end_time'])
+        if data.get('solution') is not None:
+            game_state.solution = np.array(data['solution'], dtype=np.int8)
+        if data.get('positions') is not None:
+            game_state.positions = np.array(data['positions'], dtype=np.float64)
+        if data.get('completion') is not None:
+            game_state.completion = np.array(data['completion'], dtype=np.int8)
+        else:
+            game_state.completion = game_state.solution
+        if data.get('history'):
+            history = data['history']
+            game_state.history = MoveLog.from_arrays(history['nodes'], history['before'],
+                                                     history['after'], history['cursor'])
         
-        return game_state
\ No newline at end of file
+        return game_state
+
+
+def _to_micros(moment):
+    """Naive datetime as microseconds since 1970 (0 for None)"""
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1) if moment else 0
+
+
+def _from_micros(micros):
+    return EPOCH + datetime.timedelta(microseconds=micros)
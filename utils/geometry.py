@@ -0,0 +1,284 @@
+import numpy as np
+
+
+def knn(points, k):
+    """
+    Find the k nearest neighbors of every point.
+
+    Points are bucketed into a uniform grid and each point is compared only
+    with the points in its own and the eight surrounding cells. Any point
+    whose k-th neighbor might lie outside that block is re-checked against
+    all points, so the result is exact.
+
+    Args:
+        points: Array of shape (n, 2)
+        k: Number of neighbors per point (capped at n - 1)
+
+    Returns:
+        numpy.ndarray: Neighbor indices, shape (n, k), nearest first
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.int64)
+    if n <= 256:
+        return _knn_brute(points, np.arange(n), k)
+
+    # Size cells to hold about 2(k + 1) points, which makes the k-th neighbor
+    # almost always closer than one cell width
+    lo = points.min(axis=0)
+    span = float((points.max(axis=0) - lo).max()) or 1.0
+    side = max(1, int(np.sqrt(n / (2 * (k + 1)))))
+    cell = span / side
+
+    grid = np.minimum(((points - lo) / cell).astype(np.int64), side - 1)
+    cell_ids = grid[:, 0] * side + grid[:, 1]
+
+    # Padded (cell -> point indices) table, -1 marks empty slots
+    order = np.argsort(cell_ids, kind='stable')
+    counts = np.bincount(cell_ids, minlength=side * side)
+    starts = np.cumsum(counts) - counts
+    sorted_ids = cell_ids[order]
+    table = np.full((side * side, counts.max()), -1, dtype=np.int64)
+    table[sorted_ids, np.arange(n) - starts[sorted_ids]] = order
+
+    # Candidates of a cell are the points in the 3x3 block of cells around it
+    cx, cy = np.divmod(np.arange(side * side), side)
+    blocks = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            gx, gy = cx + dx, cy + dy
+            valid = (gx >= 0) & (gx < side) & (gy >= 0) & (gy < side)
+            block = table[np.where(valid, gx * side + gy, 0)]
+            block[~valid] = -1
+            blocks.append(block)
+    cell_candidates = np.concatenate(blocks, axis=1)
+
+    # Move empty slots to the end of each row and trim the common padding
+    cell_candidates = -np.sort(-cell_candidates, axis=1)
+    cell_candidates = cell_candidates[:, :(cell_candidates >= 0).sum(axis=1).max()]
+    candidates = cell_candidates[cell_ids]
+
+    xs, ys = np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1])
+    dx = xs[candidates] - xs[:, None]
+    dy = ys[candidates] - ys[:, None]
+    dist = dx * dx + dy * dy
+    dist[(candidates < 0) | (candidates == np.arange(n)[:, None])] = np.inf
+
+    positions = _nearest_positions(dist, k)
+    result = candidates[np.arange(n)[:, None], positions]
+
+    # A k-th neighbor farther than one cell away may have been missed
+    kth = dist[np.arange(n), positions[:, -1]]
+    unsure = np.flatnonzero(kth > cell * cell)
+    if len(unsure):
+        result[unsure] = _knn_brute(points, unsure, k)
+
+    return result
+
+
+def _nearest_positions(dist, k):
+    """Column positions of the k smallest entries per row, nearest first"""
+    part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    rows = np.arange(len(dist))[:, None]
+    return part[rows, np.argsort(dist[rows, part], axis=1, kind='stable')]
+
+
+def _knn_brute(points, rows, k, chunk=512):
+    """Exact k nearest neighbors for the given rows against all points"""
+    result = np.empty((len(rows), k), dtype=np.int64)
+    for start in range(0, len(rows), chunk):
+        batch = rows[start:start + chunk]
+        diff = points[None, :, :] - points[batch, None, :]
+        dist = np.einsum('ijk,ijk->ij', diff, diff)
+        dist[np.arange(len(batch)), batch] = np.inf
+        result[start:start + chunk] = _nearest_positions(dist, k)
+    return result
+
+
+def delaunay(points):
+    """
+    Delaunay triangulation (SciPy's Qhull wrapper).
+
+    The triangles come out in a canonical order, so generated maps don't
+    depend on the order Qhull happens to report them in.
+
+    Args:
+        points: Array of shape (n, 2) with distinct points
+
+    Returns:
+        numpy.ndarray: Triangles as vertex indices, shape (t, 3), counter-clockwise;
+        empty when the points are all on one line
+    """
+    # Imported on first use, so app startup doesn't pay for SciPy
+    from scipy.spatial import Delaunay
+
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 3:
+        return np.empty((0, 3), dtype=np.int64)
+
+    try:
+        triangles = Delaunay(points).simplices.astype(np.int64)
+    except (RuntimeError, ValueError):  # Qhull errors subclass RuntimeError
+        # Only degenerate (collinear) input is rejected, and it has no triangles
+        return np.empty((0, 3), dtype=np.int64)
+    return _canonical_triangles(points, triangles)
+
+
+def _canonical_triangles(points, triangles):
+    """Triangles turned counter-clockwise, rotated to start at their lowest vertex and sorted"""
+    a, b, c = (points[triangles[:, i]] for i in range(3))
+    clockwise = ((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])
+                 - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])) < 0
+    triangles = triangles.copy()
+    triangles[clockwise] = triangles[clockwise][:, ::-1]
+    shift = triangles.argmin(axis=1)
+    triangles = triangles[np.arange(len(triangles))[:, None], (shift[:, None] + np.arange(3)) % 3]
+    return triangles[np.lexsort(triangles.T[::-1])]
+
+
+def circumcenters(points, triangles):
+    """Circumcenter of every triangle, shape (t, 2)"""
+    a, b, c = (points[triangles[:, i]] for i in range(3))
+    bx, by = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+    cx, cy = c[:, 0] - a[:, 0], c[:, 1] - a[:, 1]
+    d = 2 * (bx * cy - by * cx)
+    b2, c2 = bx * bx + by * by, cx * cx + cy * cy
+    ux = (cy * b2 - by * c2) / d
+    uy = (bx * c2 - cx * b2) / d
+    return np.stack([a[:, 0] + ux, a[:, 1] + uy], axis=1)
+
+
+def voronoi_adjacency(points, triangles, bounds=(0.0, 0.0, 1.0, 1.0)):
+    """
+    Pairs of points whose Voronoi cells share an edge inside a bounding box.
+
+    Every Delaunay edge is a candidate. Its Voronoi edge runs between the
+    circumcenters of the two triangles on either side, or from the single
+    circumcenter outwards for edges on the convex hull. Only Voronoi edges
+    that cross the box are kept.
+
+    Args:
+        points: Array of shape (n, 2)
+        triangles: Delaunay triangles from delaunay()
+        bounds: (xmin, ymin, xmax, ymax) of the map
+
+    Returns:
+        numpy.ndarray: Edges as an (m, 2) array with u < v
+    """
+    n = len(points)
+    if not len(triangles):
+        return np.empty((0, 2), dtype=np.int64)
+
+    centers = circumcenters(points, triangles)
+
+    # Directed edge k of a triangle is opposite vertex k
+    a = triangles[:, [1, 2, 0]].ravel()
+    b = triangles[:, [2, 0, 1]].ravel()
+    opposite = triangles.ravel()
+    owner = np.repeat(np.arange(len(triangles)), 3)
+
+    keys = np.minimum(a, b) * n + np.maximum(a, b)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    first_edge = order[first]
+
+    start = centers[owner[first_edge]]
+    end = np.empty_like(start)
+
+    shared = counts == 2
+    end[shared] = centers[owner[order[first[shared] + 1]]]
+
+    # Hull edges: a ray from the circumcenter, perpendicular to the edge and
+    # pointing away from the triangle's third vertex
+    hull = first_edge[~shared]
+    pa, pb, po = points[a[hull]], points[b[hull]], points[opposite[hull]]
+    direction = np.stack([pb[:, 1] - pa[:, 1], pa[:, 0] - pb[:, 0]], axis=1)
+    inward = np.einsum('ij,ij->i', direction, po - (pa + pb) / 2) > 0
+    direction[inward] *= -1
+    direction /= np.linalg.norm(direction, axis=1)[:, None]
+    reach = 2 * max(bounds[2] - bounds[0], bounds[3] - bounds[1]) + np.abs(start[~shared]).max()
+    end[~shared] = start[~shared] + direction * reach
+
+    keep = _segments_cross_box(start, end, bounds)
+    edges = np.stack([a[first_edge], b[first_edge]], axis=1)[keep]
+    return np.sort(edges, axis=1)
+
+
+def _segments_cross_box(start, end, bounds):
+    """Liang-Barsky test: does each segment have positive length inside the box"""
+    xmin, ymin, xmax, ymax = bounds
+    delta = end - start
+    t0 = np.zeros(len(start))
+    t1 = np.ones(len(start))
+    inside = np.ones(len(start), dtype=bool)
+
+    for p, q in ((-delta[:, 0], start[:, 0] - xmin), (delta[:, 0], xmax - start[:, 0]),
+                 (-delta[:, 1], start[:, 1] - ymin), (delta[:, 1], ymax - start[:, 1])):
+        parallel = p == 0
+        inside &= ~(parallel & (q < 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = q / p
+        t0 = np.where(p < 0, np.maximum(t0, r), t0)
+        t1 = np.where(p > 0, np.minimum(t1, r), t1)
+
+    return inside & (t0 < t1 - 1e-12)
+
+
+def voronoi_regions(points, triangles, bounds=(0.0, 0.0, 1.0, 1.0)):
+    """
+    Voronoi cell polygons clipped to a bounding box.
+
+    A cell is the box cut by the bisector half-plane of each Delaunay neighbor.
+
+    Args:
+        points: Array of shape (n, 2)
+        triangles: Delaunay triangles from delaunay()
+        bounds: (xmin, ymin, xmax, ymax) of the map
+
+    Returns:
+        list: One (k, 2) array of polygon vertices (CCW) per point
+    """
+    xmin, ymin, xmax, ymax = bounds
+    box = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+
+    neighbors = [set() for _ in range(len(points))]
+    for a, b, c in np.asarray(triangles).tolist():
+        neighbors[a].update((b, c))
+        neighbors[b].update((a, c))
+        neighbors[c].update((a, b))
+
+    coords = points.tolist()
+    regions = []
+    for i, (px, py) in enumerate(coords):
+        polygon = box
+        for j in sorted(neighbors[i]):
+            qx, qy = coords[j]
+            # Keep x with (q - p) . x <= (|q|^2 - |p|^2) / 2
+            nx, ny = qx - px, qy - py
+            limit = (qx * qx + qy * qy - px * px - py * py) / 2
+            polygon = _clip_half_plane(polygon, nx, ny, limit)
+            if not polygon:
+                break
+        regions.append(np.array(polygon, dtype=np.float64).reshape(-1, 2))
+
+    return regions
+
+
+def _clip_half_plane(polygon, nx, ny, limit):
+    """Sutherland-Hodgman clip of a polygon to nx * x + ny * y <= limit"""
+    clipped = []
+    count = len(polygon)
+    for k in range(count):
+        x1, y1 = polygon[k]
+        x2, y2 = polygon[(k + 1) % count]
+        s1 = nx * x1 + ny * y1 - limit
+        s2 = nx * x2 + ny * y2 - limit
+        if s1 <= 0:
+            clipped.append((x1, y1))
+        if (s1 < 0 < s2) or (s2 < 0 < s1):
+            t = s1 / (s1 - s2)
+            clipped.append((x1 + t * (x2 - x1), y1 + t * (y2 - y1)))
+    return clipped
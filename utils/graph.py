@@ -1,71 +1,49 @@
-import networkx as nx
 import random
 import math
 import numpy as np
 
-def create_planar_graph(num_nodes, map_type="random"):
+from utils.compact_graph import CompactGraph
+from utils.geometry import knn, delaunay, voronoi_adjacency, voronoi_regions
+from utils.solver import solve_coloring, COLORABLE
+
+def create_planar_graph(num_nodes, map_type="random", seed=None):
     """
     Create a planar graph representing a map with regions.
     
     Args:
         num_nodes: Number of nodes (regions) to create
         map_type: Type of map to generate ("random", "grid", "voronoi")
+        seed: Seed for the generator; the same seed gives the same map
+            (None = seed from the random module)
         
     Returns:
-        graph: NetworkX graph
-        positions: Dictionary of node positions
+        graph: CompactGraph
+        positions: Array of node positions, shape (num_nodes, 2)
     """
     if map_type == "grid":
         return create_grid_graph(num_nodes)
     elif map_type == "voronoi":
-        return create_voronoi_graph(num_nodes)
+        return create_voronoi_graph(num_nodes, seed=seed)
     else:  # Default to random planar graph
-        return create_random_planar_graph(num_nodes)
+        return create_random_planar_graph(num_nodes, seed=seed)
 
-def create_random_planar_graph(num_nodes):
+def create_random_planar_graph(num_nodes, seed=None):
     """Create a random planar graph"""
-    # Create random points for a Delaunay triangulation
-    points = []
-    for _ in range(num_nodes):
-        # Generate points within a unit square with some margin
-        x = 0.1 + 0.8 * random.random()  # Keep away from edges
-        y = 0.1 + 0.8 * random.random()
-        points.append((x, y))
-    
-    # Create a graph
-    graph = nx.Graph()
-    
-    # Add nodes
-    for i in range(num_nodes):
-        graph.add_node(i)
-    
-    # Create positions dictionary
-    positions = {i: (x, y) for i, (x, y) in enumerate(points)}
-    
-    # Add edges based on proximity
-    for i in range(num_nodes):
-        # Find the 3-5 nearest neighbors for each node
-        neighbors = []
-        for j in range(num_nodes):
-            if i != j:
-                x1, y1 = points[i]
-                x2, y2 = points[j]
-                dist = math.sqrt((x2-x1)**2 + (y2-y1)**2)
-                neighbors.append((j, dist))
-        
-        # Sort by distance and connect to 2-4 nearest neighbors
-        neighbors.sort(key=lambda x: x[1])
-        connections = random.randint(2, min(4, len(neighbors)))
-        for j in range(connections):
-            graph.add_edge(i, neighbors[j][0])
-    
-    # Ensure the graph is connected
-    if not nx.is_connected(graph):
-        components = list(nx.connected_components(graph))
-        for i in range(len(components) - 1):
-            node1 = random.choice(list(components[i]))
-            node2 = random.choice(list(components[i+1]))
-            graph.add_edge(node1, node2)
+    rng = _numpy_rng(seed)
+    
+    # Generate points within a unit square with some margin (keep away from edges)
+    positions = 0.1 + 0.8 * rng.random((num_nodes, 2))
+    if num_nodes < 2:
+        return CompactGraph.from_edges(num_nodes, []), positions
+    
+    # Connect each node to its 2-4 nearest neighbors
+    nearest = knn(positions, 4)
+    connections = rng.integers(2, min(4, num_nodes - 1) + 1, size=num_nodes)
+    keep = np.arange(nearest.shape[1]) < connections[:, None]
+    sources = np.broadcast_to(np.arange(num_nodes)[:, None], nearest.shape)
+    edges = np.stack([sources[keep], nearest[keep]], axis=1)
+    
+    graph = _connect_components(CompactGraph.from_edges(num_nodes, edges), edges, rng)
     
     return graph, positions
 
@@ -74,91 +52,98 @@ def create_grid_graph(num_nodes):
     # Determine dimensions for a roughly square grid
     side = math.ceil(math.sqrt(num_nodes))
     
-    # Create a grid graph
-    grid = nx.grid_2d_graph(side, side)
+    # Node i sits at row i // side, column i % side (row-major, first num_nodes cells)
+    ids = np.arange(num_nodes)
+    rows, cols = ids // side, ids % side
     
-    # Convert to a simple graph with integer nodes
-    graph = nx.Graph()
-    node_mapping = {}
-    
-    for i, node in enumerate(list(grid.nodes())[:num_nodes]):
-        node_mapping[node] = i
-        graph.add_node(i)
-    
-    # Add edges
-    for u, v in grid.edges():
-        if u in node_mapping and v in node_mapping:
-            graph.add_edge(node_mapping[u], node_mapping[v])
+    # Connect each cell to the cell below and to the right, if present
+    down = ids[ids + side < num_nodes]
+    right = ids[(cols + 1 < side) & (ids + 1 < num_nodes)]
+    edges = np.concatenate([
+        np.stack([down, down + side], axis=1),
+        np.stack([right, right + 1], axis=1)
+    ])
+    graph = CompactGraph.from_edges(num_nodes, edges)
     
     # Position nodes in a grid layout
-    positions = {}
-    for (x, y), i in node_mapping.items():
-        positions[i] = (x / (side - 1), y / (side - 1))
+    scale = max(side - 1, 1)
+    positions = np.stack([rows / scale, cols / scale], axis=1)
     
     return graph, positions
 
-def create_voronoi_graph(num_nodes):
-    """Create a Voronoi-based graph (more map-like)"""
-    # Generate random points
-    points = []
-    for _ in range(num_nodes):
-        x = 0.1 + 0.8 * random.random()
-        y = 0.1 + 0.8 * random.random()
-        points.append((x, y))
-    
-    # Create graph
-    graph = nx.Graph()
-    
-    # Add nodes
-    for i in range(num_nodes):
-        graph.add_node(i)
-    
-    # Create positions dictionary
-    positions = {i: (x, y) for i, (x, y) in enumerate(points)}
-    
-    # Compute a Delaunay triangulation to approximate Voronoi neighbors
-    # We'll use a basic approach to compute neighbors
-    for i in range(num_nodes):
-        x1, y1 = points[i]
-        # Connect to nodes that are natural neighbors in a Voronoi sense
-        for j in range(i+1, num_nodes):
-            x2, y2 = points[j]
-            dist = math.sqrt((x2-x1)**2 + (y2-y1)**2)
-            
-            # Check if there's any point closer to the midpoint than these two points
-            midpoint = ((x1+x2)/2, (y1+y2)/2)
-            is_neighbor = True
-            
-            for k in range(num_nodes):
-                if k != i and k != j:
-                    x3, y3 = points[k]
-                    dist_to_mid = math.sqrt((midpoint[0]-x3)**2 + (midpoint[1]-y3)**2)
-                    dist_to_i = math.sqrt((midpoint[0]-x1)**2 + (midpoint[1]-y1)**2)
-                    if dist_to_mid < dist_to_i:
-                        is_neighbor = False
-                        break
-            
-            # If no point is closer to the midpoint, add an edge
-            if is_neighbor and dist < 0.3:  # Limit the connection distance
-                graph.add_edge(i, j)
-    
-    # Ensure the graph is connected
-    if not nx.is_connected(graph):
-        components = list(nx.connected_components(graph))
-        for i in range(len(components) - 1):
-            node1 = random.choice(list(components[i]))
-            node2 = random.choice(list(components[i+1]))
-            graph.add_edge(node1, node2)
+def create_voronoi_graph(num_nodes, return_regions=False, seed=None):
+    """
+    Create a Voronoi-based graph (more map-like).
+    
+    Regions are the Voronoi cells of random points clipped to the unit
+    square; two regions are adjacent when their cells share a border.
     
+    Args:
+        num_nodes: Number of regions
+        return_regions: Also return the clipped cell polygons
+        seed: Seed for the generator (None = seed from the random module)
+        
+    Returns:
+        graph: CompactGraph
+        positions: Array of node positions, shape (num_nodes, 2)
+        regions: List of (k, 2) polygon arrays (only if return_regions)
+    """
+    rng = _numpy_rng(seed)
+    positions = 0.1 + 0.8 * rng.random((num_nodes, 2))
+    
+    # Voronoi neighbors are the Delaunay edges whose Voronoi edge lies on the map
+    triangles = delaunay(positions)
+    edges = voronoi_adjacency(positions, triangles)
+    
+    graph = _connect_components(CompactGraph.from_edges(num_nodes, edges), edges, rng)
+    
+    if return_regions:
+        return graph, positions, voronoi_regions(positions, triangles)
     return graph, positions
 
+def _numpy_rng(seed=None):
+    """
+    NumPy generator for a seed; without one it is seeded from the random
+    module, so random.seed() still applies
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    return np.random.default_rng(seed)
+
+def _connect_components(graph, edges, rng=None):
+    """
+    Link consecutive connected components with a random edge.
+    
+    Args:
+        graph: CompactGraph built from edges
+        edges: Array or list of the (u, v) pairs the graph was built from
+        rng: NumPy generator used to pick the members to link
+        
+    Returns:
+        CompactGraph: The graph itself if already connected, otherwise a
+        connected graph with the extra edges added
+    """
+    labels = graph.connected_components()
+    num_components = int(labels.max()) + 1 if len(labels) else 0
+    if num_components <= 1:
+        return graph
+    
+    # Pick a random member of every component and chain them together
+    order = (rng or _numpy_rng()).permutation(graph.num_nodes)
+    _, first = np.unique(labels[order], return_index=True)
+    members = order[first]
+    extra = np.stack([members[:-1], members[1:]], axis=1)
+    
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    return CompactGraph.from_edges(graph.num_nodes, np.concatenate([edges, extra]))
+
 def is_valid_coloring(graph, node_colors, node, color):
     """
     Check if coloring a node with a specific color is valid.
     
     Args:
-        graph: NetworkX graph
-        node_colors: Dictionary mapping nodes to colors
+        graph: CompactGraph
+        node_colors: Color array (-1 means uncolored)
         node: Node to color
         color: Color index
         
@@ -166,29 +151,58 @@ def is_valid_coloring(graph, node_colors, node, color):
         bool: True if coloring is valid, False otherwise
     """
     # Check if neighbors have the same color
-    for neighbor in graph.neighbors(node):
-        if node_colors.get(neighbor) == color:
-            return False
+    return not np.any(node_colors[graph.neighbors(node)] == color)
+
+def find_conflicts(graph, colors):
+    """
+    Find every edge whose two ends share a color, in one pass over the
+    edge arrays.
+    
+    Works on a single coloring or a batch of colorings of the same graph.
+    Uncolored nodes (-1) never conflict, so partial boards can be checked
+    too.
     
-    return True
+    Args:
+        graph: CompactGraph
+        colors: Color array of shape (num_nodes,), or (boards, num_nodes)
+            for a batch
+        
+    Returns:
+        numpy.ndarray: For one coloring, the conflicting edges as a (k, 2)
+        array of (u, v) with u < v. For a batch, a (k, 3) array of
+        (board, u, v).
+        
+    Raises:
+        ValueError: If the last dimension of colors isn't num_nodes
+    """
+    colors = np.asarray(colors)
+    if colors.ndim not in (1, 2) or colors.shape[-1] != graph.num_nodes:
+        raise ValueError(f"Expected colors for {graph.num_nodes} nodes, got shape {colors.shape}")
+    
+    u, v = graph.edge_arrays()
+    colors_u = colors[..., u]
+    conflicts = (colors_u == colors[..., v]) & (colors_u >= 0)
+    
+    if colors.ndim == 1:
+        edges = np.flatnonzero(conflicts)
+        return np.stack([u[edges], v[edges]], axis=1)
+    boards, edges = np.nonzero(conflicts)
+    return np.stack([boards, u[edges], v[edges]], axis=1)
 
 def suggest_color(graph, node_colors, node):
     """
     Suggest a valid color for a node.
     
     Args:
-        graph: NetworkX graph
-        node_colors: Dictionary mapping nodes to colors
+        graph: CompactGraph
+        node_colors: Color array (-1 means uncolored)
         node: Node to suggest a color for
         
     Returns:
         int: Suggested color index or None if no color is valid
     """
     # Get colors used by neighbors
-    neighbor_colors = set()
-    for neighbor in graph.neighbors(node):
-        if node_colors.get(neighbor) is not None:
-            neighbor_colors.add(node_colors[neighbor])
+    neighbor_colors = set(node_colors[graph.neighbors(node)].tolist())
     
     # Determine available colors (assuming 4 colors are available)
     available_colors = [i for i in range(4) if i not in neighbor_colors]
@@ -198,34 +212,26 @@ def suggest_color(graph, node_colors, node):
     else:
         return None
 
-def generate_solvable_coloring(graph, num_colors=4):
+def generate_solvable_coloring(graph, num_colors=4, time_limit=None, seed=None, max_nodes=None):
     """
     Generate a valid coloring solution for the graph.
     
     Args:
-        graph: NetworkX graph
+        graph: CompactGraph
         num_colors: Number of colors to use
+        time_limit: Search budget in seconds (default: one second per
+            20,000 nodes, at least one second, unless max_nodes is given)
+        seed: Seed for the solver's choices (None = use the random module)
+        max_nodes: Search budget in assignments. With a seed and no time
+            limit the outcome is the same on every run, however busy the
+            machine is
         
     Returns:
-        dict: A valid coloring or None if not possible
+        numpy.ndarray: A valid coloring (int8 array) or None if the graph
+        isn't colorable (or no coloring was found within the budget)
     """
-    # Use the greedy coloring algorithm as a base
-    coloring = {}
-    nodes = list(graph.nodes())
-    random.shuffle(nodes)  # Randomize order for different solutions
-    
-    for node in nodes:
-        # Find colors used by neighbors
-        used_colors = {coloring[neighbor] for neighbor in graph.neighbors(node) 
-                      if neighbor in coloring}
-        
-        # Find the first available color
-        for color in range(num_colors):
-            if color not in used_colors:
-                coloring[node] = color
-                break
-        else:
-            # If we couldn't find a color, backtrack or fail
-            return None
-    
-    return coloring
\ No newline at end of file
+    if time_limit is None and max_nodes is None:
+        time_limit = max(1.0, graph.num_nodes / 20000)
+    rng = random.Random(seed) if seed is not None else None
+    result = solve_coloring(graph, num_colors, max_nodes=max_nodes, time_limit=time_limit, rng=rng)
+    return result.coloring if result.status == COLORABLE else None
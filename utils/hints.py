@@ -0,0 +1,205 @@
+import time
+
+import numpy as np
+
+from utils.solver import solve_coloring, COLORABLE, UNCOLORABLE, UNKNOWN
+
+# Hint kinds
+MOVE = 'move'          # Color node with color; the board stays solvable
+UNDO = 'undo'          # The board can't be finished; clear node first
+TIMEOUT = 'timeout'    # No answer within the latency budget
+
+# Default latency budget per hint, in seconds
+DEFAULT_HINT_BUDGET = 0.05
+
+# Radii (in hops around the disagreements) tried before re-solving everything
+REPAIR_HOPS = (2, 4, 8)
+
+
+class Hint:
+    """A hint for the player"""
+
+    __slots__ = ('kind', 'node', 'color')
+
+    def __init__(self, kind, node=None, color=None):
+        self.kind = kind
+        self.node = node
+        self.color = color
+
+    def __repr__(self):
+        return f"Hint({self.kind}, node={self.node}, color={self.color})"
+
+
+def find_hint(game_state, time_budget=DEFAULT_HINT_BUDGET):
+    """
+    Find a move that keeps the board solvable, or a node that must be undone.
+
+    The game state caches a full coloring (game_state.completion) that agrees
+    with every color the player has placed, and hints are read straight from
+    it while it stays consistent. When the player departs from it:
+
+    1. Only the free nodes around the disagreements are re-solved, with the
+       rest of the cached coloring held fixed. Separate patches of trouble
+       are repaired one by one.
+    2. If that fails, the same area plus its placed neighbors is solved on
+       its own. Dropping the free nodes outside it only makes the problem
+       easier, so if even this can't be colored, the board is stuck and a
+       node to undo is searched for near the trouble.
+    3. Otherwise the area is widened and both steps repeated, and only as a
+       last resort is the whole board re-solved from the player's colors.
+
+    Args:
+        game_state: GameState to hint for
+        time_budget: Seconds to spend at most
+
+    Returns:
+        Hint: The hint, or None if the board is already complete
+    """
+    deadline = time.perf_counter() + time_budget
+    node = game_state.most_constrained_node()
+    if node is None:
+        return None
+
+    colors = game_state.node_colors
+    placed = colors >= 0
+    cached = game_state.completion
+
+    if np.array_equal(cached[placed], colors[placed]):
+        return Hint(MOVE, node, int(cached[node]))
+
+    graph = game_state.graph
+    completion = cached.copy()
+    completion[placed] = colors[placed]
+
+    # Each connected patch of trouble is repaired on its own, so one hard
+    # spot doesn't hold up the rest of the board
+    for hops in REPAIR_HOPS:
+        trouble = _clashes(graph, completion)
+        if not trouble.any():
+            break
+        if _remaining(deadline) <= 0:
+            return Hint(TIMEOUT)
+        region = graph.expand(trouble, hops=hops)
+        subgraph, nodes = graph.subgraph(region)
+        labels = subgraph.connected_components()
+        for label in range(labels.max() + 1):
+            if _remaining(deadline) <= 0:
+                return Hint(TIMEOUT)
+            area = np.zeros(len(colors), dtype=bool)
+            area[nodes[labels == label]] = True
+            status, repaired = _repair(game_state, completion, area & ~placed, deadline)
+            if status == COLORABLE:
+                completion = repaired
+                continue
+            # Proving the area stuck takes time of its own
+            if _remaining(deadline) <= 0:
+                return Hint(TIMEOUT)
+            if _locally_stuck(game_state, area, deadline):
+                return _find_undo(game_state, completion, area, deadline)
+
+    if _clashes(graph, completion).any():
+        # Setting up a whole-board search alone costs a good part of the budget
+        if _remaining(deadline) < time_budget / 2:
+            return Hint(TIMEOUT)
+        result = solve_coloring(graph, len(game_state.available_colors),
+                                fixed=colors, time_limit=_remaining(deadline))
+        if result.status == UNCOLORABLE:
+            return _find_undo(game_state, completion, region, deadline)
+        if result.status != COLORABLE:
+            return Hint(TIMEOUT)
+        completion = result.coloring
+
+    game_state.completion = completion
+    return Hint(MOVE, node, int(completion[node]))
+
+
+def _repair(game_state, candidate, free, deadline):
+    """
+    Re-solve the free nodes with the rest of candidate fixed.
+
+    Returns:
+        tuple: (status, coloring or None). The status is UNCOLORABLE if the
+        free nodes can't be colored around the fixed ones, and UNKNOWN if
+        time ran out first
+    """
+    if _remaining(deadline) <= 0:
+        return UNKNOWN, None
+
+    # Only the free nodes and their neighbors matter; the rest stays as is
+    graph = game_state.graph
+    subgraph, nodes = graph.subgraph(graph.expand(free))
+    fixed = candidate[nodes]
+    fixed[free[nodes]] = -1
+    result = solve_coloring(subgraph, len(game_state.available_colors), fixed=fixed,
+                            time_limit=_remaining(deadline) / 4)
+    if result.status != COLORABLE:
+        return result.status, None
+
+    completion = candidate.copy()
+    completion[nodes] = result.coloring
+    return COLORABLE, completion
+
+
+def _locally_stuck(game_state, region, deadline):
+    """True if the region and its placed neighbors alone can't be colored"""
+    colors = game_state.node_colors
+    area = region | (game_state.graph.expand(region) & (colors >= 0))
+    subgraph, nodes = game_state.graph.subgraph(area)
+    result = solve_coloring(subgraph, len(game_state.available_colors), fixed=colors[nodes],
+                            time_limit=_remaining(deadline) / 4)
+    return result.status == UNCOLORABLE
+
+
+def _find_undo(game_state, candidate, region, deadline):
+    """Pick a placed node whose removal makes the board solvable again"""
+    colors = game_state.node_colors
+    placed = colors >= 0
+
+    # Placed nodes in the trouble area come first, then the ones that
+    # disagree with the stored solution. Clearing all of the latter always
+    # works, because the solution completes the rest. Within each group the
+    # move log puts the most recently placed nodes first: the player is
+    # likelier to have gone wrong lately, and those are the cheapest to undo
+    recency = -game_state.history.last_changed(len(colors))
+    culprits = np.flatnonzero(placed & (colors != game_state.solution))
+    culprits = culprits[np.argsort(recency[culprits], kind='stable')].tolist()
+    suspects = np.flatnonzero(region & placed)
+    suspects = suspects[np.argsort(recency[suspects], kind='stable')].tolist()
+
+    for node in dict.fromkeys(suspects + culprits):
+        if _remaining(deadline) <= 0:
+            break
+        trial = candidate.copy()
+        trial[node] = game_state.completion[node]
+        free = game_state.graph.expand(region | _mask(len(colors), node)) & ~placed
+        free[node] = True
+        status, completion = _repair(game_state, trial, free, deadline)
+        if status == COLORABLE:
+            # Other trouble spots may still be unresolved in this coloring
+            if not _clashes(game_state.graph, completion).any():
+                game_state.completion = completion
+            return Hint(UNDO, int(node))
+
+    if culprits:
+        return Hint(UNDO, int(culprits[0]))
+    return Hint(TIMEOUT)
+
+
+def _clashes(graph, coloring):
+    """Boolean array of the nodes that share a color with a neighbor"""
+    u, v = graph.edge_arrays()
+    clash = coloring[u] == coloring[v]
+    nodes = np.zeros(graph.num_nodes, dtype=bool)
+    nodes[u[clash]] = True
+    nodes[v[clash]] = True
+    return nodes
+
+
+def _mask(size, node):
+    mask = np.zeros(size, dtype=bool)
+    mask[node] = True
+    return mask
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.perf_counter())
@@ -0,0 +1,168 @@
+import bisect
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (upper bounds, Prometheus style)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations, split by label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget every observation"""
+        with self._lock:
+            self._series.clear()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        """Prometheus text exposition lines"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+
+        for labels, values in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"'
+                                  for name, value in zip(self.label_names, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += values[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{self.name}_sum{suffix} {values[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """
+    Registry of the app's metrics: per-route request latency, time spent in
+    each phase of request handling (generation, solving, state load/save,
+    JSON encoding, session cookie) and gauges read at scrape time.
+    """
+
+    def __init__(self, prefix='graph_coloring'):
+        self.prefix = prefix
+        self.requests = Histogram(f'{prefix}_request_duration_seconds',
+                                  'Request latency by route', ('route', 'method', 'status'))
+        self.phases = Histogram(f'{prefix}_phase_duration_seconds',
+                                'Time spent in each phase of request handling', ('phase',))
+        self._gauges = []
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one occurrence of a phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.observe(time.perf_counter() - start, name)
+
+    def reset(self):
+        """Forget all request and phase timings (gauges are read live)"""
+        self.requests.reset()
+        self.phases.reset()
+
+    def gauge(self, name, help_text, label_names, callback):
+        """
+        Register a gauge whose values are read when metrics are rendered.
+
+        Args:
+            callback: Returns an iterable of (label values tuple, value)
+        """
+        self._gauges.append((f'{self.prefix}_{name}', help_text, tuple(label_names), callback))
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        lines = self.requests.render() + self.phases.render()
+        for name, help_text, label_names, callback in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, value in callback():
+                label_text = ','.join(f'{label}="{_escape(v)}"' for label, v in zip(label_names, labels))
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestProfiler:
+    """
+    Opt-in cProfile sampling of live requests.
+
+    A sampled request runs under cProfile, and its profile is written to
+    directory if it took at least min_seconds. Load the files with pstats or
+    snakeviz.
+    """
+
+    def __init__(self, directory=None, sample_rate=0.0, min_seconds=0.0):
+        self.directory = directory
+        self.sample_rate = sample_rate if directory else 0.0
+        self.min_seconds = min_seconds
+        if self.sample_rate > 0:
+            os.makedirs(directory, exist_ok=True)
+            # Only loaded when profiling is on, to keep it off the import path
+            import cProfile
+            self._profile = cProfile.Profile
+
+    def start(self):
+        """Return a running profiler if this request is sampled, else None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profiler = self._profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another request in this process is already being profiled
+            return None
+        return profiler
+
+    def finish(self, profiler, route, seconds):
+        """Stop a profiler and write its profile if the request was slow enough"""
+        profiler.disable()
+        if seconds < self.min_seconds:
+            return
+        name = route.strip('/').replace('/', '_') or 'index'
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f'{stamp}-{name}-{int(seconds * 1000)}ms-{os.getpid()}.prof')
+        profiler.dump_stats(path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide registry
+metrics = Metrics()
+
+
+def create_profiler():
+    """
+    Create the request profiler from the environment: PROFILE_DIR,
+    PROFILE_SAMPLE_RATE (fraction of requests, default 0 = off) and
+    PROFILE_MIN_MS (only keep profiles of requests at least this slow)
+    """
+    return RequestProfiler(
+        os.environ.get('PROFILE_DIR'),
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        min_seconds=float(os.environ.get('PROFILE_MIN_MS', 0)) / 1000
+    )
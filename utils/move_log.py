@@ -0,0 +1,140 @@
+import numpy as np
+
+# Entries between the snapshots colors_at() keeps
+SNAPSHOT_INTERVAL = 256
+
+
+class MoveLog:
+    """
+    Append-only log of color changes, with an undo cursor.
+
+    Entry i set nodes[i] from before[i] to after[i] (-1 = uncolored). The
+    first `cursor` entries are in effect; the ones after it were undone
+    and can be redone until a new entry is appended, which drops them (as
+    in an editor). Undo and redo touch a single entry, and appending grows
+    the arrays by doubling, so all three are O(1) amortized.
+
+    The board after any prefix of the log is rebuilt by colors_at(). It
+    keeps a copy of the board every SNAPSHOT_INTERVAL entries as it
+    replays, so later rebuilds start from the nearest snapshot.
+    """
+
+    __slots__ = ('nodes', 'before', 'after', 'size', 'cursor', '_snapshots')
+
+    def __init__(self, capacity=64):
+        self.nodes = np.zeros(capacity, dtype=np.int32)
+        self.before = np.zeros(capacity, dtype=np.int8)
+        self.after = np.zeros(capacity, dtype=np.int8)
+        self.size = 0
+        self.cursor = 0
+        self._snapshots = {}  # entry index -> coloring after that many entries
+
+    @classmethod
+    def from_arrays(cls, nodes, before, after, cursor):
+        """Rebuild a log from its entries (see arrays())"""
+        log = cls(max(len(nodes), 64))
+        log.size = len(nodes)
+        log.nodes[:log.size] = nodes
+        log.before[:log.size] = before
+        log.after[:log.size] = after
+        log.cursor = min(max(int(cursor), 0), log.size)
+        return log
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def can_undo(self):
+        return self.cursor > 0
+
+    @property
+    def can_redo(self):
+        return self.cursor < self.size
+
+    def append(self, node, before, after):
+        """Record a change, dropping any undone entries"""
+        self.truncate(self.cursor)
+        if self.size == len(self.nodes):
+            for name in ('nodes', 'before', 'after'):
+                array = getattr(self, name)
+                grown = np.zeros(2 * len(array), dtype=array.dtype)
+                grown[:self.size] = array
+                setattr(self, name, grown)
+
+        self.nodes[self.size] = node
+        self.before[self.size] = before
+        self.after[self.size] = after
+        self.size += 1
+        self.cursor = self.size
+
+    def undo(self):
+        """Step back one entry; returns (node, color to restore) or None"""
+        if not self.can_undo:
+            return None
+        self.cursor -= 1
+        return int(self.nodes[self.cursor]), int(self.before[self.cursor])
+
+    def redo(self):
+        """Step forward one entry; returns (node, color to set) or None"""
+        if not self.can_redo:
+            return None
+        self.cursor += 1
+        return int(self.nodes[self.cursor - 1]), int(self.after[self.cursor - 1])
+
+    def truncate(self, size):
+        """Forget the entries from index size on"""
+        if size >= self.size:
+            return
+        self.size = size
+        self.cursor = min(self.cursor, size)
+        for index in [index for index in self._snapshots if index > size]:
+            del self._snapshots[index]
+
+    def arrays(self):
+        """Views of every entry's node, before and after colors"""
+        return self.nodes[:self.size], self.before[:self.size], self.after[:self.size]
+
+    def colors_at(self, index, num_nodes):
+        """
+        The coloring after the first index entries, starting from an empty
+        board.
+
+        Returns:
+            numpy.ndarray: New int8 array (-1 = uncolored)
+        """
+        index = min(max(index, 0), self.size)
+        start = index - index % SNAPSHOT_INTERVAL
+        while start and start not in self._snapshots:
+            start -= SNAPSHOT_INTERVAL
+
+        colors = (self._snapshots[start].copy() if start
+                  else np.full(num_nodes, -1, dtype=np.int8))
+
+        # Replay up to the target, saving the snapshots passed on the way.
+        # Repeated nodes within a slice are assigned in order, last one wins
+        for stop in range(start + SNAPSHOT_INTERVAL, index + 1, SNAPSHOT_INTERVAL):
+            colors[self.nodes[start:stop]] = self.after[start:stop]
+            self._snapshots[stop] = colors.copy()
+            start = stop
+        colors[self.nodes[start:index]] = self.after[start:index]
+        return colors
+
+    def last_changed(self, num_nodes):
+        """Index of the latest entry in effect for each node (-1 = never changed)"""
+        latest = np.full(num_nodes, -1, dtype=np.int64)
+        latest[self.nodes[:self.cursor]] = np.arange(self.cursor)
+        return latest
+
+    def is_consistent(self):
+        """
+        True if every entry in effect starts from the color the one before
+        it left the node in (or from uncolored), i.e. the log replays
+        """
+        nodes, before, after = (array[:self.cursor] for array in (self.nodes, self.before, self.after))
+        order = np.argsort(nodes, kind='stable')
+        nodes, before, after = nodes[order], before[order], after[order]
+
+        expected = np.full(len(nodes), -1, dtype=np.int8)
+        same_node = nodes[1:] == nodes[:-1]
+        expected[1:][same_node] = after[:-1][same_node]
+        return bool(np.array_equal(before, expected))
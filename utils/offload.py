@@ -0,0 +1,162 @@
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+
+class OffloadError(RuntimeError):
+    """Base class for work that couldn't be run in the process pool"""
+
+
+class Overloaded(OffloadError):
+    """Too many jobs are already queued or running"""
+
+
+class OffloadTimeout(OffloadError):
+    """A job didn't finish within its timeout"""
+
+
+class Offloader:
+    """
+    Bounded process pool for CPU-heavy work (puzzle generation and solving).
+
+    Running that work in other processes keeps it from holding the GIL
+    while cheap requests like moves and hints are being served. At most
+    max_pending jobs are queued or running at a time. Request handlers are
+    told right away when the pool is full (Overloaded), while background
+    callers can wait for a slot. Jobs that take longer than the timeout
+    raise OffloadTimeout; their worker still finishes them, and they keep
+    their slot until it does.
+
+    With max_workers=0 jobs run inline in the calling thread.
+    """
+
+    def __init__(self, max_workers=2, max_pending=None, timeout=10.0):
+        """
+        Args:
+            max_workers: Worker processes (0 = run jobs inline)
+            max_pending: Jobs allowed to be queued or running (default 2 per worker)
+            timeout: Seconds to wait for a job's result
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending or 2 * max(max_workers, 1)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, wait=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the pool and return its result.
+
+        Args:
+            wait: Block until a slot is free instead of raising Overloaded
+
+        Raises:
+            Overloaded: If the pool is full and wait is False
+            OffloadTimeout: If the job took longer than the timeout
+        """
+        if not self.max_workers:
+            return fn(*args, **kwargs)
+
+        self._acquire(wait)
+        return self._result(fn, self._submit(fn, args, kwargs))
+
+    @contextmanager
+    def reserve(self, wait=False):
+        """
+        Hold a slot for a job that runs partly elsewhere (e.g. in a solver
+        portfolio's own pool), so it counts against max_pending like any
+        other job.
+
+        Args:
+            wait: Block until a slot is free instead of raising Overloaded
+
+        Yields:
+            callable: run(fn, *args, **kwargs) for the job's steps that
+            belong in this pool; they share the held slot
+
+        Raises:
+            Overloaded: If the pool is full and wait is False
+        """
+        if not self.max_workers:
+            yield lambda fn, *args, **kwargs: fn(*args, **kwargs)
+            return
+
+        self._acquire(wait)
+        last = []
+
+        def run(fn, *args, **kwargs):
+            last[:] = [self._get_executor().submit(fn, *args, **kwargs)]
+            return self._result(fn, last[0])
+
+        try:
+            yield run
+        finally:
+            # A step that timed out keeps the slot until its worker is done
+            if last and not last[0].done():
+                last[0].add_done_callback(lambda _: self._release())
+            else:
+                self._release()
+
+    def stats(self):
+        """Pool size and the number of jobs queued or running"""
+        return {
+            'workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self._pending
+        }
+
+    def _acquire(self, wait):
+        if not self._slots.acquire(blocking=wait):
+            raise Overloaded(f"{self.max_pending} jobs are already pending")
+        with self._lock:
+            self._pending += 1
+
+    def _submit(self, fn, args, kwargs):
+        """Submit a job whose slot is held; the slot is released when it finishes"""
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _result(self, fn, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise OffloadTimeout(f"{getattr(fn, '__name__', 'job')} took longer than {self.timeout}s")
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _get_executor(self):
+        """The process pool, created once per process (gunicorn forks after import)"""
+        if self._pid != os.getpid():
+            # multiprocessing is only loaded once a job needs the pool
+            from concurrent.futures import ProcessPoolExecutor
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+
+def create_offloader():
+    """
+    Create the offloader from the environment: OFFLOAD_WORKERS (default 2,
+    0 = inline), OFFLOAD_MAX_PENDING and OFFLOAD_TIMEOUT (seconds)
+    """
+    max_pending = os.environ.get('OFFLOAD_MAX_PENDING')
+    return Offloader(
+        max_workers=int(os.environ.get('OFFLOAD_WORKERS', 2)),
+        max_pending=int(max_pending) if max_pending else None,
+        timeout=float(os.environ.get('OFFLOAD_TIMEOUT', 10))
+    )
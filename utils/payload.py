@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Optional: without it, responses are offered gzip only
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+# Appended to a payload's ETag for each compressed representation
+ETAG_SUFFIXES = {None: '', 'gzip': '-gz', 'br': '-br'}
+
+
+class Payload:
+    """
+    A JSON response body encoded once, kept plain and compressed.
+
+    Serving it costs no JSON encoding or compression: the representation
+    the client accepts is written out as is. Each representation has its
+    own strong ETag (the body's digest plus the encoding), as HTTP asks
+    for bodies that differ byte for byte.
+    """
+
+    __slots__ = ('key', 'etag', 'body', 'gzip', 'brotli')
+
+    def __init__(self, key, data, etag=None):
+        """
+        Args:
+            key: What the payload was built for (see PayloadCache)
+            data: JSON-serializable response data
+            etag: ETag of the plain body, if something cheaper than its
+                digest already identifies it (default: the digest)
+        """
+        self.key = key
+        # Encoded like Flask's jsonify outside debug mode
+        self.body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+        self.etag = etag or hashlib.sha256(self.body).hexdigest()[:32]
+        # mtime=0 keeps the bytes, and so the ETag, the same across workers
+        self.gzip = gzip.compress(self.body, GZIP_LEVEL, mtime=0)
+        self.brotli = brotli.compress(self.body, quality=BROTLI_QUALITY) if brotli is not None else None
+
+    def representation(self, accept_encodings):
+        """
+        The best representation for a request's Accept-Encoding.
+
+        Args:
+            accept_encodings: Werkzeug's request.accept_encodings
+
+        Returns:
+            tuple: (content encoding or None for identity, body, ETag)
+        """
+        offered = ['br', 'gzip'] if self.brotli is not None else ['gzip']
+        encoding = accept_encodings.best_match(offered)
+        body = {'br': self.brotli, 'gzip': self.gzip}.get(encoding, self.body)
+        return encoding, body, self.etag + ETAG_SUFFIXES[encoding]
+
+    def size(self):
+        """Bytes held for all representations"""
+        return len(self.body) + len(self.gzip) + (len(self.brotli) if self.brotli is not None else 0)
+
+
+class PayloadCache:
+    """
+    LRU of built payloads, so a board that is served again (a seeded or
+    daily puzzle, a puzzle bank board, a repeated grid) is encoded and
+    compressed once per process.
+    """
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, build):
+        """
+        The payload for a key, built by build() on a miss.
+
+        Args:
+            key: Hashable; identifies the response body completely
+            build: Callable (key) -> Payload
+        """
+        with self._lock:
+            payload = self._items.get(key)
+            if payload is not None:
+                self._items.move_to_end(key)
+                self._hits += 1
+                return payload
+            self._misses += 1
+
+        payload = build(key)
+        self.put(payload)
+        return payload
+
+    def put(self, payload):
+        """Add a payload, evicting the least recently used past max_items"""
+        with self._lock:
+            self._items[payload.key] = payload
+            self._items.move_to_end(payload.key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        """Payloads held, their bytes, and hit/miss counters"""
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': sum(payload.size() for payload in self._items.values()),
+                'hits': self._hits,
+                'misses': self._misses
+            }
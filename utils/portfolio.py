@@ -0,0 +1,450 @@
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from utils.graph import find_conflicts
+from utils.solver import solve_coloring, COLORABLE
+
+# Every this many races include all strategies, so the ranking keeps learning
+EXPLORE_EVERY = 10
+
+# Seconds past the time limit to wait for results already on their way back
+RESULT_GRACE = 0.5
+
+
+def greedy_coloring(graph, num_colors, rng, expired):
+    """
+    Plain greedy coloring, restarted with a new node order until one fits
+    in num_colors. Orders cycle through random, largest-first and
+    smallest-last, with random tie-breaking.
+    """
+    n = graph.num_nodes
+    adj = _adjacency(graph)
+    degrees = [len(neighbors) for neighbors in adj]
+    full = (1 << num_colors) - 1
+
+    attempt = 0
+    while not expired():
+        ties = [rng.random() for _ in range(n)]
+        kind = attempt % 3
+        attempt += 1
+        if kind == 0:
+            order = sorted(range(n), key=ties.__getitem__)
+        elif kind == 1:
+            order = sorted(range(n), key=lambda v: (-degrees[v], ties[v]))
+        else:
+            order = _smallest_last(adj, ties)[::-1]
+
+        colors = [-1] * n
+        for v in order:
+            taken = 0
+            for u in adj[v]:
+                if colors[u] >= 0:
+                    taken |= 1 << colors[u]
+            free = full & ~taken
+            if not free:
+                break
+            colors[v] = (free & -free).bit_length() - 1
+        else:
+            return np.array(colors, dtype=np.int8)
+    return None
+
+
+def tabu_coloring(graph, num_colors, rng, expired, tenure=10):
+    """
+    Tabu search (TabuCol) over complete colorings with conflicts.
+
+    Starts from a greedy coloring that allows conflicts. Each step recolors
+    a conflicting node with the color that removes the most conflicts,
+    and a node may not return to a color it just left for a while unless
+    that would beat the best board seen so far.
+    """
+    n = graph.num_nodes
+    adj = _adjacency(graph)
+
+    colors = [0] * n
+    assigned = [False] * n
+    order = list(range(n))
+    rng.shuffle(order)
+    for v in order:
+        counts = [0] * num_colors
+        for u in adj[v]:
+            if assigned[u]:
+                counts[colors[u]] += 1
+        fewest = min(counts)
+        colors[v] = rng.choice([c for c in range(num_colors) if counts[c] == fewest])
+        assigned[v] = True
+
+    # neighbor_counts[v][c]: neighbors of v colored c
+    neighbor_counts = [[0] * num_colors for _ in range(n)]
+    for v in range(n):
+        counts = neighbor_counts[v]
+        for u in adj[v]:
+            counts[colors[u]] += 1
+    conflicted = {v for v in range(n) if neighbor_counts[v][colors[v]]}
+    conflicts = sum(neighbor_counts[v][colors[v]] for v in conflicted) // 2
+    best = conflicts
+    tabu = {}  # (node, color) -> step until which the node may not take that color
+    step = 0
+
+    while conflicts:
+        if step % 256 == 0 and expired():
+            return None
+        step += 1
+
+        best_delta, moves = None, []
+        for v in conflicted:
+            counts = neighbor_counts[v]
+            own = counts[colors[v]]
+            for c in range(num_colors):
+                if c == colors[v]:
+                    continue
+                delta = counts[c] - own
+                if tabu.get((v, c), 0) > step and conflicts + delta >= best:
+                    continue
+                if best_delta is None or delta < best_delta:
+                    best_delta, moves = delta, [(v, c)]
+                elif delta == best_delta:
+                    moves.append((v, c))
+        if moves:
+            v, c = rng.choice(moves)
+        else:
+            # Every move is tabu: take a random one
+            v = rng.choice(sorted(conflicted))
+            c = rng.choice([c for c in range(num_colors) if c != colors[v]])
+            best_delta = neighbor_counts[v][c] - neighbor_counts[v][colors[v]]
+
+        old = colors[v]
+        colors[v] = c
+        conflicts += best_delta
+        best = min(best, conflicts)
+        tabu[(v, old)] = step + int(0.6 * len(conflicted)) + rng.randrange(tenure)
+        for u in adj[v]:
+            counts = neighbor_counts[u]
+            counts[old] -= 1
+            counts[c] += 1
+            if counts[colors[u]]:
+                conflicted.add(u)
+            else:
+                conflicted.discard(u)
+        if neighbor_counts[v][c]:
+            conflicted.add(v)
+        else:
+            conflicted.discard(v)
+
+    return np.array(colors, dtype=np.int8)
+
+
+def kempe_coloring(graph, num_colors, rng, expired):
+    """The default solver: smallest-last greedy with Kempe-chain repair, then exact search"""
+    result = solve_coloring(graph, num_colors, rng=rng, stop=expired)
+    return result.coloring if result.status == COLORABLE else None
+
+
+def dsatur_coloring(graph, num_colors, rng, expired):
+    """DSATUR backtracking search alone, without the Kempe-chain pass"""
+    result = solve_coloring(graph, num_colors, rng=rng, heuristic=False, stop=expired)
+    return result.coloring if result.status == COLORABLE else None
+
+
+# Strategy name -> function(graph, num_colors, rng, expired) returning an
+# int8 coloring or None. expired() turns True at the deadline or once
+# another strategy has won the race
+STRATEGIES = {
+    'kempe': kempe_coloring,
+    'dsatur': dsatur_coloring,
+    'tabu': tabu_coloring,
+    'greedy': greedy_coloring
+}
+
+
+class PortfolioResult:
+    """Outcome of a portfolio solve"""
+
+    __slots__ = ('coloring', 'strategy', 'elapsed')
+
+    def __init__(self, coloring=None, strategy=None, elapsed=0.0):
+        self.coloring = coloring    # Verified int8 coloring, or None if no strategy found one
+        self.strategy = strategy    # Name of the strategy that found it
+        self.elapsed = elapsed      # Wall time in seconds
+
+    def __repr__(self):
+        return f"PortfolioResult(strategy={self.strategy}, elapsed={self.elapsed:.3f})"
+
+
+class Portfolio:
+    """
+    Races coloring strategies against each other in a process pool.
+
+    solve() starts each strategy on its own worker with its own seed and
+    returns the first coloring that verifies (every node colored within
+    num_colors, no edge joining two nodes of the same color). The other
+    strategies are then cancelled: each race owns a flag in an array
+    shared with the workers, and the strategies poll it along with their
+    deadline.
+
+    Wins and the winners' solve times are counted per map type. Strategies
+    are started in ranking order (most wins first, then fastest), and with
+    width set only the top width strategies race, except for every
+    EXPLORE_EVERY-th race, which runs all of them so the ranking can
+    change as traffic does.
+
+    With max_workers=0 the strategies run one after another in the calling
+    thread, in ranking order, each with an equal share of the time left.
+    """
+
+    def __init__(self, strategies=None, max_workers=None, time_limit=10.0, width=None,
+                 max_races=16):
+        """
+        Args:
+            strategies: Names from STRATEGIES to race (default: all)
+            max_workers: Worker processes (default: one per strategy, up to
+                the number of CPUs; 0 = inline)
+            time_limit: Default seconds a solve may take
+            width: Strategies per race (default: all)
+            max_races: Races that may run at once; more wait for a free one
+        """
+        self.strategies = tuple(strategies or STRATEGIES)
+        if max_workers is None:
+            max_workers = min(len(self.strategies), os.cpu_count() or 1)
+        self.max_workers = max_workers
+        self.time_limit = time_limit
+        self.width = width
+        self.max_races = max_races
+        self._free_slots = list(range(max_races))
+        self._slot_available = threading.Semaphore(max_races)
+        self._wins = {}  # map type -> {strategy: [wins, total seconds]}
+        self._races = 0
+        self._failures = 0
+        self._executor = None
+        self._flags = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def solve(self, graph, num_colors=4, map_type=None, time_limit=None, seed=None):
+        """
+        Color a graph with whichever strategy gets there first.
+
+        Args:
+            graph: CompactGraph
+            num_colors: Number of colors
+            map_type: Label the win is counted under (e.g. "voronoi")
+            time_limit: Seconds to allow (default: the portfolio's)
+            seed: Seed for the strategies' choices (None = random)
+
+        Returns:
+            PortfolioResult: The verified coloring and the strategy that
+            found it; coloring is None if none did in time
+        """
+        time_limit = self.time_limit if time_limit is None else time_limit
+        seed = random.getrandbits(63) if seed is None else seed
+        start = time.perf_counter()
+
+        with self._lock:
+            self._races += 1
+            explore = self._races % EXPLORE_EVERY == 0
+        strategies = self.ranking(map_type)
+        if self.width and not explore:
+            strategies = strategies[:self.width]
+
+        if self.max_workers:
+            strategy, coloring, seconds = self._race(graph, num_colors, strategies, time_limit, seed)
+        else:
+            strategy, coloring, seconds = self._run_inline(graph, num_colors, strategies, time_limit, seed)
+
+        with self._lock:
+            if strategy is None:
+                self._failures += 1
+            else:
+                record = self._wins.setdefault(map_type, {}).setdefault(strategy, [0, 0.0])
+                record[0] += 1
+                record[1] += seconds
+        return PortfolioResult(coloring, strategy, time.perf_counter() - start)
+
+    def ranking(self, map_type=None):
+        """Strategy names, most wins for this map type first, then fastest on average"""
+        with self._lock:
+            wins = self._wins.get(map_type, {})
+
+            def rank(name):
+                count, seconds = wins.get(name, (0, 0.0))
+                return (-count, seconds / count if count else float('inf'),
+                        self.strategies.index(name))
+
+            return sorted(self.strategies, key=rank)
+
+    def stats(self):
+        """Races run, races nobody won, and wins and mean winning time per map type"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'races': self._races,
+                'failures': self._failures,
+                'wins': {
+                    str(map_type): {name: {'wins': count, 'mean_seconds': seconds / count}
+                                    for name, (count, seconds) in wins.items()}
+                    for map_type, wins in self._wins.items()
+                }
+            }
+
+    def _race(self, graph, num_colors, strategies, time_limit, seed):
+        """Run the strategies in the pool; returns (winner, coloring, its solve time)"""
+        self._slot_available.acquire()
+        with self._lock:
+            slot = self._free_slots.pop()
+        executor, flags = self._get_executor()
+        flags[slot] = 0
+
+        futures = {}
+        try:
+            for i, name in enumerate(strategies):
+                future = executor.submit(_run_strategy, name, graph, num_colors, seed + i, time_limit, slot)
+                futures[future] = name
+        finally:
+            # The slot is reused only once every job of this race has finished
+            remaining = [len(futures)]
+
+            def release(_):
+                with self._lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                self._release_slot(slot)
+
+            if not futures:
+                self._release_slot(slot)
+            for future in futures:
+                future.add_done_callback(release)
+
+        deadline = time.perf_counter() + time_limit + RESULT_GRACE
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is not None:
+                        continue
+                    coloring, seconds = future.result()
+                    if coloring is not None and verify_coloring(graph, coloring, num_colors):
+                        return futures[future], coloring, seconds
+        finally:
+            flags[slot] = 1
+            for future in pending:
+                future.cancel()
+        return None, None, 0.0
+
+    def _release_slot(self, slot):
+        with self._lock:
+            self._free_slots.append(slot)
+        self._slot_available.release()
+
+    def _run_inline(self, graph, num_colors, strategies, time_limit, seed):
+        """Run the strategies in turn in this thread"""
+        deadline = time.perf_counter() + time_limit
+        for i, name in enumerate(strategies):
+            share = (deadline - time.perf_counter()) / (len(strategies) - i)
+            if share <= 0:
+                break
+            coloring, seconds = _run_strategy(name, graph, num_colors, seed + i, share)
+            if coloring is not None and verify_coloring(graph, coloring, num_colors):
+                return name, coloring, seconds
+        return None, None, 0.0
+
+    def _get_executor(self):
+        """The process pool and its cancellation flags, created once per process"""
+        if self._pid != os.getpid():
+            # multiprocessing is only loaded once a race needs the pool
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._flags = multiprocessing.Array('b', self.max_races, lock=False)
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         initializer=_init_worker,
+                                                         initargs=(self._flags,))
+                    self._pid = os.getpid()
+        return self._executor, self._flags
+
+
+def verify_coloring(graph, coloring, num_colors):
+    """True if every node has a color below num_colors and no edge joins two of the same"""
+    coloring = np.asarray(coloring)
+    return (coloring.shape == (graph.num_nodes,) and bool(np.all((coloring >= 0) & (coloring < num_colors)))
+            and len(find_conflicts(graph, coloring)) == 0)
+
+
+# Race cancellation flags, set in each worker process by _init_worker
+_cancelled = None
+
+
+def _init_worker(flags):
+    global _cancelled
+    _cancelled = flags
+
+
+def _run_strategy(name, graph, num_colors, seed, time_limit, slot=None):
+    """
+    Run one strategy until it finds a coloring, its time is up or (in a
+    worker) its race is cancelled.
+
+    Returns:
+        tuple: (coloring or None, seconds taken)
+    """
+    start = time.perf_counter()
+    deadline = start + time_limit
+
+    def expired():
+        return time.perf_counter() > deadline or (slot is not None and _cancelled[slot] != 0)
+
+    coloring = STRATEGIES[name](graph, num_colors, random.Random(seed), expired)
+    return coloring, time.perf_counter() - start
+
+
+def _adjacency(graph):
+    """Neighbor lists as Python lists, for the pure-Python strategies"""
+    indptr, indices = graph.indptr.tolist(), graph.indices.tolist()
+    return [indices[indptr[v]:indptr[v + 1]] for v in range(graph.num_nodes)]
+
+
+def _smallest_last(adj, ties):
+    """Nodes in smallest-last removal order (repeatedly remove one of minimum degree)"""
+    degree = [len(neighbors) for neighbors in adj]
+    removed = [False] * len(adj)
+    heap = [(degree[v], ties[v], v) for v in range(len(adj))]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        d, _, v = heapq.heappop(heap)
+        if removed[v] or d != degree[v]:
+            continue
+        removed[v] = True
+        order.append(v)
+        for u in adj[v]:
+            if not removed[u]:
+                degree[u] -= 1
+                heapq.heappush(heap, (degree[u], ties[u], u))
+    return order
+
+
+def create_portfolio():
+    """
+    Create the solver portfolio from the environment, or return None if
+    SOLVER_PORTFOLIO_WORKERS isn't set (or is 0). SOLVER_PORTFOLIO_TIME_LIMIT
+    sets the seconds per solve and SOLVER_PORTFOLIO_WIDTH the strategies
+    per race.
+    """
+    workers = int(os.environ.get('SOLVER_PORTFOLIO_WORKERS', 0))
+    if not workers:
+        return None
+    width = os.environ.get('SOLVER_PORTFOLIO_WIDTH')
+    return Portfolio(max_workers=workers,
+                     time_limit=float(os.environ.get('SOLVER_PORTFOLIO_TIME_LIMIT', 10)),
+                     width=int(width) if width else None)
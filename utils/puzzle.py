@@ -0,0 +1,95 @@
+import random
+
+from utils.chromatic import chromatic_number
+from utils.graph import create_planar_graph, generate_solvable_coloring
+from utils.metrics import metrics
+
+# Boards up to this size get their chromatic number computed at generation
+CHROMATIC_MAX_NODES = 1000
+
+# Generation is bounded by search assignments rather than seconds, so a
+# seed gives the same board however busy the machine is
+CHROMATIC_SEARCH_NODES = 100000
+SOLVE_SEARCH_NODES_PER_NODE = 20
+SOLVE_MIN_SEARCH_NODES = 100000
+
+
+class GenerationError(RuntimeError):
+    """No colorable board was found for the requested size, map type and seed"""
+
+
+class Puzzle:
+    """A ready-to-play board: graph, node positions and a verified solution"""
+
+    __slots__ = ('graph', 'positions', 'solution', 'num_colors', 'map_type', 'seed', 'min_colors',
+                 'min_coloring', 'payload')
+
+    def __init__(self, graph, positions, solution, num_colors, map_type, seed=None, min_colors=None,
+                 min_coloring=None):
+        self.graph = graph
+        self.positions = positions
+        self.solution = solution
+        self.num_colors = num_colors
+        self.map_type = map_type
+        self.seed = seed
+        self.min_colors = min_colors  # Chromatic number (None = not computed)
+        self.min_coloring = min_coloring  # A coloring with min_colors colors, if fewer than num_colors
+        self.payload = None  # Prebuilt /new_game response (utils.payload.Payload), if any
+
+
+def generate_puzzle(num_nodes, map_type="random", num_colors=4, max_attempts=20, seed=None, solve=None,
+                    build=None):
+    """
+    Generate a board together with a valid coloring.
+
+    Boards that can't be colored are thrown away and regenerated. Every
+    attempt draws its own seed from the puzzle seed, so the same seed always
+    produces the same puzzle.
+
+    Args:
+        num_nodes: Number of regions
+        map_type: Type of map ("random", "grid", "voronoi")
+        num_colors: Number of colors available to the player
+        max_attempts: How many boards to try before giving up
+        seed: Puzzle seed (None = pick a random one)
+        solve: Callable (graph, num_colors, seed) returning a coloring or
+            None, used instead of generate_solvable_coloring (e.g. a
+            Portfolio's). Unlike the default, it may depend on timing, and
+            then so does which of the seed's maps is returned
+        build: Callable (num_nodes, map_type, seed) returning (graph,
+            positions), used instead of create_planar_graph (e.g. to build
+            the map in another process)
+
+    Returns:
+        Puzzle: The generated puzzle, with the seed that reproduces it and,
+        for boards up to CHROMATIC_MAX_NODES, its chromatic number and a
+        coloring that uses that many colors
+
+    Raises:
+        GenerationError: If no colorable board was found
+    """
+    if seed is None:
+        seed = random.getrandbits(48)
+    rng = random.Random(seed)
+
+    for _ in range(max_attempts):
+        attempt_seed = rng.getrandbits(64)
+        with metrics.phase('generate'):
+            graph, positions = (build or create_planar_graph)(num_nodes, map_type, seed=attempt_seed)
+        with metrics.phase('solve'):
+            if solve is None:
+                budget = max(SOLVE_MIN_SEARCH_NODES, SOLVE_SEARCH_NODES_PER_NODE * graph.num_nodes)
+                solution = generate_solvable_coloring(graph, num_colors, seed=attempt_seed, max_nodes=budget)
+            else:
+                solution = solve(graph, num_colors, seed=attempt_seed)
+        if solution is not None:
+            min_colors = min_coloring = None
+            if graph.num_nodes <= CHROMATIC_MAX_NODES:
+                with metrics.phase('chromatic'):
+                    result = chromatic_number(graph, time_limit=None, max_nodes=CHROMATIC_SEARCH_NODES)
+                min_colors = result.number
+                if min_colors is not None and min_colors < num_colors:
+                    min_coloring = result.coloring
+            return Puzzle(graph, positions, solution, num_colors, map_type, seed, min_colors, min_coloring)
+
+    raise GenerationError(f"Could not generate a {num_colors}-colorable {map_type} map")
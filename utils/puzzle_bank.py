@@ -0,0 +1,259 @@
+import mmap
+import os
+import random
+import struct
+import tempfile
+
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+from utils.graph import find_conflicts
+from utils.puzzle import Puzzle, generate_puzzle
+from utils.puzzle_cache import GENERATOR_VERSION
+from utils.solver import solve_coloring
+
+BANK_MAGIC = b'GCB1'
+BANK_HEADER = struct.Struct('<4sII4x')  # magic, generator version, puzzle count
+
+MAP_TYPES = ('random', 'grid', 'voronoi')
+GRADES = ('easy', 'medium', 'hard')
+
+# One fixed-size record per puzzle, read straight from the mapped file
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),       # Where the puzzle's arrays start
+    ('seed', '<u8'),
+    ('num_nodes', '<u4'),
+    ('num_edges', '<u4'),
+    ('search_nodes', '<u4'),
+    ('backtracks', '<u4'),
+    ('forced', '<u4'),
+    ('score', '<f4'),
+    ('map_type', 'u1'),
+    ('grade', 'u1'),
+    ('num_colors', 'u1'),
+    ('min_colors', 'u1'),    # Chromatic number, 0 = unknown
+    ('_pad', 'u1', 4)
+])
+
+# Grading: an unaided search (no Kempe pass, no peeling) from an empty
+# board stands in for a player. Every backtrack counts as this many
+# placements, and boards where many placements are forced count as tighter.
+# Effort is per region, so the score doesn't just follow board size
+BACKTRACK_WEIGHT = 4
+GRADING_RUNS = 3
+GRADING_NODE_LIMIT = 200000
+
+
+def grade_puzzle(puzzle, runs=GRADING_RUNS):
+    """
+    Measure how hard a puzzle is to solve.
+
+    The search is repeated with different tie-breaking and averaged, since
+    a single run can be lucky. On the boards a bank holds the search rarely
+    backtracks, so the share of placements that were forced is what tells
+    them apart; its total effort would mostly measure board size.
+
+    Returns:
+        dict: Mean search nodes, backtracks and forced placements, and the
+        difficulty score derived from them
+    """
+    totals = np.zeros(3)
+    for run in range(runs):
+        result = solve_coloring(puzzle.graph, puzzle.num_colors, rng=random.Random(run),
+                                heuristic=False, peel=False, max_nodes=GRADING_NODE_LIMIT)
+        totals += (result.nodes, result.backtracks, result.forced)
+    search_nodes, backtracks, forced = totals / runs
+
+    num_nodes = max(puzzle.graph.num_nodes, 1)
+    score = (search_nodes + BACKTRACK_WEIGHT * backtracks) / num_nodes * (1 + forced / num_nodes)
+    return {
+        'search_nodes': int(round(search_nodes)),
+        'backtracks': int(round(backtracks)),
+        'forced': int(round(forced)),
+        'score': float(score)
+    }
+
+
+def generate_graded_puzzle(num_nodes, map_type, num_colors, seed):
+    """Generate and grade one puzzle (the unit of work for a process pool)"""
+    puzzle = generate_puzzle(num_nodes, map_type, num_colors, seed=seed)
+    return puzzle, grade_puzzle(puzzle)
+
+
+def write_bank(path, graded):
+    """
+    Write graded puzzles to a bank file.
+
+    Grades are assigned per map type by score: the easiest third is "easy",
+    the hardest third "hard". The file is a small header, the index
+    (INDEX_DTYPE records) and then each puzzle's indptr (int64), indices
+    (int32), positions (float64) and solution (int8), 8-byte aligned so
+    they can be used in place once mapped.
+
+    Args:
+        path: Output file; written to a temporary file and renamed
+        graded: List of (Puzzle, grading dict) pairs
+    """
+    index = np.zeros(len(graded), dtype=INDEX_DTYPE)
+    for i, (puzzle, grading) in enumerate(graded):
+        record = index[i]
+        record['seed'] = puzzle.seed
+        record['num_nodes'] = puzzle.graph.num_nodes
+        record['num_edges'] = puzzle.graph.num_edges
+        record['search_nodes'] = grading['search_nodes']
+        record['backtracks'] = grading['backtracks']
+        record['forced'] = grading['forced']
+        record['score'] = grading['score']
+        record['map_type'] = MAP_TYPES.index(puzzle.map_type)
+        record['num_colors'] = puzzle.num_colors
+        record['min_colors'] = puzzle.min_colors or 0
+
+    for code in range(len(MAP_TYPES)):
+        members = np.flatnonzero(index['map_type'] == code)
+        ranks = np.empty(len(members), dtype=np.int64)
+        ranks[np.argsort(index['score'][members], kind='stable')] = np.arange(len(members))
+        index['grade'][members] = ranks * len(GRADES) // max(len(members), 1)
+
+    offset = BANK_HEADER.size + index.nbytes
+    blobs = []
+    for i, (puzzle, _) in enumerate(graded):
+        index[i]['offset'] = offset
+        blob = b''.join(_aligned(array.tobytes()) for array in _puzzle_arrays(puzzle))
+        blobs.append(blob)
+        offset += len(blob)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(BANK_HEADER.pack(BANK_MAGIC, GENERATOR_VERSION, len(graded)))
+            f.write(index.tobytes())
+            for blob in blobs:
+                f.write(blob)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PuzzleBank:
+    """
+    Read-only view of a bank file written by write_bank().
+
+    The file is memory-mapped, so opening it costs next to nothing, worker
+    processes share its pages, and a puzzle's arrays are views into the
+    mapping rather than copies.
+    """
+
+    def __init__(self, path):
+        """
+        Raises:
+            ValueError: If the file isn't a bank for this generator version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < BANK_HEADER.size:
+            raise ValueError(f"{path} is not a puzzle bank")
+        magic, version, count = BANK_HEADER.unpack_from(self._map)
+        if magic != BANK_MAGIC:
+            raise ValueError(f"{path} is not a puzzle bank")
+        if version != GENERATOR_VERSION:
+            raise ValueError(f"{path} was built by generator version {version}, "
+                             f"this is version {GENERATOR_VERSION}")
+
+        self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=BANK_HEADER.size)
+        self._groups = {
+            (grade, map_type): np.flatnonzero((self.index['grade'] == g) & (self.index['map_type'] == m))
+            for g, grade in enumerate(GRADES) for m, map_type in enumerate(MAP_TYPES)
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def has(self, grade, map_type):
+        """True if the bank holds puzzles of this grade and map type"""
+        group = self._groups.get((grade, map_type))
+        return group is not None and len(group) > 0
+
+    def puzzle(self, i):
+        """Puzzle i, its arrays backed by the mapped file"""
+        record = self.index[i]
+        n, m = int(record['num_nodes']), int(record['num_edges'])
+        buffer = np.frombuffer(self._map, dtype=np.uint8, offset=int(record['offset']))
+
+        arrays = []
+        start = 0
+        for dtype, shape in ((np.int64, (n + 1,)), (np.int32, (2 * m,)),
+                             (np.float64, (n, 2)), (np.int8, (n,))):
+            size = np.dtype(dtype).itemsize * int(np.prod(shape))
+            arrays.append(buffer[start:start + size].view(dtype).reshape(shape))
+            start += -(-size // 8) * 8
+        indptr, indices, positions, solution = arrays
+
+        return Puzzle(CompactGraph(indptr, indices), positions, solution, int(record['num_colors']),
+                      MAP_TYPES[record['map_type']], int(record['seed']),
+                      int(record['min_colors']) or None)
+
+    def sample(self, grade, map_type, rng=random):
+        """
+        A random puzzle of a grade and map type.
+
+        Raises:
+            KeyError: If the bank holds none
+        """
+        if not self.has(grade, map_type):
+            raise KeyError((grade, map_type))
+        group = self._groups[(grade, map_type)]
+        return self.puzzle(int(group[rng.randrange(len(group))]))
+
+    def verify(self):
+        """
+        Check every stored solution: all nodes colored within the puzzle's
+        colors, and no edge joining two nodes of the same color.
+
+        Returns:
+            list: Indices of the puzzles that fail
+        """
+        failed = []
+        for i in range(len(self)):
+            puzzle = self.puzzle(i)
+            solution = puzzle.solution
+            if (np.any(solution < 0) or np.any(solution >= puzzle.num_colors)
+                    or len(find_conflicts(puzzle.graph, solution))):
+                failed.append(i)
+        return failed
+
+    def stats(self):
+        """Puzzle counts and node count ranges per grade and map type"""
+        stats = []
+        for (grade, map_type), group in self._groups.items():
+            if len(group):
+                sizes = self.index['num_nodes'][group]
+                stats.append({'grade': grade, 'map_type': map_type, 'puzzles': len(group),
+                              'min_nodes': int(sizes.min()), 'max_nodes': int(sizes.max())})
+        return stats
+
+
+def _puzzle_arrays(puzzle):
+    return (np.ascontiguousarray(puzzle.graph.indptr, dtype='<i8'),
+            np.ascontiguousarray(puzzle.graph.indices, dtype='<i4'),
+            np.ascontiguousarray(puzzle.positions, dtype='<f8'),
+            np.ascontiguousarray(puzzle.solution, dtype='i1'))
+
+
+def _aligned(data):
+    """Pad data to a multiple of 8 bytes"""
+    return data + b'\0' * (-len(data) % 8)
+
+
+def create_puzzle_bank():
+    """
+    Open the puzzle bank named by PUZZLE_BANK, or return None if it isn't
+    set. Build one with scripts/build_puzzle_bank.py.
+    """
+    path = os.environ.get('PUZZLE_BANK')
+    return PuzzleBank(path) if path else None
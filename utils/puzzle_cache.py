@@ -0,0 +1,185 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+from utils.puzzle import Puzzle, generate_puzzle
+
+# Bump when generation changes, so old cache entries are no longer found
+GENERATOR_VERSION = 1
+
+# Default size of the on-disk tier, and how far below it eviction goes
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+EVICT_TARGET = 0.9
+
+
+def puzzle_key(map_type, num_nodes, seed, num_colors):
+    """
+    Content address of a seeded puzzle.
+
+    Generation is deterministic, so the parameters identify the board. The
+    key is also used as the HTTP ETag of the board.
+    """
+    spec = f"v{GENERATOR_VERSION}:{map_type}:{num_nodes}:{seed}:{num_colors}"
+    return hashlib.sha256(spec.encode()).hexdigest()[:32]
+
+
+class PuzzleCache:
+    """
+    Two-tier cache of seeded puzzles: an in-process LRU in front of a
+    directory of .npz files that several workers can share.
+
+    Seeds come from clients, so the directory is capped too. Loading a
+    file touches it, and once the files written push the directory past
+    max_disk_bytes, the least recently used are deleted until it is back
+    under EVICT_TARGET of that. Each process counts what it writes and
+    rescans the directory when its count passes the cap, so workers
+    sharing the directory keep it within the cap between them.
+    """
+
+    def __init__(self, directory=None, max_items=256, generate=generate_puzzle,
+                 max_disk_bytes=DEFAULT_DISK_BYTES):
+        """
+        Args:
+            directory: Where to keep puzzles on disk (None = memory only)
+            max_items: Puzzles kept in memory
+            generate: Callable (num_nodes, map_type, num_colors, seed=) -> Puzzle
+            max_disk_bytes: Size the directory is kept under
+        """
+        self.directory = directory
+        self.max_items = max_items
+        self.generate = generate
+        self.max_disk_bytes = max_disk_bytes
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # Directory size at the last scan plus what was written since
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, map_type, num_nodes, seed, num_colors):
+        """
+        Return the puzzle for these parameters, generating it on a miss.
+
+        Returns:
+            tuple: (Puzzle, cache key)
+        """
+        key = puzzle_key(map_type, num_nodes, seed, num_colors)
+
+        with self._lock:
+            puzzle = self._items.get(key)
+            if puzzle is not None:
+                self._items.move_to_end(key)
+                return puzzle, key
+
+        puzzle = self._load(key, map_type, seed)
+        if puzzle is None:
+            puzzle = self.generate(num_nodes, map_type, num_colors, seed=seed)
+            self._save(key, puzzle)
+
+        with self._lock:
+            self._items[key] = puzzle
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+        return puzzle, key
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def _load(self, key, map_type, seed):
+        """Read a puzzle from disk, or None if it isn't there"""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                graph = CompactGraph(data['indptr'], data['indices'])
+                min_colors = int(data['min_colors']) if 'min_colors' in data else 0
+                min_coloring = data['min_coloring'] if 'min_coloring' in data else None
+                puzzle = Puzzle(graph, data['positions'], data['solution'],
+                                int(data['num_colors']), map_type, seed, min_colors or None, min_coloring)
+            # The modification time orders files for eviction
+            os.utime(path)
+            return puzzle
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save(self, key, puzzle):
+        """Write a puzzle to disk; the rename makes it appear all at once"""
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        extra = {'min_coloring': puzzle.min_coloring} if puzzle.min_coloring is not None else {}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, indptr=puzzle.graph.indptr, indices=puzzle.graph.indices,
+                         positions=puzzle.positions, solution=puzzle.solution,
+                         num_colors=puzzle.num_colors, min_colors=puzzle.min_colors or 0, **extra)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
+        self._evict()
+
+    def _evict(self):
+        """Measure the directory and delete the least recently used files if it is over the cap"""
+        files = []
+        try:
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.npz'):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass  # Another worker removed a file or shard while this one was scanning
+
+        total = sum(size for _, size, _ in files)
+        if total > self.max_disk_bytes:
+            target = self.max_disk_bytes * EVICT_TARGET
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+
+
+def create_puzzle_cache(generate=generate_puzzle):
+    """
+    Create the puzzle cache from the environment.
+
+    PUZZLE_CACHE_DIR sets the on-disk tier ("" = memory only),
+    PUZZLE_CACHE_DISK_MB its size cap and PUZZLE_CACHE_SIZE the number of
+    puzzles kept in memory.
+
+    Args:
+        generate: Generator for cache misses (see PuzzleCache)
+    """
+    directory = os.environ.get('PUZZLE_CACHE_DIR',
+                               os.path.join(tempfile.gettempdir(), 'graph-coloring-puzzles'))
+    disk_mb = os.environ.get('PUZZLE_CACHE_DISK_MB')
+    return PuzzleCache(directory or None, max_items=int(os.environ.get('PUZZLE_CACHE_SIZE', 256)),
+                       generate=generate,
+                       max_disk_bytes=int(float(disk_mb) * 1024 * 1024) if disk_mb else DEFAULT_DISK_BYTES)
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import deque
+
+
+class PuzzlePool:
+    """
+    Per-(difficulty, map_type) pools of pre-generated puzzles.
+
+    A background thread refills a pool once it drops below the low watermark
+    and keeps generating until it reaches the high watermark. get() pops a
+    ready puzzle when there is one and only generates synchronously on a miss.
+    """
+
+    def __init__(self, factory, keys, low=2, high=8, on_miss=None):
+        """
+        Args:
+            factory: Callable (difficulty, map_type) -> Puzzle
+            keys: The (difficulty, map_type) pairs to keep pools for
+            low: Refill a pool when it holds fewer puzzles than this
+            high: Stop refilling once a pool holds this many puzzles
+            on_miss: Callable used by get() on an empty pool (default: factory)
+        """
+        self.factory = factory
+        self.on_miss = on_miss or factory
+        self.low = low
+        self.high = max(high, low)
+        self._pools = {key: deque() for key in keys}
+        self._filling = set(self._pools)
+        self._hits = dict.fromkeys(self._pools, 0)
+        self._misses = dict.fromkeys(self._pools, 0)
+        self._errors = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def get(self, difficulty, map_type):
+        """
+        Take a puzzle from the pool, generating one if the pool is empty.
+
+        Returns:
+            Puzzle: A ready puzzle
+        """
+        key = (difficulty, map_type)
+        self._ensure_started()
+
+        with self._lock:
+            pool = self._pools.get(key)
+            puzzle = pool.popleft() if pool else None
+
+            if key in self._hits:
+                if puzzle is not None:
+                    self._hits[key] += 1
+                else:
+                    self._misses[key] += 1
+                if len(pool) < self.low:
+                    self._filling.add(key)
+                    self._wakeup.set()
+
+        if puzzle is None:
+            puzzle = self.on_miss(difficulty, map_type)
+        return puzzle
+
+    def stats(self):
+        """Pool sizes and hit/miss counters per (difficulty, map_type)"""
+        with self._lock:
+            return {
+                'low_watermark': self.low,
+                'high_watermark': self.high,
+                'errors': self._errors,
+                'pools': [
+                    {
+                        'difficulty': difficulty,
+                        'map_type': map_type,
+                        'size': len(pool),
+                        'hits': self._hits[(difficulty, map_type)],
+                        'misses': self._misses[(difficulty, map_type)]
+                    }
+                    for (difficulty, map_type), pool in self._pools.items()
+                ]
+            }
+
+    def start(self):
+        """Start refilling now rather than on the first get()"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        """Start the refill thread once per process (gunicorn forks after import)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='puzzle-pool', daemon=True).start()
+
+    def _next_key(self):
+        """The pool that needs a puzzle most, or None if all are full"""
+        with self._lock:
+            for key in list(self._filling):
+                if len(self._pools[key]) >= self.high:
+                    self._filling.discard(key)
+            if not self._filling:
+                return None
+            return min(self._filling, key=lambda k: len(self._pools[k]))
+
+    def _run(self):
+        while True:
+            key = self._next_key()
+            if key is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            try:
+                puzzle = self.factory(*key)
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+                    self._filling.discard(key)
+                continue
+
+            with self._lock:
+                self._pools[key].append(puzzle)
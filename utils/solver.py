@@ -0,0 +1,434 @@
+import heapq
+import random
+import time
+
+import numpy as np
+
+# Solver outcomes
+COLORABLE = 'colorable'
+UNCOLORABLE = 'uncolorable'
+UNKNOWN = 'unknown'
+
+
+class SolveResult:
+    """Outcome of a coloring search"""
+
+    __slots__ = ('status', 'coloring', 'nodes', 'backtracks', 'forced', 'elapsed')
+
+    def __init__(self, status, coloring=None, nodes=0, backtracks=0, forced=0, elapsed=0.0):
+        self.status = status          # COLORABLE, UNCOLORABLE or UNKNOWN (budget ran out)
+        self.coloring = coloring      # int8 array when COLORABLE, else None
+        self.nodes = nodes            # Search nodes (color assignments) tried
+        self.backtracks = backtracks  # Assignments undone after a dead end
+        self.forced = forced          # Assignments where only one color was left
+        self.elapsed = elapsed        # Wall time in seconds
+
+    def __repr__(self):
+        return (f"SolveResult({self.status}, nodes={self.nodes}, "
+                f"backtracks={self.backtracks}, forced={self.forced})")
+
+
+def solve_coloring(graph, num_colors=4, fixed=None, max_nodes=None, time_limit=None, rng=None,
+                   heuristic=True, peel=True, stop=None):
+    """
+    Exact k-coloring search: DSATUR ordering with backtracking.
+
+    With heuristic=True a fast Kempe-chain pass runs first: nodes are colored
+    in smallest-last order, and a node whose neighbors already use every
+    color frees one by swapping two colors along a Kempe chain. It colors
+    large planar maps almost always; the exact search below only runs when
+    it fails, and is what proves a graph uncolorable.
+
+    Nodes with fewer than num_colors neighbors can always be colored last,
+    so they are peeled off first and the search only runs on what is left.
+    Every node keeps a bitmask of the colors still allowed for it. Assigning
+    a color removes it from the uncolored neighbors (forward checking), and
+    a neighbor left with an empty domain rejects the assignment at once. The
+    next node is always one with the fewest allowed colors, ties broken by
+    the number of colored neighbors and then by degree, and colors are tried
+    least-constraining first. Colors that no node uses yet are
+    interchangeable, so only one of them is tried at each step.
+
+    Dead ends backjump (conflict-directed backjumping) to the most recent
+    assignment that actually caused them, and the search restarts with new
+    tie-breaking after a growing number of assignments (Luby sequence),
+    which keeps large maps from thrashing. A run that exhausts its tree
+    before its restart limit proves the graph uncolorable.
+
+    Args:
+        graph: CompactGraph
+        num_colors: Number of colors
+        fixed: Optional int8 array of pre-assigned colors (-1 = free)
+        max_nodes: Give up after this many assignments (None = no limit)
+        time_limit: Give up after this many seconds (None = no limit)
+        rng: random.Random used to vary the solution (default: random module)
+        heuristic: Try the Kempe-chain pass before the exact search
+        peel: Set low-degree nodes aside before the search (turn off, along
+            with heuristic, to measure the effort of the whole search)
+        stop: Optional callable polled along with the time limit; give up
+            once it returns True
+
+    Returns:
+        SolveResult: The outcome, with the coloring if one was found
+    """
+    start_time = time.perf_counter()
+    deadline = start_time + time_limit if time_limit is not None else None
+    rng = rng or random
+    n = graph.num_nodes
+
+    def expired():
+        return ((deadline is not None and time.perf_counter() > deadline)
+                or (stop is not None and stop()))
+
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    adj = [indices[indptr[i]:indptr[i + 1]] for i in range(n)]
+
+    fixed_colors = np.asarray(fixed).tolist() if fixed is not None else [-1] * n
+    has_fixed = any(c >= 0 for c in fixed_colors)
+    stats = [0, 0, 0]  # nodes, backtracks, forced
+
+    # Neither search checks the pre-assigned colors against each other
+    if has_fixed and not _fixed_consistent(graph, fixed, num_colors):
+        return SolveResult(UNCOLORABLE, elapsed=time.perf_counter() - start_time)
+
+    colors = _kempe_coloring(adj, num_colors, fixed_colors, rng, stats, expired) if heuristic else None
+    if colors is not None:
+        result = SolveResult(COLORABLE, np.array(colors, dtype=np.int8), stats[0], stats[1], stats[2])
+        result.elapsed = time.perf_counter() - start_time
+        return result
+    if heuristic and expired():
+        # Setting up the exact search on a large graph takes time of its own
+        return SolveResult(UNKNOWN, None, stats[0], stats[1], stats[2], time.perf_counter() - start_time)
+
+    peeled = _peel(adj, fixed_colors, num_colors) if peel else []
+    restart_base = max(100, 4 * n)
+    run = 0
+    while True:
+        run += 1
+        limit = restart_base * _luby(run)
+        if max_nodes is not None:
+            limit = min(limit, max_nodes - stats[0])
+
+        status, colors = _search(adj, num_colors, fixed_colors, peeled, limit, expired, rng, stats)
+        if status == UNKNOWN and limit > 0 and not expired() \
+                and (max_nodes is None or stats[0] < max_nodes):
+            continue
+        break
+
+    result = SolveResult(status, None, stats[0], stats[1], stats[2])
+    if status == COLORABLE:
+        # Peeled nodes have fewer than num_colors neighbors left when colored in reverse
+        for v in reversed(peeled):
+            taken = {colors[u] for u in adj[v]}
+            colors[v] = rng.choice([c for c in range(num_colors) if c not in taken])
+
+        result.coloring = np.array(colors, dtype=np.int8)
+
+        # Without pre-assigned colors, shuffle the palette for variety
+        if n and not has_fixed:
+            permutation = np.array(rng.sample(range(num_colors), num_colors), dtype=np.int8)
+            result.coloring = permutation[result.coloring]
+
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+def _fixed_consistent(graph, fixed, num_colors):
+    """True if the pre-assigned colors are in range and no edge joins two of the same color"""
+    fixed = np.asarray(fixed)
+    if np.any(fixed >= num_colors):
+        return False
+    u, v = graph.edge_arrays()
+    return not np.any((fixed[u] >= 0) & (fixed[u] == fixed[v]))
+
+
+# Kempe chains up to this size are tried before any longer one
+KEMPE_SHORT_CHAIN = 64
+
+
+def _kempe_coloring(adj, num_colors, fixed_colors, rng, stats, expired=None):
+    """
+    Greedy smallest-last coloring with Kempe-chain repair.
+
+    Args:
+        expired: Optional callable polled every 256 nodes (while ordering
+            and while coloring); give up once it returns True
+
+    Returns:
+        list: The colors, or None if some node could not be colored in time
+    """
+    n = len(adj)
+    colors = list(fixed_colors)
+
+    # Smallest-last order: repeatedly remove a free node of minimum degree
+    degree = [len(a) for a in adj]
+    removed = [c >= 0 for c in colors]
+    heap = [(degree[v], rng.random(), v) for v in range(n) if not removed[v]]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        d, _, v = heapq.heappop(heap)
+        if removed[v] or d != degree[v]:
+            continue
+        removed[v] = True
+        order.append(v)
+        if expired is not None and len(order) % 256 == 0 and expired():
+            return None
+        for u in adj[v]:
+            if not removed[u]:
+                degree[u] -= 1
+                heapq.heappush(heap, (degree[u], rng.random(), u))
+
+    for i, v in enumerate(reversed(order)):
+        if expired is not None and i % 256 == 255 and expired():
+            return None
+        stats[0] += 1
+        taken = 0
+        for u in adj[v]:
+            if colors[u] >= 0:
+                taken |= 1 << colors[u]
+        free = [c for c in range(num_colors) if not taken >> c & 1]
+        if free:
+            if len(free) == 1:
+                stats[2] += 1
+            colors[v] = rng.choice(free)
+            continue
+
+        # Every color is taken: free color a by swapping a <-> b on the
+        # chains through v's a-colored neighbors, if none of them reaches a
+        # b-colored neighbor (or a pre-assigned node). Short chains are
+        # tried first; on large maps a chain can span most of the map
+        if not any(_kempe_swap(adj, colors, fixed_colors, v, a, b, limit)
+                   for limit in (KEMPE_SHORT_CHAIN, None)
+                   for a in range(num_colors) for b in range(num_colors) if a != b):
+            return None
+
+    return colors
+
+
+def _kempe_swap(adj, colors, fixed_colors, v, a, b, limit=None):
+    """
+    Swap colors a and b on the a/b chains around v and color v with a.
+
+    Returns False, changing nothing, if that can't free a or the chains
+    have more than limit nodes.
+    """
+    blocked = {u for u in adj[v] if colors[u] == b}
+    chain = {u for u in adj[v] if colors[u] == a}
+    stack = list(chain)
+    while stack:
+        x = stack.pop()
+        if x in blocked or fixed_colors[x] >= 0:
+            return False
+        for y in adj[x]:
+            if y not in chain and (colors[y] == a or colors[y] == b):
+                chain.add(y)
+                stack.append(y)
+        if limit is not None and len(chain) > limit:
+            return False
+
+    for x in chain:
+        colors[x] = b if colors[x] == a else a
+    colors[v] = a
+    return True
+
+
+def _peel(adj, fixed_colors, num_colors):
+    """
+    Repeatedly remove free nodes with fewer than num_colors remaining neighbors.
+
+    Returns:
+        list: The removed nodes in removal order
+    """
+    degree = [len(a) for a in adj]
+    removed = [False] * len(adj)
+    queue = [v for v in range(len(adj)) if fixed_colors[v] < 0 and degree[v] < num_colors]
+    peeled = []
+    while queue:
+        v = queue.pop()
+        if removed[v]:
+            continue
+        removed[v] = True
+        peeled.append(v)
+        for u in adj[v]:
+            degree[u] -= 1
+            if not removed[u] and fixed_colors[u] < 0 and degree[u] == num_colors - 1:
+                queue.append(u)
+    return peeled
+
+
+def _luby(i):
+    """The i-th term (1-based) of the Luby restart sequence 1, 1, 2, 1, 1, 2, 4, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while True:
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+
+
+def _search(adj, num_colors, fixed_colors, peeled, node_limit, expired, rng, stats):
+    """
+    One backjumping DSATUR run.
+
+    Returns:
+        tuple: (status, colors list); UNKNOWN when node_limit is hit or expired() returns True
+    """
+    n = len(adj)
+    full = (1 << num_colors) - 1
+
+    # Color -1 is free, -2 marks peeled nodes the search leaves alone
+    colors = [-1] * n
+    for v in peeled:
+        colors[v] = -2
+    degree = [sum(1 for u in a if colors[u] != -2) for a in adj]
+
+    domains = [full] * n
+    used = [0] * num_colors
+    colored = [0] * n   # Colored neighbors of each node
+    pruners = [0] * n   # Bitmask of search depths that pruned each node's domain
+    trail = []          # (node, bit, depth bit) prunings, undone on backtrack
+    nodes = 0
+
+    # Random tie-breaking gives different solutions from run to run
+    ties = [rng.random() for _ in range(n)]
+    heap = []
+
+    def key(u):
+        return (_popcount(domains[u]), -colored[u], -degree[u], ties[u], u)
+
+    def assign(v, c, depth):
+        """Color v with c and prune c from its neighbors; returns a wiped-out node or -1"""
+        colors[v] = c
+        used[c] += 1
+        bit = 1 << c
+        depth_bit = 1 << depth if depth >= 0 else 0
+        wiped = -1
+        for u in adj[v]:
+            if colors[u] == -1:
+                colored[u] += 1
+                if domains[u] & bit:
+                    domains[u] ^= bit
+                    pruners[u] |= depth_bit
+                    trail.append((u, bit, depth_bit))
+                    if domains[u] == 0 and wiped < 0:
+                        wiped = u
+                heapq.heappush(heap, key(u))
+        return wiped
+
+    def undo(v, mark):
+        """Uncolor v and restore every domain pruned since mark"""
+        while len(trail) > mark:
+            u, bit, depth_bit = trail.pop()
+            domains[u] |= bit
+            pruners[u] &= ~depth_bit
+        used[colors[v]] -= 1
+        colors[v] = -1
+        for u in adj[v]:
+            if colors[u] == -1:
+                colored[u] -= 1
+                heapq.heappush(heap, key(u))
+        heapq.heappush(heap, key(v))
+
+    # Apply pre-assigned colors first; a conflict among them can't be fixed
+    for v, c in enumerate(fixed_colors):
+        if c >= 0:
+            if c >= num_colors or not domains[v] & (1 << c) or assign(v, c, -1) >= 0:
+                return UNCOLORABLE, None
+    trail.clear()
+
+    # The fixed colors above already pushed some entries, so count separately
+    free = [v for v in range(n) if colors[v] == -1]
+    heap.extend(key(v) for v in free)
+    heapq.heapify(heap)
+    remaining = len(free)
+
+    def select():
+        """Pop the most constrained uncolored node (skipping stale heap entries)"""
+        while heap:
+            entry = heapq.heappop(heap)
+            v = entry[-1]
+            if colors[v] == -1 and entry == key(v):
+                return v
+        return -1
+
+    # Frame at depth d: [node, colors left to try, trail mark, conflict depths]
+    stack = []
+    status = COLORABLE
+    while remaining:
+        v = select()
+        domain = domains[v]
+        if domain & (domain - 1) == 0:
+            stats[2] += 1
+
+        # Unused colors are interchangeable: keep only the lowest unused one
+        used_mask = sum(1 << c for c in range(num_colors) if used[c])
+        unused = domain & ~used_mask
+        stack.append([v, (domain & used_mask) | (unused & -unused), len(trail), pruners[v]])
+        remaining -= 1
+
+        # Find the next consistent assignment, backjumping as needed
+        while True:
+            depth = len(stack) - 1
+            frame = stack[depth]
+            v, choices, mark, conflicts = frame
+            if colors[v] >= 0:
+                undo(v, mark)
+
+            if not choices:
+                # Jump back to the deepest assignment involved in this dead end
+                if not conflicts:
+                    status = UNCOLORABLE
+                    break
+                target = conflicts.bit_length() - 1
+                while len(stack) - 1 > target:
+                    popped = stack.pop()
+                    if colors[popped[0]] >= 0:
+                        undo(popped[0], popped[2])
+                    remaining += 1
+                stack[target][3] |= conflicts & ~(1 << target)
+                stats[1] += 1
+                continue
+
+            if nodes >= node_limit or (nodes % 256 == 0 and expired()):
+                status = UNKNOWN
+                break
+            nodes += 1
+            stats[0] += 1
+
+            bit = _least_constraining(v, choices, adj, colors, domains)
+            frame[1] = choices ^ bit
+            wiped = assign(v, bit.bit_length() - 1, depth)
+            if wiped < 0:
+                break
+            # The wiped-out node's other pruners share the blame
+            frame[3] |= pruners[wiped] & ~(1 << depth)
+
+        if status != COLORABLE:
+            return status, None
+
+    return COLORABLE, colors
+
+
+def _least_constraining(v, choices, adj, colors, domains):
+    """The color in choices that appears in the fewest uncolored neighbor domains"""
+    best_bit, best_count = 0, None
+    while choices:
+        bit = choices & -choices
+        choices ^= bit
+        count = 0
+        for u in adj[v]:
+            if colors[u] == -1 and domains[u] & bit:
+                count += 1
+        if best_count is None or count < best_count:
+            best_bit, best_count = bit, count
+    return best_bit
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid over node positions for bounding-box queries.
+
+    Nodes are sorted by grid cell, so each cell is a contiguous slice of
+    order (CSR layout, like CompactGraph), and so is each row of cells.
+    A query touches one slice per grid row in the box plus the nodes it
+    returns.
+    """
+
+    __slots__ = ('positions', 'origin', 'cell_size', 'cols', 'rows', 'order', 'cell_start')
+
+    def __init__(self, positions, points_per_cell=16):
+        """
+        Args:
+            positions: (n, 2) array of node positions
+            points_per_cell: Average number of nodes per cell
+        """
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        n = len(self.positions)
+        lo = self.positions.min(axis=0) if n else np.zeros(2)
+        span = np.maximum(self.positions.max(axis=0) - lo, 1e-9) if n else np.ones(2)
+
+        self.origin = lo
+        self.cell_size = max(float(np.sqrt(span[0] * span[1] * points_per_cell / max(n, 1))), 1e-9)
+        self.cols = int(span[0] // self.cell_size) + 1
+        self.rows = int(span[1] // self.cell_size) + 1
+
+        cells = self._cell_ids(self.positions)
+        self.order = np.argsort(cells, kind='stable').astype(np.int32)
+        self.cell_start = np.zeros(self.cols * self.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.cols * self.rows), out=self.cell_start[1:])
+
+    def _cell_ids(self, points):
+        col = np.clip(((points[:, 0] - self.origin[0]) // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        row = np.clip(((points[:, 1] - self.origin[1]) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return row * self.cols + col
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """
+        Nodes inside a bounding box (borders included).
+
+        Returns:
+            numpy.ndarray: Sorted node IDs
+        """
+        if xmin > xmax or ymin > ymax or not len(self.positions):
+            return np.zeros(0, dtype=np.int32)
+
+        col0, row0 = self._clamped_cell(xmin, ymin)
+        col1, row1 = self._clamped_cell(xmax, ymax)
+        candidates = np.concatenate([
+            self.order[self.cell_start[row * self.cols + col0]:self.cell_start[row * self.cols + col1 + 1]]
+            for row in range(row0, row1 + 1)
+        ])
+
+        points = self.positions[candidates]
+        inside = ((points[:, 0] >= xmin) & (points[:, 0] <= xmax) &
+                  (points[:, 1] >= ymin) & (points[:, 1] <= ymax))
+        return np.sort(candidates[inside])
+
+    def _clamped_cell(self, x, y):
+        col = int(min(max((x - self.origin[0]) // self.cell_size, 0), self.cols - 1))
+        row = int(min(max((y - self.origin[1]) // self.cell_size, 0), self.rows - 1))
+        return col, row
@@ -0,0 +1,230 @@
+import atexit
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Entries kept per difficulty leaderboard
+LEADERBOARD_SIZE = 100
+
+
+class GameStats:
+    """
+    Finished-game results with cached per-difficulty leaderboards.
+
+    record() only appends to an in-memory buffer and updates the cached
+    leaderboard, so the move that finishes a game never waits on the
+    database. A background thread writes the buffer to SQLite in one
+    transaction every flush_interval seconds (or as soon as batch_size
+    results are waiting). When that wrote rows, or another worker process
+    has written since the last look, it reloads each leaderboard's top
+    entries so results recorded elsewhere show up too; an idle interval
+    costs one PRAGMA, not a scan of the table.
+
+    Each leaderboard is a min-heap of the best LEADERBOARD_SIZE results:
+    a new result replaces the root only if it ranks higher, so keeping the
+    top K costs O(log K) per game. Reads use a sorted copy that is rebuilt
+    only after the heap changes.
+    """
+
+    def __init__(self, path=None, flush_interval=2.0, batch_size=256, size=LEADERBOARD_SIZE):
+        """
+        Args:
+            path: SQLite database file, or None to keep results in memory only
+            flush_interval: Seconds between writes of the buffer
+            batch_size: Write early once this many results are buffered
+            size: Entries kept per leaderboard
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.size = size
+        self._buffer = []
+        self._heaps = {}
+        self._sorted = {}
+        self._totals = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._conn = None
+        self._data_version = None
+
+        if path:
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id INTEGER PRIMARY KEY, difficulty TEXT NOT NULL, score INTEGER NOT NULL, "
+                "moves INTEGER NOT NULL, hints INTEGER NOT NULL, time INTEGER NOT NULL, "
+                "date TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_rank ON results (difficulty, score DESC, time)")
+            self._reload()
+
+    def record(self, difficulty, moves, hints, time_seconds, score, date):
+        """
+        Add a finished game. Never touches the database.
+
+        Returns:
+            dict: The result as stored
+        """
+        result = {'difficulty': difficulty, 'score': int(score), 'moves': int(moves),
+                  'hints': int(hints), 'time': int(time_seconds), 'date': date}
+
+        with self._lock:
+            self._count(result)
+            self._offer(result)
+            if self.path:
+                self._buffer.append(result)
+                if len(self._buffer) >= self.batch_size:
+                    self._wakeup.set()
+
+        if self.path:
+            self._ensure_started()
+        return result
+
+    def leaderboard(self, difficulty, limit=None):
+        """The best results for a difficulty, highest score (then fastest) first"""
+        with self._lock:
+            entries = self._sorted.get(difficulty)
+            if entries is None:
+                heap = self._heaps.get(difficulty, [])
+                entries = [entry[-1] for entry in sorted(heap, reverse=True)]
+                self._sorted[difficulty] = entries
+        if self.path:
+            self._ensure_started()
+        return entries[:limit] if limit is not None else list(entries)
+
+    def summary(self):
+        """Games played, mean score and mean time per difficulty"""
+        with self._lock:
+            return {
+                difficulty: {'games': games, 'mean_score': total_score / games,
+                             'mean_time': total_time / games}
+                for difficulty, (games, total_score, total_time) in self._totals.items() if games
+            }
+
+    def flush(self):
+        """Write buffered results to the database now; returns how many were written"""
+        if not self.path:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO results (difficulty, score, moves, hints, time, date) "
+                        "VALUES (:difficulty, :score, :moves, :hints, :time, :date)",
+                        batch
+                    )
+            except sqlite3.Error:
+                # Keep the results for the next attempt
+                with self._lock:
+                    self._buffer[:0] = batch
+                raise
+            return len(batch)
+
+    def _count(self, result):
+        """Add a result to its difficulty's totals (lock held)"""
+        totals = self._totals.setdefault(result['difficulty'], [0, 0, 0])
+        totals[0] += 1
+        totals[1] += result['score']
+        totals[2] += result['time']
+
+    def _offer(self, result):
+        """Put a result on its leaderboard if it ranks in the top entries (lock held)"""
+        heap = self._heaps.setdefault(result['difficulty'], [])
+        # Higher score ranks first, then shorter time, then the earlier result
+        entry = (result['score'], -result['time'], -next(self._order), result)
+        if len(heap) < self.size:
+            heapq.heappush(heap, entry)
+        elif entry[:3] > heap[0][:3]:
+            heapq.heapreplace(heap, entry)
+        else:
+            return
+        self._sorted.pop(result['difficulty'], None)
+
+    def _reload(self):
+        """Rebuild the leaderboards and totals from the database plus unflushed results"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT difficulty, score, moves, hints, time, date FROM ("
+            "SELECT *, ROW_NUMBER() OVER (PARTITION BY difficulty ORDER BY score DESC, time, id) AS rank "
+            "FROM results) WHERE rank <= ?",
+            (self.size,)
+        ).fetchall()
+        totals = conn.execute(
+            "SELECT difficulty, COUNT(*), SUM(score), SUM(time) FROM results GROUP BY difficulty"
+        ).fetchall()
+
+        with self._lock:
+            self._heaps = {}
+            self._sorted = {}
+            self._totals = {difficulty: [games, total_score, total_time]
+                            for difficulty, games, total_score, total_time in totals}
+            for difficulty, score, moves, hints, time_seconds, date in rows:
+                self._offer({'difficulty': difficulty, 'score': score, 'moves': moves,
+                             'hints': hints, 'time': time_seconds, 'date': date})
+            for result in self._buffer:
+                self._count(result)
+                self._offer(result)
+
+    def _changed_elsewhere(self):
+        """Whether another connection has committed to the database since the last check"""
+        # data_version moves only on other connections' commits, not our own
+        version = self._connect().execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def _connect(self):
+        """The connection for this process (only the flush thread and startup use it)"""
+        if self._conn is None or self._conn[0] != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = (os.getpid(), conn)
+            self._data_version = None
+        return self._conn[1]
+
+    def _ensure_started(self):
+        """Start the flush thread once per process (gunicorn forks after import)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='stats-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                wrote = self.flush()
+                if self._changed_elsewhere() or wrote:
+                    self._reload()
+            except sqlite3.Error:
+                time.sleep(self.flush_interval)
+
+
+def create_game_stats():
+    """
+    Create the stats recorder from the environment.
+
+    STATS_DB names the SQLite file results are written to ("" = memory
+    only) and STATS_FLUSH_INTERVAL the seconds between writes.
+    """
+    path = os.environ.get('STATS_DB', 'stats.db')
+    return GameStats(path or None, flush_interval=float(os.environ.get('STATS_FLUSH_INTERVAL', 2.0)))
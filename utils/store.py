@@ -0,0 +1,166 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.game_state import GameState
+
+
+class GameStore:
+    """Base class for server-side game storage keyed by a short game ID"""
+
+    def new_id(self):
+        """Generate a short, URL-safe game ID"""
+        return secrets.token_urlsafe(12)
+
+    def get(self, game_id):
+        """Return the stored GameState or None if missing/expired"""
+        raise NotImplementedError
+
+    def put(self, game_id, game_state):
+        """Store (or replace) the game state for a game ID"""
+        raise NotImplementedError
+
+    def delete(self, game_id):
+        """Remove a game from the store"""
+        raise NotImplementedError
+
+
+class MemoryGameStore(GameStore):
+    """
+    In-process LRU store with TTL eviction.
+
+    Game states are kept as live objects, so loading a game is a dictionary
+    lookup. Only usable when every request for a game hits the same process.
+    """
+
+    def __init__(self, max_games=10000, ttl=3600):
+        self.max_games = max_games
+        self.ttl = ttl
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, game_id):
+        if not game_id:
+            return None
+
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                return None
+
+            game_state, expires = entry
+            if expires < time.monotonic():
+                del self._games[game_id]
+                return None
+
+            # Refresh position and expiry on access
+            self._games.move_to_end(game_id)
+            self._games[game_id] = (game_state, time.monotonic() + self.ttl)
+            return game_state
+
+    def put(self, game_id, game_state):
+        with self._lock:
+            self._games[game_id] = (game_state, time.monotonic() + self.ttl)
+            self._games.move_to_end(game_id)
+            self._evict()
+
+    def delete(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def _evict(self):
+        """Drop expired games, then the least recently used ones over capacity"""
+        now = time.monotonic()
+
+        # Entries are in access order, so expired ones sit at the front
+        while self._games:
+            oldest_id, (_, expires) = next(iter(self._games.items()))
+            if expires >= now and len(self._games) <= self.max_games:
+                break
+            del self._games[oldest_id]
+
+
+class SQLiteGameStore(GameStore):
+    """
+    SQLite-backed store that can be shared by several worker processes.
+
+    Game states are stored in the binary format of GameState.to_bytes()
+    (rows written as JSON by older versions still load). Each thread gets its
+    own connection (per process too, so a store created before gunicorn forks
+    doesn't share its connection with the workers), and the database runs
+    in WAL mode so readers don't block the writer.
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS games_expires ON games (expires)")
+        conn.commit()
+
+    def _connect(self):
+        conn, pid = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def get(self, game_id):
+        if not game_id:
+            return None
+
+        row = self._connect().execute(
+            "SELECT data FROM games WHERE id = ? AND expires >= ?",
+            (game_id, time.time())
+        ).fetchone()
+
+        if row is None:
+            return None
+        if isinstance(row[0], str):
+            return GameState.from_json(row[0])
+        return GameState.from_bytes(row[0])
+
+    def put(self, game_id, game_state):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO games (id, data, expires) VALUES (?, ?, ?)",
+            (game_id, game_state.to_bytes(), now + self.ttl)
+        )
+
+        # Occasionally purge expired games so the table doesn't grow forever
+        if secrets.randbelow(100) == 0:
+            conn.execute("DELETE FROM games WHERE expires < ?", (now,))
+
+    def delete(self, game_id):
+        self._connect().execute("DELETE FROM games WHERE id = ?", (game_id,))
+
+
+def create_store(url=None):
+    """
+    Create a game store from a URL.
+
+    Args:
+        url: "memory" (default) or "sqlite:///path/to/games.db"
+
+    Returns:
+        GameStore: The configured store
+    """
+    url = url or os.environ.get('GAME_STORE', 'memory')
+    ttl = int(os.environ.get('GAME_STORE_TTL', 3600))
+
+    if url.startswith('sqlite:///'):
+        return SQLiteGameStore(url[len('sqlite:///'):], ttl=ttl)
+
+    return MemoryGameStore(max_games=int(os.environ.get('GAME_STORE_MAX_GAMES', 10000)), ttl=ttl)